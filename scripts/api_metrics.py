@@ -0,0 +1,195 @@
+"""
+Per-Operation AWS API Metrics
+-----------------------------
+Opt-in instrumentation (`--metrics`) that shows where a check spends its API
+time. Like the response cache, it hooks into botocore's event system and is
+attached by `aws_clients.get_client` to every client created once `enable()`
+has been called.
+
+Per (service, operation, region) it records:
+- calls, errors, throttles, retries (botocore's own) and cache hits;
+- a latency histogram (seconds, including botocore retries);
+- request and response payload bytes.
+
+`write()` saves `<check>.json` and a Prometheus textfile-collector file
+`<check>.prom` into the metrics directory; `enable()` registers it to run at
+process exit. The hot path is one dict lookup and a few additions under a lock.
+"""
+import atexit
+import bisect
+import json
+import logging
+import os
+import sys
+import tempfile
+import threading
+import time
+
+from rate_limiter import THROTTLE_CODES
+
+DEFAULT_METRICS_DIR = "metrics"
+# Upper bounds (seconds) of the latency histogram buckets; +Inf is implied
+LATENCY_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+COUNTERS = ("calls", "errors", "throttles", "retries", "cache_hits", "request_bytes", "response_bytes")
+
+_lock = threading.Lock()
+_metrics = None
+
+
+def _new_stats():
+    return {
+        **{name: 0 for name in COUNTERS},
+        "latency_buckets": [0] * (len(LATENCY_BUCKETS) + 1),
+        "latency_sum": 0.0,
+    }
+
+
+class ApiMetrics:
+    """Thread-safe per-(service, operation, region) API call statistics."""
+
+    def __init__(self, job, output_dir=DEFAULT_METRICS_DIR):
+        self.job = job
+        self.output_dir = os.path.abspath(output_dir)
+        self._stats = {}
+        self._lock = threading.Lock()
+
+    def _entry(self, service, operation, region):
+        key = (service, operation, region or "global")
+        entry = self._stats.get(key)
+        if entry is None:
+            entry = self._stats[key] = _new_stats()
+        return entry
+
+    def record(self, service, operation, region, latency=None, **counts):
+        """Add `counts` (e.g. calls=1, response_bytes=512) and one latency sample."""
+        with self._lock:
+            entry = self._entry(service, operation, region)
+            for name, amount in counts.items():
+                entry[name] += amount
+            if latency is not None:
+                entry["latency_buckets"][bisect.bisect_left(LATENCY_BUCKETS, latency)] += 1
+                entry["latency_sum"] += latency
+
+    def attach(self, client):
+        """Register the instrumentation handlers on one client's event system."""
+        service = client.meta.service_model.service_name
+        region = client.meta.region_name
+
+        def start(context, **kwargs):
+            context["api_metrics_start"] = time.perf_counter()
+
+        def sent(request, event_name, **kwargs):
+            # Once per HTTP attempt, so retried requests count every time they are sent
+            body = request.body if isinstance(request.body, (bytes, str)) else b""
+            self.record(service, event_name.rsplit(".", 1)[1], region, request_bytes=len(body))
+
+        def finish(http_response, parsed, model, context, **kwargs):
+            if context.get("response_cache_hit"):
+                self.record(service, model.name, region, calls=1, cache_hits=1)
+                return
+            started = context.get("api_metrics_start")
+            size = http_response.headers.get("content-length")
+            if size is None and not model.has_streaming_output:
+                size = len(http_response.content or b"")
+            self.record(
+                service,
+                model.name,
+                region,
+                latency=(time.perf_counter() - started) if started else None,
+                calls=1,
+                errors=int(http_response.status_code >= 300),
+                retries=parsed.get("ResponseMetadata", {}).get("RetryAttempts", 0),
+                response_bytes=int(size or 0),
+            )
+
+        def attempt(response, operation, **kwargs):
+            # Every throttled attempt, whether botocore retries it or gives up
+            if response and response[1].get("Error", {}).get("Code") in THROTTLE_CODES:
+                self.record(service, operation.name, region, throttles=1)
+
+        client.meta.events.register("before-call", start)
+        client.meta.events.register("before-send", sent)
+        client.meta.events.register("after-call", finish)
+        client.meta.events.register("needs-retry", attempt)
+
+    def snapshot(self):
+        """Return {"service.Operation@region": stats} with plain-data values."""
+        with self._lock:
+            return {
+                f"{service}.{operation}@{region}": {**stats, "latency_buckets": list(stats["latency_buckets"])}
+                for (service, operation, region), stats in sorted(self._stats.items())
+            }
+
+    def prometheus_text(self):
+        """Render the metrics in the Prometheus text exposition format."""
+        with self._lock:
+            items = sorted(self._stats.items())
+        lines = []
+        for name in COUNTERS:
+            metric = f"grc_aws_api_{name}_total"
+            lines += [f"# HELP {metric} AWS API {name.replace('_', ' ')} per operation.", f"# TYPE {metric} counter"]
+            lines += [f"{metric}{{{self._labels(key)}}} {stats[name]}" for key, stats in items]
+        metric = "grc_aws_api_latency_seconds"
+        lines += [f"# HELP {metric} AWS API call latency, including retries.", f"# TYPE {metric} histogram"]
+        for key, stats in items:
+            labels = self._labels(key)
+            cumulative = 0
+            for bound, count in zip(LATENCY_BUCKETS + ("+Inf",), stats["latency_buckets"]):
+                cumulative += count
+                lines.append(f'{metric}_bucket{{{labels},le="{bound}"}} {cumulative}')
+            lines.append(f"{metric}_sum{{{labels}}} {stats['latency_sum']:.6f}")
+            lines.append(f"{metric}_count{{{labels}}} {cumulative}")
+        return "\n".join(lines) + "\n"
+
+    def _labels(self, key):
+        service, operation, region = key
+        return f'check="{self.job}",service="{service}",operation="{operation}",region="{region}"'
+
+
+def _write_atomic(path, text):
+    # The textfile collector may read at any moment; never expose a partial file
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+    with os.fdopen(fd, "w") as fh:
+        fh.write(text)
+    os.replace(tmp_path, path)
+
+
+def enable(output_dir=DEFAULT_METRICS_DIR, job=None):
+    """Turn instrumentation on for clients created from now on; metrics are written at exit."""
+    global _metrics
+    with _lock:
+        if _metrics is None:
+            job = job or os.path.splitext(os.path.basename(sys.argv[0]))[0] or "checks"
+            _metrics = ApiMetrics(job, output_dir)
+            atexit.register(write)
+            logging.info(f"AWS API metrics enabled: {_metrics.output_dir}")
+        return _metrics
+
+
+def disable():
+    global _metrics
+    with _lock:
+        _metrics = None
+        atexit.unregister(write)
+
+
+def get_metrics():
+    """Return the active metrics, or None when instrumentation is off."""
+    return _metrics
+
+
+def write():
+    """Write `<job>.json` and `<job>.prom` into the metrics directory; return their paths."""
+    metrics = _metrics
+    if metrics is None:
+        return None
+    os.makedirs(metrics.output_dir, exist_ok=True)
+    base = os.path.join(metrics.output_dir, metrics.job)
+    _write_atomic(f"{base}.json", json.dumps({
+        "check": metrics.job,
+        "latency_buckets": list(LATENCY_BUCKETS),
+        "operations": metrics.snapshot(),
+    }, indent=2))
+    _write_atomic(f"{base}.prom", metrics.prometheus_text())
+    logging.info(f"API metrics saved: {base}.json, {base}.prom")
+    return f"{base}.json", f"{base}.prom"
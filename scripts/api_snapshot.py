@@ -0,0 +1,209 @@
+"""
+API Snapshots: Record and Replay
+--------------------------------
+`--record FILE` captures every AWS API response the checks receive into one
+compressed snapshot; `--replay FILE` runs the same checks from it, offline and
+without credentials, so control logic and report layout can be iterated on
+without calling AWS (and large recorded estates double as benchmark inputs).
+
+Like the response cache, snapshots hook into botocore's event system and are
+attached by `aws_clients.get_client` to every client, so the check logic is
+unchanged:
+
+- `before-parameter-build` computes the call key
+  (session, region, service, operation, params);
+- recording: `after-call` appends the parsed response (errors included, with
+  their HTTP status) to the key's response list;
+- replay: `before-call` returns the next recorded response for the key, which
+  skips the HTTP request (error responses raise the same `ClientError`). A call
+  that was never recorded raises `SnapshotMiss`.
+
+Repeated identical calls (credential report polling) replay in recorded
+order; the last response repeats once the list is used up. Time-window
+parameters are masked in the key, so a snapshot replays on another day: any
+datetime, and every value under a field named in `TIME_FIELDS` (such as the
+epoch milliseconds of GuardDuty's `updatedAt` criterion). Other numbers are
+kept, however large. Sessions are keyed by role (assumed roles) or "default",
+never by access key, so snapshots replay on another machine.
+
+The file is LZMA-compressed JSON; datetimes and bytes are stored as tagged
+objects (`{"$datetime": ISO 8601}`, `{"$bytes": base64}`), as in the shard
+partials. Loading a snapshot only parses data, so a snapshot from elsewhere
+cannot run code. Recording writes it at exit (or on `save()`).
+"""
+import atexit
+import base64
+import json
+import logging
+import lzma
+import os
+import tempfile
+import threading
+from datetime import date, datetime, timezone
+
+from botocore.awsrequest import AWSResponse
+
+from rate_limiter import without_retry_attempts
+
+FORMAT_VERSION = 2
+# Request fields holding a time window; their values are masked in call keys
+TIME_FIELDS = {"updatedAt", "createdAt", "StartTime", "EndTime", "StartDate", "EndDate"}
+
+_lock = threading.Lock()
+_snapshot = None
+
+
+class SnapshotMiss(LookupError):
+    """Replay found no recorded response for a call."""
+
+
+def _mask_times(value, masked=False):
+    """`value` with datetimes, and every scalar under a TIME_FIELDS key, replaced by "<time>"."""
+    if isinstance(value, dict):
+        return {key: _mask_times(item, masked or key in TIME_FIELDS) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_mask_times(item, masked) for item in value]
+    if masked or isinstance(value, (datetime, date)):
+        return "<time>"
+    return value
+
+
+def _encode(value):
+    if isinstance(value, datetime):
+        return {"$datetime": value.isoformat()}
+    if isinstance(value, bytes):
+        return {"$bytes": base64.b64encode(value).decode("ascii")}
+    raise TypeError(f"cannot store {type(value).__name__} in an API snapshot")
+
+
+def _decode(value):
+    if set(value) == {"$datetime"}:
+        return datetime.fromisoformat(value["$datetime"])
+    if set(value) == {"$bytes"}:
+        return base64.b64decode(value["$bytes"])
+    return value
+
+
+def call_key(scope, region, service, operation, params):
+    """Stable text key of one API call."""
+    return json.dumps([scope, region, service, operation, _mask_times(params)], sort_keys=True, default=str)
+
+
+class Snapshot:
+    """Recorded API responses: {call key: [(HTTP status, parsed response), ...]}."""
+
+    def __init__(self, path, mode, calls=None, default_region=None):
+        self.path = path
+        self.mode = mode  # "record" or "replay"
+        self.calls = calls if calls is not None else {}
+        self.default_region = default_region
+        self.replayed = 0
+        self._positions = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def load(cls, path):
+        with lzma.open(path, "rt", encoding="utf-8") as fh:
+            data = json.load(fh, object_hook=_decode)
+        if data.get("version") != FORMAT_VERSION:
+            raise ValueError(f"{path}: unsupported snapshot version {data.get('version')!r}")
+        return cls(path, "replay", data["calls"], data.get("default_region"))
+
+    def save(self):
+        """Write the snapshot atomically; return its path."""
+        with self._lock:
+            data = {
+                "version": FORMAT_VERSION,
+                "recorded_at": datetime.now(timezone.utc).isoformat(),
+                "default_region": self.default_region,
+                "calls": {key: list(responses) for key, responses in self.calls.items()},
+            }
+        directory = os.path.dirname(os.path.abspath(self.path))
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        with os.fdopen(fd, "wb") as raw, lzma.open(raw, "wt", encoding="utf-8", preset=6) as fh:
+            json.dump(data, fh, default=_encode, separators=(",", ":"))
+        os.replace(tmp_path, self.path)
+        responses = sum(len(responses) for responses in data["calls"].values())
+        logging.info(f"API snapshot saved: {self.path} ({responses} responses, {os.path.getsize(self.path)} bytes)")
+        return self.path
+
+    def record(self, key, status_code, parsed):
+        with self._lock:
+            self.calls.setdefault(key, []).append((status_code, parsed))
+
+    def next_response(self, key):
+        """The next recorded (status, parsed) for `key`; the last one repeats."""
+        with self._lock:
+            responses = self.calls.get(key)
+            if not responses:
+                raise SnapshotMiss(f"no recorded response in {self.path} for {key}")
+            position = self._positions.get(key, 0)
+            self._positions[key] = position + 1
+            self.replayed += 1
+            return responses[min(position, len(responses) - 1)]
+
+    def attach(self, client, scope, default_region=None):
+        """Register the record or replay handlers on one client's event system."""
+        service = client.meta.service_model.service_name
+        region = client.meta.region_name
+        if self.mode == "record" and default_region and self.default_region is None:
+            self.default_region = default_region
+
+        def build_key(params, model, context, **kwargs):
+            context["api_snapshot"] = call_key(scope, region, service, model.name, params)
+
+        def replay(context, **kwargs):
+            status_code, parsed = self.next_response(context["api_snapshot"])
+            return AWSResponse(url="", status_code=status_code, headers={}, raw=None), without_retry_attempts(parsed)
+
+        def record(http_response, parsed, context, **kwargs):
+            key = context.get("api_snapshot")
+            if key is not None:
+                self.record(key, http_response.status_code, parsed)
+
+        client.meta.events.register("before-parameter-build", build_key)
+        if self.mode == "replay":
+            client.meta.events.register_first("before-call", replay)
+        else:
+            client.meta.events.register("after-call", record)
+
+
+def enable_record(path):
+    """Record every API response of clients created from now on into `path` (written at exit)."""
+    global _snapshot
+    with _lock:
+        if _snapshot is None:
+            _snapshot = Snapshot(path, "record")
+            atexit.register(save)
+            logging.info(f"Recording API responses to {path}")
+        return _snapshot
+
+
+def enable_replay(path):
+    """Serve every API call of clients created from now on from the snapshot at `path`."""
+    global _snapshot
+    with _lock:
+        if _snapshot is None:
+            _snapshot = Snapshot.load(path)
+            logging.info(f"Replaying API responses from {path} (no AWS calls are made)")
+        return _snapshot
+
+
+def disable():
+    global _snapshot
+    with _lock:
+        _snapshot = None
+        atexit.unregister(save)
+
+
+def get_snapshot():
+    """Return the active snapshot, or None when neither recording nor replaying."""
+    return _snapshot
+
+
+def save():
+    """Write the snapshot being recorded (no-op when not recording); return its path."""
+    snapshot = _snapshot
+    if snapshot is None or snapshot.mode != "record":
+        return None
+    return snapshot.save()
@@ -0,0 +1,227 @@
+"""
+Shared boto3 Client Factory
+---------------------------
+Every check gets its AWS clients from here instead of calling `boto3.client`
+directly. Creating a client re-resolves endpoints and loads the service model
+(tens of milliseconds and several MB each), so clients are built once and
+cached per (service, region, session). Sessions are keyed by a stable identity
+("default", or the role of an assumed-role session), never by access key:
+instance-role and SSO credentials rotate, and a long-running process must not
+build new clients (and call STS again) after every rotation.
+
+- Clients use adaptive retry mode, which rate-limits the client side when AWS
+  starts throttling instead of only sleeping between retries.
+- Calls made through `rate_limiter.call` go to the client's scheduled twin
+  (`scheduled_client`): same session, region and pool, but no botocore
+  retries. The scheduler retries those calls itself, so the two retry layers
+  never stack and the scheduler sees every throttle as it happens.
+- `max_pool_connections` should match the number of threads sharing a client;
+  asking for a bigger pool than the cached client has rebuilds it once.
+- When the response cache is enabled (`response_cache.enable`), it is attached
+  to each new client, keyed by the account behind the client's credentials.
+  The same goes for API metrics (`api_metrics.enable`) and for recording or
+  replaying API snapshots (`api_snapshot`), which is attached first so a
+  replay never reaches the network.
+- Client creation on a boto3 Session is not thread-safe, so it happens under a
+  lock. The clients themselves are safe to share between threads. The STS
+  call behind `get_account_id` is made outside the lock, so a slow STS
+  endpoint does not block other threads creating clients.
+- Other accounts: `assume_role_session` returns a cached session whose
+  credentials come from STS AssumeRole and refresh themselves before they
+  expire. Inside `use_session(...)` every `get_client` call without an
+  explicit session uses it (the choice is context-local, so concurrent threads
+  can work in different accounts).
+"""
+import contextvars
+import threading
+from contextlib import contextmanager
+
+import boto3
+import botocore.session
+from botocore.config import Config
+from botocore.credentials import AssumeRoleCredentialFetcher, DeferredRefreshableCredentials
+
+import api_metrics
+import api_snapshot
+import rate_limiter
+import response_cache
+
+DEFAULT_MAX_POOL_CONNECTIONS = 10
+RETRY_CONFIG = {"mode": "adaptive", "max_attempts": 10}
+# Clients used by the rate_limiter scheduler: one attempt, the scheduler owns the retries
+SCHEDULED_RETRY_CONFIG = {"mode": "standard", "total_max_attempts": 1}
+
+_lock = threading.RLock()
+_default_session = None
+_clients = {}
+# id(client) -> (service, region, session, pool size, scheduled) of every cached client
+_client_origins = {}
+_account_ids = {}
+# Assumed-role sessions by role ARN, and the stable cache key of each one
+_assumed_sessions = {}
+_session_keys = {}
+_current_session = contextvars.ContextVar("aws_session", default=None)
+
+
+def get_session():
+    """Return the session selected by `use_session`, else the process-wide default."""
+    global _default_session
+    current = _current_session.get()
+    if current is not None:
+        return current
+    with _lock:
+        if _default_session is None:
+            snapshot = api_snapshot.get_snapshot()
+            if snapshot is not None and snapshot.mode == "replay":
+                # Replayed calls are never signed: static credentials skip the provider chain
+                # (no instance-metadata lookups), and the recorded region keeps call keys identical
+                _default_session = boto3.session.Session(
+                    aws_access_key_id="replay", aws_secret_access_key="replay", region_name=snapshot.default_region
+                )
+            else:
+                _default_session = boto3.session.Session()
+            _session_keys[id(_default_session)] = "default"
+        return _default_session
+
+
+def _credentials_key(session):
+    # Default and assumed-role credentials rotate on refresh; those sessions have a stable key.
+    # Other sessions passed in explicitly are keyed by their (static) access key.
+    if id(session) in _session_keys:
+        return _session_keys[id(session)]
+    credentials = session.get_credentials()
+    return credentials.access_key if credentials else None
+
+
+def role_arn(account_id, role):
+    """Build the role ARN for an account from a role name or an ARN template with {account_id}."""
+    if "{account_id}" in role:
+        return role.format(account_id=account_id)
+    if role.startswith("arn:"):
+        return role
+    return f"arn:aws:iam::{account_id}:role/{role}"
+
+
+def assume_role_session(account_id, role, session_name="grc-compliance-scan"):
+    """Return a cached session for `role` in `account_id`, assumed from the default credentials.
+
+    STS is only called when a client first needs credentials, and again shortly
+    before they expire (botocore refreshes them in place).
+    """
+    arn = role_arn(account_id, role)
+    with _lock:
+        if arn in _assumed_sessions:
+            return _assumed_sessions[arn]
+        source = get_session()
+        fetcher = AssumeRoleCredentialFetcher(
+            client_creator=source._session.create_client,
+            source_credentials=source.get_credentials(),
+            role_arn=arn,
+            extra_args={"RoleSessionName": session_name},
+        )
+        core_session = botocore.session.Session()
+        core_session._credentials = DeferredRefreshableCredentials(
+            method="assume-role", refresh_using=fetcher.fetch_credentials
+        )
+        session = boto3.session.Session(botocore_session=core_session, region_name=source.region_name)
+        _assumed_sessions[arn] = session
+        _session_keys[id(session)] = f"assumed:{arn}"
+        _account_ids[f"assumed:{arn}"] = account_id
+        return session
+
+
+@contextmanager
+def use_session(session, account_id=None):
+    """Make `session` the default for `get_client` in the current context.
+
+    `account_id` also scopes the API rate limiters, since AWS limits apply per account.
+    """
+    session_token = _current_session.set(session)
+    scope_token = rate_limiter.scope.set(account_id)
+    try:
+        yield session
+    finally:
+        rate_limiter.scope.reset(scope_token)
+        _current_session.reset(session_token)
+
+
+def get_account_id(session=None):
+    """Return (and memoise per session) the account ID behind a session."""
+    session = session or get_session()
+    with _lock:
+        key = _credentials_key(session)
+        if key in _account_ids:
+            return _account_ids[key]
+    # Outside the lock: concurrent first callers may both ask STS, but nobody waits on it
+    account_id = get_client("sts", session=session).get_caller_identity()["Account"]
+    with _lock:
+        return _account_ids.setdefault(key, account_id)
+
+
+def get_client(
+    service, region_name=None, session=None, max_pool_connections=DEFAULT_MAX_POOL_CONNECTIONS, scheduled=False
+):
+    """Return a cached client for `service` in `region_name`.
+
+    Args:
+        service (str): boto3 service name, e.g. "ec2".
+        region_name (str): AWS region; defaults to the session's region.
+        session (boto3.session.Session): Credentials to use; defaults to the
+            shared default session.
+        max_pool_connections (int): HTTP connections the client may keep open,
+            normally the number of worker threads that will use it.
+        scheduled (bool): Return the client without botocore retries that
+            `rate_limiter.call` uses (see `scheduled_client`).
+    """
+    session = session or get_session()
+    # Resolved before taking the lock (it may call STS)
+    account_id = get_account_id(session) if response_cache.get_cache() is not None and service != "sts" else None
+    with _lock:
+        region_name = region_name or session.region_name
+        key = (service, region_name, _credentials_key(session), scheduled)
+        cached = _clients.get(key)
+        if cached is not None and cached[1] >= max_pool_connections:
+            return cached[0]
+
+        retries = SCHEDULED_RETRY_CONFIG if scheduled else RETRY_CONFIG
+        # botocore normalises the retries dict in place, so each client gets its own copy
+        config = Config(max_pool_connections=max_pool_connections, retries=dict(retries))
+        client = session.client(service, region_name=region_name, config=config)
+        snapshot = api_snapshot.get_snapshot()
+        if snapshot is not None:
+            # Keyed by role, not by access key, so snapshots replay on other machines
+            snapshot.attach(client, _session_keys.get(id(session), "default"), session.region_name)
+        cache = response_cache.get_cache()
+        if cache is not None and account_id is not None:
+            cache.attach(client, account_id)
+        metrics = api_metrics.get_metrics()
+        if metrics is not None:
+            metrics.attach(client)
+        _clients[key] = (client, max_pool_connections)
+        _client_origins[id(client)] = (service, region_name, session, max_pool_connections, scheduled)
+        return client
+
+
+def scheduled_client(client):
+    """The scheduled twin of a client from `get_client`: same session, region and pool, no botocore retries.
+
+    Clients not created by `get_client` (and twins themselves) are returned unchanged.
+    """
+    with _lock:
+        origin = _client_origins.get(id(client))
+    if origin is None or origin[4]:
+        return client
+    service, region_name, session, max_pool_connections, _ = origin
+    return get_client(service, region_name, session, max_pool_connections, scheduled=True)
+
+
+def clear_client_cache():
+    """Drop all cached clients and sessions (used by tests)."""
+    global _default_session
+    with _lock:
+        _clients.clear()
+        _client_origins.clear()
+        _account_ids.clear()
+        _assumed_sessions.clear()
+        _session_keys.clear()
+        _default_session = None
@@ -0,0 +1,182 @@
+"""
+Shared Command-Line Options
+---------------------------
+Options every check accepts, so `run_all_checks.py` can forward them and the
+scripts stay consistent. Each check calls `apply_common_options(args)` at the
+start of `run()` to switch on the process-wide features they select.
+"""
+import api_metrics
+import api_snapshot
+import evidence_writer
+import history_store
+import multi_account
+import response_cache
+import sharding
+
+
+def add_common_options(parser):
+    """Add the options shared by all checks to an argparse parser."""
+    parser.add_argument(
+        "--no-report",
+        action="store_true",
+        help="Gate-only mode: skip report generation (pandas/openpyxl are never imported) "
+        "and only return the exit code.",
+    )
+    parser.add_argument(
+        "--format",
+        nargs="+",
+        choices=evidence_writer.FORMATS,
+        default=list(evidence_writer.DEFAULT_FORMATS),
+        help="Report format(s), e.g. --format xlsx csv (parquet needs pyarrow). Default: xlsx.",
+    )
+    parser.add_argument(
+        "--regions",
+        nargs="+",
+        metavar="REGION",
+        help="Only scan these regions (EC2, GuardDuty). Default: every enabled region.",
+    )
+    cache = parser.add_argument_group("response cache")
+    cache.add_argument(
+        "--cache",
+        action="store_true",
+        help="Serve slow-changing read-only API calls (regions, users, buckets, detectors, "
+        "Config summaries) from an on-disk TTL cache.",
+    )
+    cache.add_argument(
+        "--refresh",
+        action="store_true",
+        help="With --cache: ignore cached entries and re-fetch (responses are still stored).",
+    )
+    cache.add_argument(
+        "--cache-dir",
+        default=response_cache.DEFAULT_CACHE_DIR,
+        help=f"Cache directory (default: {response_cache.DEFAULT_CACHE_DIR}).",
+    )
+    cache.add_argument(
+        "--cache-ttl",
+        action="append",
+        type=response_cache.parse_ttl_override,
+        metavar="SERVICE.OPERATION=SECONDS",
+        help="Override the TTL of one operation, e.g. iam.ListUsers=300 (repeatable).",
+    )
+    metrics = parser.add_argument_group("API metrics")
+    metrics.add_argument(
+        "--metrics",
+        action="store_true",
+        help="Record per-operation API calls, latency, retries, throttles and payload sizes; "
+        "write <check>.json and <check>.prom (Prometheus textfile) at exit.",
+    )
+    metrics.add_argument(
+        "--metrics-dir",
+        default=api_metrics.DEFAULT_METRICS_DIR,
+        help=f"Directory for the metrics files (default: {api_metrics.DEFAULT_METRICS_DIR}).",
+    )
+    accounts = parser.add_argument_group("multi-account")
+    accounts.add_argument(
+        "--accounts",
+        nargs="+",
+        metavar="ACCOUNT_ID",
+        help="Scan these accounts through an assumed role (ALL: every active account in the "
+        "AWS Organization). Reports gain an account_id column.",
+    )
+    accounts.add_argument(
+        "--role",
+        default=multi_account.DEFAULT_ROLE,
+        help="Role name, or ARN template with {account_id}, to assume in each account "
+        f"(default: {multi_account.DEFAULT_ROLE}).",
+    )
+    accounts.add_argument(
+        "--account-workers",
+        type=int,
+        default=multi_account.DEFAULT_ACCOUNT_WORKERS,
+        help=f"Accounts scanned at the same time (default: {multi_account.DEFAULT_ACCOUNT_WORKERS}).",
+    )
+    snapshots = parser.add_argument_group("API snapshots")
+    snapshot_mode = snapshots.add_mutually_exclusive_group()
+    snapshot_mode.add_argument(
+        "--record",
+        metavar="FILE",
+        help="Capture every API response into one compressed snapshot file (written at exit).",
+    )
+    snapshot_mode.add_argument(
+        "--replay",
+        metavar="FILE",
+        help="Run offline from a snapshot recorded with --record: no AWS calls, no credentials needed.",
+    )
+    shards = parser.add_argument_group("sharding")
+    shards.add_argument(
+        "--shard",
+        type=sharding.parse_shard,
+        metavar="I/N",
+        help="Run shard I of N (regions for EC2/GuardDuty, users for IAM, buckets for S3, rules for "
+        "Config) and write a partial result instead of the report; combine with merge_shards.py.",
+    )
+    shards.add_argument(
+        "--shard-dir",
+        default=sharding.DEFAULT_SHARD_DIR,
+        help=f"Directory for partial results (default: {sharding.DEFAULT_SHARD_DIR}).",
+    )
+    history = parser.add_argument_group("history")
+    history.add_argument(
+        "--history",
+        action="store_true",
+        help="Append this run's violations to the historical compliance store and log what is "
+        "new or resolved since the previous run (query it with history_store.py).",
+    )
+    history.add_argument(
+        "--history-db",
+        default=history_store.DEFAULT_DB,
+        help=f"Store path (default: {history_store.DEFAULT_DB}).",
+    )
+    return parser
+
+
+def apply_common_options(args):
+    """Switch on the process-wide features selected by the common options."""
+    if args.record:
+        api_snapshot.enable_record(args.record)
+    elif args.replay:
+        api_snapshot.enable_replay(args.replay)
+    if args.cache:
+        response_cache.enable(
+            cache_dir=args.cache_dir,
+            ttls=dict(args.cache_ttl or []),
+            refresh=args.refresh,
+        )
+    evidence_writer.configure(args.format)
+    if args.metrics:
+        api_metrics.enable(args.metrics_dir)
+    multi_account.configure(args.accounts, args.role, args.account_workers)
+    sharding.configure(args.shard, args.shard_dir)
+    # A shard only sees part of the estate; merge_shards.py records the merged run instead
+    history_store.configure(args.history_db if args.history and not args.shard else None)
+
+
+def common_argv(args):
+    """Rebuild the common options as argv, for forwarding to individual checks."""
+    argv = []
+    if args.no_report:
+        argv.append("--no-report")
+    if args.regions:
+        argv += ["--regions", *args.regions]
+    if list(args.format) != list(evidence_writer.DEFAULT_FORMATS):
+        argv += ["--format", *args.format]
+    if args.cache:
+        argv += ["--cache", "--cache-dir", args.cache_dir]
+        if args.refresh:
+            argv.append("--refresh")
+        for operation_key, seconds in args.cache_ttl or []:
+            argv += ["--cache-ttl", f"{operation_key}={seconds}"]
+    if args.metrics:
+        argv += ["--metrics", "--metrics-dir", args.metrics_dir]
+    if args.accounts:
+        argv += ["--accounts", *args.accounts, "--role", args.role, "--account-workers", str(args.account_workers)]
+    if args.record:
+        argv += ["--record", args.record]
+    if args.replay:
+        argv += ["--replay", args.replay]
+    if args.shard:
+        argv += ["--shard", "/".join(map(str, args.shard)), "--shard-dir", args.shard_dir]
+    if args.history:
+        argv += ["--history", "--history-db", args.history_db]
+    return argv
@@ -0,0 +1,226 @@
+#!/usr/bin/env python3
+"""
+Compliance Watch Daemon
+-----------------------
+Long-running alternative to scheduling `run_all_checks.py` every few minutes.
+The process stays up, so imports, credentials and the cached clients from
+`aws_clients` (plus the response cache with `--cache`) stay warm between
+runs. Each check is re-evaluated on its own interval (`--interval ec2=300`).
+
+The latest results are served as JSON on a small local HTTP endpoint
+(default http://127.0.0.1:8787):
+
+- `GET /results`: every check's last exit code, timing and schedule, plus the
+  combined exit code (same convention as `run_all_checks.py`);
+- `GET /results/<check>`: one check;
+- `GET /gate`: the same body as `/results`, with an HTTP status for CI gates
+  (200 compliant, 422 violations, 500 check errors, 503 not evaluated yet);
+- `GET /metrics`: Prometheus text of the API metrics (with `--metrics`);
+- `GET /healthz`: liveness.
+
+Shared options (`--no-report`, `--format`, `--cache`, `--accounts`, …) apply to
+every evaluation, as with the runner.
+"""
+import argparse
+import json
+import logging
+import signal
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Configure logging before the checks are imported so their own
+# basicConfig calls become no-ops and every thread logs to one file.
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s - %(threadName)s - %(levelname)s - %(message)s",
+    handlers=[logging.FileHandler("compliance_daemon.log"), logging.StreamHandler()],
+)
+
+import api_metrics  # noqa: E402
+import run_all_checks  # noqa: E402
+from cli_options import add_common_options, apply_common_options, common_argv  # noqa: E402
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8787
+# Seconds between evaluations of each check
+DEFAULT_INTERVALS = {
+    "iam_mfa": 900,
+    "iam_access_keys": 3600,
+    "s3_buckets": 1800,
+    "ec2": 600,
+    "config_rules": 900,
+    "guardduty": 300,
+}
+# HTTP status returned by /gate for each combined exit code
+GATE_STATUS = {0: 200, 1: 500, 2: 422}
+
+
+def _utc(timestamp):
+    return datetime.fromtimestamp(timestamp, timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
+
+
+class ComplianceDaemon:
+    """Re-runs checks on their own intervals and keeps the latest result of each."""
+
+    def __init__(self, intervals, check_argv=None, max_workers=None, run_check=run_all_checks.run_check):
+        self.intervals = dict(intervals)
+        self.check_argv = list(check_argv or [])
+        self._run_check = run_check
+        self._results = {}
+        self._next_run = {name: 0.0 for name in self.intervals}
+        self._running = set()
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._pool = ThreadPoolExecutor(max_workers=max_workers or len(self.intervals))
+        self.started_at = time.time()
+
+    def run_due(self, now=None):
+        """Start every check whose interval has elapsed (and is not still running); return the futures."""
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            due = [name for name, at in self._next_run.items() if at <= now and name not in self._running]
+            self._running.update(due)
+        return [self._pool.submit(self._evaluate, name) for name in due]
+
+    def _evaluate(self, name):
+        started = time.time()
+        try:
+            result = self._run_check(name, self.check_argv)
+        finally:
+            with self._lock:
+                self._running.discard(name)
+                self._next_run[name] = time.monotonic() + self.intervals[name]
+        with self._lock:
+            runs = self._results.get(name, {}).get("runs", 0) + 1
+            result = self._results[name] = {**result, "last_run_at": _utc(started), "runs": runs}
+        # Keep the Prometheus textfile current between runs, not only at exit
+        api_metrics.write()
+        return result
+
+    def check_status(self, name):
+        with self._lock:
+            result = dict(self._results.get(name) or {"check": name, "exit_code": None})
+            result["interval_seconds"] = self.intervals[name]
+            result["running"] = name in self._running
+            result["next_run_in_seconds"] = round(max(0.0, self._next_run[name] - time.monotonic()), 1)
+        return result
+
+    def snapshot(self):
+        """Plain-data view of every check plus the combined exit code (None until all have run)."""
+        checks = {name: self.check_status(name) for name in self.intervals}
+        pending = sorted(name for name, check in checks.items() if check["exit_code"] is None)
+        codes = [check["exit_code"] for check in checks.values() if check["exit_code"] is not None]
+        return {
+            "generated_at": _utc(time.time()),
+            "uptime_seconds": round(time.time() - self.started_at, 1),
+            "exit_code": None if pending else run_all_checks.combine_exit_codes(codes),
+            "pending": pending,
+            "checks": checks,
+        }
+
+    def run_forever(self, poll_seconds=1.0):
+        """Schedule checks until `stop()` is called."""
+        while not self._stopped.is_set():
+            self.run_due()
+            self._stopped.wait(poll_seconds)
+        self._pool.shutdown(wait=True)
+
+    def stop(self):
+        self._stopped.set()
+
+
+def make_server(daemon, host=DEFAULT_HOST, port=DEFAULT_PORT):
+    """Return an HTTP server exposing `daemon`'s results (port 0 picks a free port)."""
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            path = self.path.split("?", 1)[0].rstrip("/")
+            if path == "/healthz":
+                self._send(200, {"status": "ok"})
+            elif path == "/results":
+                self._send(200, daemon.snapshot())
+            elif path == "/gate":
+                snapshot = daemon.snapshot()
+                self._send(503 if snapshot["exit_code"] is None else GATE_STATUS[snapshot["exit_code"]], snapshot)
+            elif path.startswith("/results/") and path[len("/results/"):] in daemon.intervals:
+                self._send(200, daemon.check_status(path[len("/results/"):]))
+            elif path == "/metrics" and api_metrics.get_metrics() is not None:
+                self._send(200, api_metrics.get_metrics().prometheus_text(), "text/plain; version=0.0.4")
+            else:
+                self._send(404, {"error": f"not found: {path}"})
+
+        def _send(self, status, body, content_type="application/json"):
+            payload = (body if isinstance(body, str) else json.dumps(body, indent=2)).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def log_message(self, format, *args):  # noqa: A002  (BaseHTTPRequestHandler signature)
+            logging.debug(f"HTTP {self.address_string()} {format % args}")
+
+    return ThreadingHTTPServer((host, port), Handler)
+
+
+def parse_intervals(values, checks):
+    """Turn ["ec2=300", ...] into {check: seconds} for the selected checks."""
+    intervals = {name: DEFAULT_INTERVALS[name] for name in checks}
+    for value in values or []:
+        name, _, seconds = value.partition("=")
+        if name not in intervals or not seconds:
+            raise ValueError(f"expected CHECK=SECONDS for a selected check, got {value!r}")
+        intervals[name] = int(seconds)
+    return intervals
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Re-run compliance checks on a schedule and serve the results.")
+    parser.add_argument(
+        "--checks",
+        nargs="+",
+        choices=sorted(run_all_checks.CHECKS),
+        default=list(run_all_checks.CHECKS),
+        help="Checks to schedule (default: all).",
+    )
+    parser.add_argument(
+        "--interval",
+        action="append",
+        metavar="CHECK=SECONDS",
+        help="Override one check's interval, e.g. ec2=300 (repeatable). Defaults: "
+        + ", ".join(f"{name}={seconds}" for name, seconds in DEFAULT_INTERVALS.items()),
+    )
+    parser.add_argument("--host", default=DEFAULT_HOST, help=f"Address to listen on (default: {DEFAULT_HOST}).")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT, help=f"HTTP port (default: {DEFAULT_PORT}).")
+    parser.add_argument(
+        "--max-workers",
+        type=int,
+        default=None,
+        help="Checks evaluated at the same time (default: all of them).",
+    )
+    add_common_options(parser)
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    apply_common_options(args)
+    daemon = ComplianceDaemon(parse_intervals(args.interval, args.checks), common_argv(args), args.max_workers)
+    server = make_server(daemon, args.host, args.port)
+    threading.Thread(target=server.serve_forever, name="http", daemon=True).start()
+    signal.signal(signal.SIGTERM, lambda *_: daemon.stop())
+    logging.info(f"=== Watching {', '.join(args.checks)}; results on http://{args.host}:{server.server_port}/results ===")
+    try:
+        daemon.run_forever()
+    except KeyboardInterrupt:
+        daemon.stop()
+    finally:
+        server.shutdown()
+        logging.info("Daemon stopped")
+
+
+if __name__ == "__main__":
+    main()
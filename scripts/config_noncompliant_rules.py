@@ -4,50 +4,213 @@ AWS Config Non-Compliant Rules Report
 -------------------------------------
 Queries AWS Config for all rules whose compliance status is NON_COMPLIANT,
 then exports an Excel report. CI exit code 2 if any violations exist.
+
+With --details, every non-compliant rule is drilled down to its resources
+(`get_compliance_details_by_config_rule`, fully paginated). Rules are fanned
+out over a worker pool and the results stream into a second sheet with one
+row per (rule, resource type, resource id).
+
+`--rules` limits the check to named rules; the names are passed to the API
+rather than filtered locally.
 """
-import boto3
-import pandas as pd
+import argparse
 import logging
 from datetime import datetime
 import sys
 
+import history_store
+import multi_account
+import rate_limiter
+import sharding
+from aws_clients import get_client
+from cli_options import add_common_options, apply_common_options
+from evidence_writer import write_report_sheets
+from records import ConfigResourceRecord, ConfigRuleRecord
+
 logging.basicConfig(
     level=logging.INFO,
     format="%(asctime)s - %(levelname)s - %(message)s",
     handlers=[logging.FileHandler("config_audit.log"), logging.StreamHandler()],
 )
 
-def fetch_noncompliant_rules():
-    cfg = boto3.client("config")
+REPORT_COLUMNS = list(ConfigRuleRecord.FIELDS)
+DETAIL_COLUMNS = list(ConfigResourceRecord.FIELDS)
+DEFAULT_MAX_WORKERS = 16
+DETAILS_PAGE_SIZE = 100  # API maximum
+RULE_NAMES_PER_CALL = 25  # describe_compliance_by_config_rule accepts at most 25 names
+
+def iter_noncompliant_rules(rule_names=None):
+    """Yield one record per NON_COMPLIANT Config rule (optionally only `rule_names`), page by page."""
+    cfg = get_client("config")
     paginator = cfg.get_paginator("describe_compliance_by_config_rule")
-    results = []
-    for page in paginator.paginate(ComplianceTypes=["NON_COMPLIANT"]):
+    if rule_names:
+        # With --shard, only this shard's rules are queried
+        rule_names = sharding.select(rule_names)
+        if not rule_names:
+            return
+        queries = [
+            {"ConfigRuleNames": rule_names[i:i + RULE_NAMES_PER_CALL]}
+            for i in range(0, len(rule_names), RULE_NAMES_PER_CALL)
+        ]
+    else:
+        queries = [{}]
+    pages = (
+        page
+        for query in queries
+        for page in paginator.paginate(ComplianceTypes=["NON_COMPLIANT"], **query)
+    )
+    for page in pages:
         for rule in page.get("ComplianceByConfigRules", []):
-            results.append(
-                {
-                    "config_rule": rule["ConfigRuleName"],
-                    "compliance_type": rule["Compliance"]["ComplianceType"],
-                    "noncompliant_count": rule["Compliance"]["NonCompliantResourceCount"]["CappedCount"],
-                }
+            if not sharding.owns(rule["ConfigRuleName"]):
+                continue
+            yield ConfigRuleRecord(
+                config_rule=rule["ConfigRuleName"],
+                compliance_type=rule["Compliance"]["ComplianceType"],
+                noncompliant_count=rule["Compliance"]["NonCompliantResourceCount"]["CappedCount"],
             )
-    return results
 
-def export_excel(data, filename="config_noncompliant_rules.xlsx"):
-    df = pd.DataFrame(data)
-    if df.empty:
+def fetch_noncompliant_rules():
+    return list(iter_noncompliant_rules())
+
+def fetch_rule_details(cfg, rule_name):
+    """Return one record per NON_COMPLIANT resource of a rule, following every NextToken."""
+    records = []
+    params = {"ConfigRuleName": rule_name, "ComplianceTypes": ["NON_COMPLIANT"], "Limit": DETAILS_PAGE_SIZE}
+    while True:
+        page = rate_limiter.call(cfg, "get_compliance_details_by_config_rule", **params)
+        for result in page.get("EvaluationResults", []):
+            qualifier = result["EvaluationResultIdentifier"]["EvaluationResultQualifier"]
+            records.append(ConfigResourceRecord(
+                config_rule=rule_name,
+                resource_type=qualifier.get("ResourceType"),
+                resource_id=qualifier.get("ResourceId"),
+                compliance_type=result.get("ComplianceType"),
+                result_recorded_time=result.get("ResultRecordedTime"),
+                annotation=result.get("Annotation"),
+            ))
+        if not page.get("NextToken"):
+            return records
+        params["NextToken"] = page["NextToken"]
+
+def iter_rule_details(rules, max_workers=DEFAULT_MAX_WORKERS):
+    """Drill down into rule records concurrently, yielding resource records as each rule completes."""
+
+    def details(rule):
+        account_id = rule.get(multi_account.ACCOUNT_COLUMN)
+        with multi_account.account_context(account_id):
+            cfg = get_client("config", max_pool_connections=max_workers)
+            records = fetch_rule_details(cfg, rule["config_rule"])
+        if account_id:
+            records = [multi_account.tag_account(record, account_id) for record in records]
+        return records
+
+    for records in rate_limiter.iter_fan_out(details, rules, max_workers):
+        yield from records
+
+def export_excel(
+    data, filename="config_noncompliant_rules.xlsx", details=False, max_workers=DEFAULT_MAX_WORKERS, detail_rows=None
+):
+    """Stream rule records (list or generator) into Excel; return the row count.
+
+    With `details`, a second sheet lists the non-compliant resources of every
+    rule written to the first one: fetched from Config, or taken from
+    `detail_rows` when they were already collected (merged shards).
+    """
+    generated_at = {"report_generated_at": datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S")}
+    written_rules = []
+
+    def rules():
+        for record in data:
+            written_rules.append(record)
+            yield record
+
+    sheets = [dict(
+        rows=rules(),
+        sheet_name="Config_NonCompliant",
+        columns=multi_account.report_columns(REPORT_COLUMNS),
+        metadata=generated_at,
+    )]
+    if details:
+        # Generators are lazy, so this sheet starts once the rule sheet is complete
+        sheets.append(dict(
+            rows=iter_rule_details(written_rules, max_workers) if detail_rows is None else detail_rows,
+            sheet_name="Config_NonCompliant_Resources",
+            columns=multi_account.report_columns(DETAIL_COLUMNS),
+            metadata=generated_at,
+        ))
+    written = write_report_sheets(filename, sheets)
+    if not written[0]:
         logging.info("All Config rules compliant – placeholder report created")
-        df = pd.DataFrame(columns=["config_rule", "compliance_type", "noncompliant_count"])
-    df["report_generated_at"] = datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S")
-    df.to_excel(filename, index=False, sheet_name="Config_NonCompliant")
-    logging.info(f"Excel report saved: {filename}")
+    if details:
+        logging.info(f"Non-compliant resources listed: {written[1]}")
+        if detail_rows is None:
+            rate_limiter.log_metrics("config")
+    return written[0]
 
-def main():
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Report AWS Config rules that are NON_COMPLIANT.")
+    parser.add_argument(
+        "--rules",
+        nargs="+",
+        metavar="RULE_NAME",
+        help="Only check these Config rules (default: all).",
+    )
+    parser.add_argument(
+        "--details",
+        action="store_true",
+        help="Add a sheet listing every non-compliant resource of each rule.",
+    )
+    parser.add_argument(
+        "--max-workers",
+        type=int,
+        default=DEFAULT_MAX_WORKERS,
+        help=f"Rules drilled down concurrently with --details (default: {DEFAULT_MAX_WORKERS}).",
+    )
+    add_common_options(parser)
+    return parser.parse_args(argv)
+
+def _tee(records, seen):
+    for record in records:
+        seen.append(record)
+        yield record
+
+
+def run(args):
+    """Run the check, write the report and return the CI exit code."""
+    apply_common_options(args)
     logging.info("=== AWS Config Non-Compliant Rules Check ===")
-    records = fetch_noncompliant_rules()
-    export_excel(records)
-    violations = len(records)
+    account_errors = {}
+    # One account: rules stream straight from the paginator; several: merged per account
+    records = multi_account.collect(lambda: iter_noncompliant_rules(args.rules), account_errors)
+    recorded = []
+    if history_store.enabled():
+        # Keep a copy of each streamed rule for the history store
+        records = _tee(records, recorded)
+    if sharding.enabled():
+        # The report is written by merge_shards.py; keep the rows (and resources) for the partial
+        records = list(records)
+        violations = len(records)
+        resources = list(iter_rule_details(records, args.max_workers)) if args.details else []
+    elif args.no_report:
+        violations = sum(1 for _ in records)
+    else:
+        # Rows are written as the paginator yields them
+        violations = export_excel(records, details=args.details, max_workers=args.max_workers)
+    history_store.record_run("config_rules", recorded, "config_rule", complete=not account_errors)
     logging.info(f"Total non-compliant rules: {violations}")
-    sys.exit(2 if violations else 0)
+    exit_code = 2 if violations else (1 if account_errors else 0)
+    if sharding.enabled():
+        sharding.write_partial(
+            "config_rules",
+            exit_code,
+            {"rules": records, "resources": resources},
+            options={"details": args.details},
+            complete=not account_errors,
+        )
+    return exit_code
+
+def main(argv=None):
+    sys.exit(run(parse_args(argv)))
 
 if __name__ == "__main__":
     main()
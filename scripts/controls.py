@@ -0,0 +1,374 @@
+"""
+Declarative Controls
+--------------------
+Controls as data instead of per-resource `if` chains. Each control names a
+resource table and a boolean expression over that table's columns that is
+true for non-compliant rows:
+
+    - id: ec2-public-ip
+      resource: ec2_instances
+      when: notnull(public_ip)
+      issue: Has public IP address
+
+Expressions use Python syntax (`and`, `or`, `not`, comparisons, `in [...]`
+or `"value" in list_column`, arithmetic) plus the functions in `FUNCTIONS`. Names that are not columns are
+looked up in the parameters (`params:` in a control file, or `--param`), so
+thresholds can be tuned without editing expressions. `issue` is a message
+template; `{column}` and `{param}` placeholders are filled per failing row.
+
+`compile_expression` turns an expression into a function that evaluates it
+over a whole pandas DataFrame at once (vectorized Series operations, no
+Python loop over rows), so hundreds of controls over 100k resources are one
+pass per control. Only the syntax above is accepted; anything else (attribute
+access, arbitrary calls, subscripts) is rejected when the control is loaded.
+
+`DEFAULT_CONTROLS` are the MFA, unused access key and EC2 controls. They are
+the only definition of those rules: the checks collect their inventory rows
+and evaluate them with `builtin_controls` / `evaluate_rows`, and
+`evaluate_controls.py` runs the same definitions over whole tables. Control
+files (YAML, needs PyYAML, or JSON) add controls or replace defaults with the
+same id there.
+"""
+import ast
+import json
+import operator
+import os
+import string
+from datetime import datetime, timezone
+
+from records import to_columns
+
+DEFAULT_PARAMS = {"max_key_age_days": 90}
+DEFAULT_CONTROLS = [
+    {
+        "id": "iam-user-mfa",
+        "resource": "iam_users",
+        "when": "mfa_devices == 0",
+        "issue": "No MFA device",
+    },
+    {
+        "id": "iam-access-key-unused",
+        "resource": "iam_access_keys",
+        "when": 'status == "Active" and (isnull(last_used) or days_since(last_used) > max_key_age_days)',
+        "issue": "Active key not used in the last {max_key_age_days} days",
+    },
+    {
+        "id": "ec2-termination-protection-unreadable",
+        "resource": "ec2_instances",
+        "when": "notnull(termination_protection_error)",
+        "issue": "API error: {termination_protection_error}",
+    },
+    {
+        "id": "ec2-termination-protection",
+        "resource": "ec2_instances",
+        "when": "termination_protection == False",
+        "issue": "Termination protection disabled",
+    },
+    {
+        "id": "ec2-public-ip",
+        "resource": "ec2_instances",
+        "when": "notnull(public_ip)",
+        "issue": "Has public IP address",
+    },
+    {
+        "id": "ec2-volume-undescribed",
+        "resource": "ec2_instances",
+        "when": "size(undescribed_volumes) > 0",
+        "issue": "Volumes could not be described: {undescribed_volumes}",
+    },
+    {
+        "id": "ec2-volume-unencrypted",
+        "resource": "ec2_instances",
+        "when": "size(unencrypted_volumes) > 0",
+        "issue": "Volumes not encrypted: {unencrypted_volumes}",
+    },
+]
+
+_FORMATTER = string.Formatter()
+_COMPARE = {
+    ast.Eq: operator.eq,
+    ast.NotEq: operator.ne,
+    ast.Lt: operator.lt,
+    ast.LtE: operator.le,
+    ast.Gt: operator.gt,
+    ast.GtE: operator.ge,
+}
+_ARITHMETIC = {
+    ast.Add: operator.add,
+    ast.Sub: operator.sub,
+    ast.Mult: operator.mul,
+    ast.Div: operator.truediv,
+}
+
+
+def _days_since(values, now):
+    import pandas as pd
+
+    return (pd.Timestamp(now) - pd.to_datetime(values, utc=True)).dt.total_seconds() / 86400
+
+
+# Vectorized functions available in expressions: name -> fn(now, *arguments)
+FUNCTIONS = {
+    "isnull": lambda now, values: values.isna(),
+    "notnull": lambda now, values: values.notna(),
+    "days_since": lambda now, values: _days_since(values, now),
+    "size": lambda now, values: values.str.len().fillna(0),
+    "contains": lambda now, values, text: values.astype("string").str.contains(text, regex=False).fillna(False),
+    "startswith": lambda now, values, text: values.astype("string").str.startswith(text).fillna(False),
+    "lower": lambda now, values: values.astype("string").str.lower(),
+}
+
+
+def _truthy(value):
+    """Boolean mask for a Series (missing values are False) or a scalar."""
+    if hasattr(value, "fillna"):
+        if value.dtype == bool:
+            return value
+        return value.fillna(False).astype(bool)
+    return bool(value)
+
+
+def _negate(mask):
+    # `~` only on Series: on a Python bool it is bitwise (~True == -2, which is truthy)
+    return ~mask if hasattr(mask, "fillna") else not mask
+
+
+def _membership(value, container):
+    """`value in container` for a column or scalar on either side.
+
+    A column on the left is tested against the container's values; a scalar
+    on the left against a list, or against each row of a list-valued column
+    (missing cells count as empty).
+    """
+    if hasattr(value, "isin"):
+        return value.isin(container)
+    if hasattr(container, "map"):
+        return container.map(lambda items: isinstance(items, (list, tuple, set)) and value in items).astype(bool)
+    return value in container
+
+
+def compile_expression(expression, params=None):
+    """Compile a control expression into `fn(frame, now)` returning a value or Series.
+
+    Raises ValueError for syntax outside the supported subset.
+    """
+    params = {**DEFAULT_PARAMS, **(params or {})}
+    try:
+        tree = ast.parse(expression, mode="eval").body
+    except SyntaxError as e:
+        raise ValueError(f"invalid control expression {expression!r}: {e.msg}") from e
+
+    def build(node):
+        if isinstance(node, ast.Constant):
+            return lambda frame, now, value=node.value: value
+        if isinstance(node, (ast.List, ast.Tuple)):
+            items = [build(item) for item in node.elts]
+            return lambda frame, now: [item(frame, now) for item in items]
+        if isinstance(node, ast.Name):
+            if node.id in params:
+                return lambda frame, now, value=params[node.id]: value
+            name = node.id
+
+            def column(frame, now):
+                if name not in frame:
+                    raise ValueError(f"unknown column {name!r} in {expression!r}")
+                return frame[name]
+
+            return column
+        if isinstance(node, ast.BoolOp):
+            operands = [build(value) for value in node.values]
+            combine = operator.and_ if isinstance(node.op, ast.And) else operator.or_
+
+            def boolean(frame, now):
+                mask = _truthy(operands[0](frame, now))
+                for operand in operands[1:]:
+                    mask = combine(mask, _truthy(operand(frame, now)))
+                return mask
+
+            return boolean
+        if isinstance(node, ast.UnaryOp) and isinstance(node.op, ast.Not):
+            operand = build(node.operand)
+            return lambda frame, now: _negate(_truthy(operand(frame, now)))
+        if isinstance(node, ast.UnaryOp) and isinstance(node.op, ast.USub):
+            operand = build(node.operand)
+            return lambda frame, now: -operand(frame, now)
+        if isinstance(node, ast.BinOp) and type(node.op) in _ARITHMETIC:
+            left, right, op = build(node.left), build(node.right), _ARITHMETIC[type(node.op)]
+            return lambda frame, now: op(left(frame, now), right(frame, now))
+        if isinstance(node, ast.Compare):
+            return _build_compare(node, build)
+        if isinstance(node, ast.Call) and isinstance(node.func, ast.Name) and node.func.id in FUNCTIONS:
+            fn, arguments = FUNCTIONS[node.func.id], [build(argument) for argument in node.args]
+            if node.keywords:
+                raise ValueError(f"keyword arguments are not supported in {expression!r}")
+            return lambda frame, now: fn(now, *[argument(frame, now) for argument in arguments])
+        raise ValueError(f"unsupported syntax ({type(node).__name__}) in {expression!r}")
+
+    return build(tree)
+
+
+def _build_compare(node, build):
+    left = build(node.left)
+    steps = [(type(op), build(comparator)) for op, comparator in zip(node.ops, node.comparators)]
+    for op, _ in steps:
+        if op not in _COMPARE and op not in (ast.In, ast.NotIn):
+            raise ValueError(f"unsupported comparison {op.__name__}")
+
+    def compare(frame, now):
+        mask = True
+        current = left(frame, now)
+        for op, comparator in steps:
+            other = comparator(frame, now)
+            if op in (ast.In, ast.NotIn):
+                result = _membership(current, other)
+                result = _negate(result) if op is ast.NotIn else result
+            else:
+                result = _COMPARE[op](current, other)
+            mask = _truthy(result) if mask is True else mask & _truthy(result)
+            current = other
+        return mask
+
+    return compare
+
+
+class Control:
+    """One compiled control: `mask(frame)` is True for the non-compliant rows."""
+
+    __slots__ = ("id", "resource", "when", "issue", "params", "_fn")
+
+    def __init__(self, id, resource, when, issue, params=None):  # noqa: A002  (matches the file key)
+        self.id = id
+        self.resource = resource
+        self.when = when
+        self.issue = issue
+        self.params = {**DEFAULT_PARAMS, **(params or {})}
+        try:
+            self._fn = compile_expression(when, self.params)
+        except ValueError as e:
+            raise ValueError(f"control {id}: {e}") from e
+
+    def mask(self, frame, now=None):
+        import pandas as pd
+
+        result = _truthy(self._fn(frame, now or datetime.now(timezone.utc)))
+        if not isinstance(result, pd.Series):
+            result = pd.Series(result, index=frame.index)
+        return result
+
+    def messages(self, frame):
+        """Issue text (object array) for every row of `frame` (normally only the failing rows)."""
+        import numpy as np
+
+        pieces = list(_FORMATTER.parse(self.issue))
+        if not any(name in frame for _, name, _, _ in pieces if name):
+            return np.full(len(frame), self.issue.format(**self.params), dtype=object)
+        # Column-wise concatenation of the template pieces (object arrays add element-wise)
+        texts = np.full(len(frame), "", dtype=object)
+        for literal, name, spec, conversion in pieces:
+            texts = texts + literal if literal else texts
+            if name is None:
+                continue
+            if name not in frame:
+                value = self.params.get(name)
+                texts = texts + _FORMATTER.format_field(_FORMATTER.convert_field(value, conversion), spec or "")
+                continue
+            values = frame[name].map(_format_value)
+            if spec or conversion:
+                values = values.map(lambda v: _FORMATTER.format_field(_FORMATTER.convert_field(v, conversion), spec))
+            texts = texts + values.astype(str).to_numpy(dtype=object)
+        return texts
+
+
+def _format_value(value):
+    if isinstance(value, (list, tuple)):
+        return ", ".join(str(item) for item in value)
+    if value is None or value != value:  # None, NaN and NaT render as blank
+        return ""
+    return value
+
+
+def load_controls(paths=(), params=None, include_defaults=True):
+    """Load controls: the defaults, then every file in `paths` (later ids replace earlier ones).
+
+    A file holds {"params": {...}, "controls": [{id, resource, when, issue}, ...]}
+    (YAML or JSON). `params` (e.g. from --param) override the files' params.
+    """
+    definitions = {control["id"]: control for control in DEFAULT_CONTROLS} if include_defaults else {}
+    merged_params = dict(DEFAULT_PARAMS)
+    for path in paths:
+        with open(path) as fh:
+            if os.path.splitext(path)[1].lower() in (".yaml", ".yml"):
+                try:
+                    import yaml  # Imported lazily: only YAML control files need PyYAML
+                except ImportError as e:
+                    raise RuntimeError("YAML control files need PyYAML (pip install pyyaml)") from e
+                document = yaml.safe_load(fh) or {}
+            else:
+                document = json.load(fh)
+        merged_params.update(document.get("params") or {})
+        for control in document.get("controls") or []:
+            definitions[control["id"]] = control
+    merged_params.update(params or {})
+    return [
+        Control(d["id"], d["resource"], d["when"], d["issue"], merged_params)
+        for d in definitions.values()
+    ]
+
+
+def evaluate(frame, controls, now=None):
+    """Evaluate every control over one resource table.
+
+    Returns (issues, failed): Series of "; "-joined issue text and of
+    comma-joined control ids, both indexed like `frame` and restricted to the
+    rows that fail at least one control.
+    """
+    import numpy as np
+    import pandas as pd
+
+    now = now or datetime.now(timezone.utc)
+    hits = []  # (row positions, issue texts, control ids) per control, in control order
+    for control in controls:
+        positions = np.flatnonzero(control.mask(frame, now).to_numpy(dtype=bool))
+        if len(positions):
+            messages = control.messages(frame.iloc[positions])
+            hits.append((positions, messages, np.full(len(positions), control.id, dtype=object)))
+    if not hits:
+        empty = pd.Series([], index=frame.index[:0], dtype=object)
+        return empty, empty.copy()
+
+    # Group all hits by row (stable sort keeps control order), then join once per failing row
+    positions = np.concatenate([hit[0] for hit in hits])
+    order = np.argsort(positions, kind="stable")
+    positions = positions[order]
+    messages = np.concatenate([hit[1] for hit in hits])[order]
+    control_ids = np.concatenate([hit[2] for hit in hits])[order]
+    rows, starts = np.unique(positions, return_index=True)
+    index = frame.index[rows]
+    issues = ["; ".join(chunk) for chunk in np.split(messages, starts[1:])]
+    failed = [",".join(chunk) for chunk in np.split(control_ids, starts[1:])]
+    return pd.Series(issues, index=index, dtype=object), pd.Series(failed, index=index, dtype=object)
+
+
+def builtin_controls(resource, params=None):
+    """The DEFAULT_CONTROLS of one resource table, compiled with `params`."""
+    return [
+        Control(d["id"], d["resource"], d["when"], d["issue"], params)
+        for d in DEFAULT_CONTROLS
+        if d["resource"] == resource
+    ]
+
+
+def evaluate_rows(rows, columns, control_list, now=None):
+    """Evaluate controls over inventory rows (records or dicts with `columns`).
+
+    Returns [(row, issues)] for the rows failing at least one control, in
+    input order; `issues` is the "; "-joined issue text.
+    """
+    import pandas as pd
+
+    rows = list(rows)
+    if not rows:
+        return []
+    frame = pd.DataFrame(to_columns(rows, columns), columns=columns)
+    issues, _ = evaluate(frame, control_list, now)
+    return [(rows[position], text) for position, text in zip(issues.index, issues)]
@@ -4,107 +4,343 @@ EC2 Compliance Checker
 ----------------------
 Checks EC2 instances for compliance with security best practices.
 Exits 0 if compliant, 2 if violations found.
+
+Scope is pushed down to the API: only the requested regions are listed
+(`--regions`), and `describe_instances` filters by instance state
+(`--instance-states`, default: everything except terminated) and tags
+(`--tag KEY=VALUE`), so out-of-scope instances are never transferred.
 """
-import boto3
-import pandas as pd
+import argparse
 import logging
 import sys
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime, timezone
 from botocore.exceptions import ClientError
 
+import controls
+import history_store
+import multi_account
+import rate_limiter
+import sharding
+from aws_clients import get_client
+from cli_options import add_common_options, apply_common_options
+from evidence_writer import write_report
+from records import InstanceFinding
+
 logging.basicConfig(
     level=logging.INFO,
     format="%(asctime)s - %(levelname)s - %(message)s",
     handlers=[logging.FileHandler("ec2_audit.log"), logging.StreamHandler()],
 )
 
-def check_ec2_compliance():
-    ec2 = boto3.client("ec2")
+DEFAULT_MAX_WORKERS = 8
+INSTANCE_STATES = ['pending', 'running', 'shutting-down', 'stopping', 'stopped', 'terminated']
+# Terminated instances cannot be remediated, so they are out of scope by default
+DEFAULT_INSTANCE_STATES = [state for state in INSTANCE_STATES if state != 'terminated']
+DESCRIBE_INSTANCES_PAGE_SIZE = 1000
+# Per-region pool for describe_instance_attribute; each region's client gets
+# a connection pool of the same size.
+ATTRIBUTE_PROBE_WORKERS = 8
+# Values per `volume-id` filter in one describe_volumes request.
+VOLUME_FILTER_CHUNK = 200
+REPORT_COLUMNS = list(InstanceFinding.FIELDS)
+# Facts collected per instance before any control is evaluated
+INVENTORY_COLUMNS = [
+    "instance_id", "instance_type", "state", "region", "launch_time", "public_ip",
+    "termination_protection", "termination_protection_error", "unencrypted_volumes", "undescribed_volumes",
+]
+
+def _prefetch_volume_encryption(ec2_region, volume_ids):
+    """Resolve encryption for many volumes with paginated bulk calls.
+
+    Volume IDs are sent as `volume-id` filter values in chunks, so N volumes
+    cost O(N / VOLUME_FILTER_CHUNK) calls instead of one call per volume.
+    Returns {volume_id: encrypted}.
+    """
+    encrypted = {}
+    paginator = ec2_region.get_paginator('describe_volumes')
+    ids = sorted(volume_ids)
+
+    for start in range(0, len(ids), VOLUME_FILTER_CHUNK):
+        chunk = ids[start:start + VOLUME_FILTER_CHUNK]
+        for page in paginator.paginate(
+            Filters=[{'Name': 'volume-id', 'Values': chunk}],
+            PaginationConfig={'PageSize': 500},
+        ):
+            for volume in page['Volumes']:
+                encrypted[volume['VolumeId']] = volume['Encrypted']
+    return encrypted
+
+def _termination_protection(ec2_region, instance_id):
+    """Return (enabled, error) for one instance's termination protection.
+
+    `enabled` is None when the attribute could not be read; `error` then
+    holds the API error. Throttling that outlasts the scheduler's retries is
+    re-raised so the region is reported as failed rather than evaluated on
+    partial data.
+    """
+    try:
+        attr = rate_limiter.call(
+            ec2_region,
+            'describe_instance_attribute',
+            InstanceId=instance_id,
+            Attribute='disableApiTermination'
+        )
+        return bool(attr['DisableApiTermination']['Value']), None
+    except ClientError as e:
+        if rate_limiter.is_throttle(e):
+            raise
+        return None, str(e)
+
+def _prefetch_termination_protection(ec2_region, instance_ids):
+    """Probe termination protection for many instances with bounded parallelism.
+
+    EC2 has no batch form of `describe_instance_attribute`, so the per-instance
+    calls fan out through `rate_limiter` on at most ATTRIBUTE_PROBE_WORKERS
+    threads (the size of the client's connection pool).
+    Returns {instance_id: (enabled, error)}.
+    """
+    results = rate_limiter.fan_out(
+        lambda instance_id: _termination_protection(ec2_region, instance_id),
+        instance_ids,
+        ec2_region,
+        max_workers=ATTRIBUTE_PROBE_WORKERS,
+    )
+    return dict(zip(instance_ids, results))
+
+def instance_filters(states=None, tags=None):
+    """Build describe_instances filters from instance states and {tag key: value}."""
+    filters = [{'Name': 'instance-state-name', 'Values': list(states or DEFAULT_INSTANCE_STATES)}]
+    for key, value in (tags or {}).items():
+        filters.append({'Name': f'tag:{key}', 'Values': [value]})
+    return filters
+
+def parse_tag(value):
+    """argparse type for "KEY=VALUE": return (KEY, VALUE); the value may be empty, the key may not."""
+    key, sep, tag_value = value.partition('=')
+    if not sep or not key:
+        raise argparse.ArgumentTypeError(f"expected KEY=VALUE, e.g. env=prod, got {value!r}")
+    return key, tag_value
+
+def _region_inventory(ec2_region, region, filters=None):
+    """Collect one fact row (see INVENTORY_COLUMNS) per in-scope instance in one region.
+
+    Runs in two stages: list instances (see `instance_filters`) and collect
+    their volume IDs, then prefetch volume encryption and termination
+    protection in bulk. No control is evaluated here.
+    """
+    paginator = ec2_region.get_paginator('describe_instances')
+    instances = []
+    volume_ids = set()
+
+    # Stage 1: inventory
+    pages = paginator.paginate(
+        Filters=filters or instance_filters(),
+        PaginationConfig={'PageSize': DESCRIBE_INSTANCES_PAGE_SIZE},
+    )
+    for page in pages:
+        for reservation in page['Reservations']:
+            for instance in reservation['Instances']:
+                instances.append(instance)
+                for bdm in instance.get('BlockDeviceMappings', []):
+                    if 'Ebs' in bdm:
+                        volume_ids.add(bdm['Ebs']['VolumeId'])
+
+    # Stage 2: bulk lookups
+    volume_encrypted = _prefetch_volume_encryption(ec2_region, volume_ids)
+    protection = _prefetch_termination_protection(
+        ec2_region, [instance['InstanceId'] for instance in instances]
+    )
+
+    rows = []
+    for instance in instances:
+        instance_id = instance['InstanceId']
+        volumes = [bdm['Ebs']['VolumeId'] for bdm in instance.get('BlockDeviceMappings', []) if 'Ebs' in bdm]
+        enabled, error = protection[instance_id]
+        rows.append({
+            "instance_id": instance_id,
+            "instance_type": instance.get('InstanceType', 'N/A'),
+            "state": instance['State']['Name'],
+            "region": region,
+            "launch_time": str(instance.get('LaunchTime')),
+            "public_ip": instance.get('PublicIpAddress'),
+            "termination_protection": enabled,
+            "termination_protection_error": error,
+            "unencrypted_volumes": [vol_id for vol_id in volumes if volume_encrypted.get(vol_id) is False],
+            "undescribed_volumes": [vol_id for vol_id in volumes if vol_id not in volume_encrypted],
+        })
+    return rows
+
+def _scan_region(ec2_region, region, non_compliant, filters=None):
+    """Evaluate every in-scope instance (see `instance_filters`) in one region.
+
+    Collects the region's inventory (`_region_inventory`), then evaluates the
+    built-in ec2_instances controls (`controls.DEFAULT_CONTROLS`) over it in
+    one pass. Findings are appended to the shared `non_compliant` list
+    (list.append is atomic, so worker threads can share it).
+    """
+    rows = _region_inventory(ec2_region, region, filters)
+    for row, issues in controls.evaluate_rows(rows, INVENTORY_COLUMNS, controls.builtin_controls("ec2_instances")):
+        non_compliant.append(InstanceFinding(
+            instance_id=row["instance_id"],
+            instance_type=row["instance_type"],
+            state=row["state"],
+            region=region,
+            launch_time=row["launch_time"],
+            issues=issues,
+        ))
+
+def _for_each_region(scan, max_workers, region_errors, regions=None):
+    """Call `scan(client, region)` for every enabled (or requested) region on a bounded pool.
+
+    A region that fails is logged and recorded in `region_errors`
+    ((account_id, region) -> error message, see `multi_account.region_key`)
+    while the remaining regions finish.
+    """
+    ec2 = get_client("ec2")
+    # Unknown or disabled region names are rejected by the API
+    params = {'RegionNames': list(regions)} if regions else {}
+    regions = [region['RegionName'] for region in ec2.describe_regions(**params)['Regions']]
+    # With --shard, this runner scans only its share of the regions
+    regions = sharding.select_regions(regions)
+    # One shared client per region, sized for its termination-protection probes
+    clients = {
+        region: get_client('ec2', region, max_pool_connections=ATTRIBUTE_PROBE_WORKERS)
+        for region in regions
+    }
+
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(regions)))) as pool:
+        futures = {pool.submit(scan, clients[region], region): region for region in regions}
+        for future in as_completed(futures):
+            region = futures[future]
+            try:
+                future.result()
+                logging.debug(f"Finished scanning region {region}")
+            except Exception as e:
+                key = multi_account.region_key(region)
+                logging.error(f"Region {multi_account.region_name(key)} scan failed: {str(e)}")
+                region_errors[key] = str(e)
+
+def check_ec2_compliance(max_workers=DEFAULT_MAX_WORKERS, region_errors=None, regions=None, filters=None):
+    """Scan all enabled regions concurrently and return non-compliant instances.
+
+    Regions run on a bounded thread pool, so wall time tracks the slowest
+    region rather than the sum of all regions. A region that fails is logged
+    and recorded in `region_errors` ((account_id, region) -> error message)
+    while the remaining regions finish.
+    """
     non_compliant = []
+    if region_errors is None:
+        region_errors = {}
     
     try:
-        # Get all instances across all regions
-        regions = [region['RegionName'] for region in ec2.describe_regions()['Regions']]
-        
-        for region in regions:
-            ec2_region = boto3.client('ec2', region_name=region)
-            paginator = ec2_region.get_paginator('describe_instances')
-            
-            for page in paginator.paginate():
-                for reservation in page['Reservations']:
-                    for instance in reservation['Instances']:
-                        instance_id = instance['InstanceId']
-                        issues = []
-                        
-                        # Skip terminated instances
-                        if instance['State']['Name'] == 'terminated':
-                            continue
-                            
-                        # Check 1: Termination protection
-                        try:
-                            attr = ec2_region.describe_instance_attribute(
-                                InstanceId=instance_id,
-                                Attribute='disableApiTermination'
-                            )
-                            if not attr['DisableApiTermination']['Value']:
-                                issues.append("Termination protection disabled")
-                        except ClientError as e:
-                            issues.append(f"API error: {str(e)}")
-                        
-                        # Check 2: Public IP exposure
-                        if instance.get('PublicIpAddress'):
-                            # Check if public IP is required (e.g., for NAT gateways, etc.)
-                            # This is a simple check; you might want to expand it
-                            issues.append("Has public IP address")
-                            
-                        # Check 3: EBS volume encryption
-                        for bdm in instance.get('BlockDeviceMappings', []):
-                            if 'Ebs' in bdm:
-                                vol_id = bdm['Ebs']['VolumeId']
-                                vol = ec2_region.describe_volumes(VolumeIds=[vol_id])
-                                if not vol['Volumes'][0]['Encrypted']:
-                                    issues.append(f"Volume {vol_id} is not encrypted")
-                            
-                        if issues:
-                            non_compliant.append({
-                                "instance_id": instance_id,
-                                "instance_type": instance.get('InstanceType', 'N/A'),
-                                "state": instance['State']['Name'],
-                                "region": region,
-                                "launch_time": str(instance.get('LaunchTime')),
-                                "issues": "; ".join(issues)
-                            })
-        
+        _for_each_region(
+            lambda client, region: _scan_region(client, region, non_compliant, filters=filters),
+            max_workers,
+            region_errors,
+            regions,
+        )
         return non_compliant
         
     except Exception as e:
         logging.error(f"Error checking EC2 compliance: {str(e)}")
         raise
 
+def collect_inventory(max_workers=DEFAULT_MAX_WORKERS, region_errors=None, regions=None, filters=None):
+    """Return the instance inventory (rows with INVENTORY_COLUMNS) of every scanned region, unevaluated."""
+    rows = []
+    if region_errors is None:
+        region_errors = {}
+    _for_each_region(
+        lambda client, region: rows.extend(_region_inventory(client, region, filters)),
+        max_workers,
+        region_errors,
+        regions,
+    )
+    return rows
+
 def export_report(non_compliant, filename="ec2_compliance_report.xlsx"):
-    """Export compliance issues to Excel with timestamp."""
-    df = pd.DataFrame(non_compliant if non_compliant else 
-                     [{"status": "All EC2 instances are compliant"}])
-    df["report_generated_at"] = datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
-    df.to_excel(filename, index=False)
+    """Export compliance issues with timestamp (xlsx by default, see --format)."""
+    if non_compliant:
+        rows, columns = non_compliant, multi_account.report_columns(REPORT_COLUMNS)
+    else:
+        rows, columns = [{"status": "All EC2 instances are compliant"}], ["status"]
+    write_report(
+        rows,
+        filename,
+        sheet_name="Sheet1",
+        columns=columns,
+        metadata={"report_generated_at": datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M:%S")},
+    )
     logging.info(f"Report saved to {filename}")
 
-def main():
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Check EC2 instances across all regions.")
+    parser.add_argument(
+        "--max-workers",
+        type=int,
+        default=DEFAULT_MAX_WORKERS,
+        help=f"Regions scanned concurrently (default: {DEFAULT_MAX_WORKERS}).",
+    )
+    parser.add_argument(
+        "--instance-states",
+        nargs="+",
+        choices=INSTANCE_STATES,
+        default=DEFAULT_INSTANCE_STATES,
+        help="Instance states to evaluate (default: all but terminated).",
+    )
+    parser.add_argument(
+        "--tag",
+        action="append",
+        type=parse_tag,
+        metavar="KEY=VALUE",
+        help="Only evaluate instances with this tag (repeatable; all must match).",
+    )
+    add_common_options(parser)
+    return parser.parse_args(argv)
+
+def run(args):
+    """Run the check, write the report and return the CI exit code."""
+    apply_common_options(args)
     logging.info("=== Starting EC2 Compliance Check ===")
     try:
-        non_compliant = check_ec2_compliance()
-        export_report(non_compliant)
+        filters = instance_filters(args.instance_states, dict(args.tag or []))
+        region_errors = {}
+        account_errors = {}
+        non_compliant = multi_account.collect(
+            lambda: check_ec2_compliance(args.max_workers, region_errors, args.regions, filters), account_errors
+        )
+        history_store.record_run(
+            "ec2", non_compliant, "instance_id", complete=not (region_errors or account_errors)
+        )
         
+        rate_limiter.log_metrics("ec2")
         if non_compliant:
             logging.warning(f"Found {len(non_compliant)} non-compliant EC2 instances")
-            sys.exit(2)  # Non-zero exit for CI/CD pipelines
+            exit_code = 2  # Non-zero exit for CI/CD pipelines
+        elif region_errors or account_errors:
+            # Incomplete evidence must not pass as compliant
+            failed = multi_account.describe_failures(region_errors, account_errors)
+            logging.error(f"Scan incomplete – failed: {', '.join(failed)}")
+            exit_code = 1
         else:
             logging.info("All EC2 instances are compliant")
-            sys.exit(0)
+            exit_code = 0
+
+        if sharding.enabled():
+            sharding.write_partial(
+                "ec2", exit_code, {"instances": non_compliant}, complete=not (region_errors or account_errors)
+            )
+        elif not args.no_report:
+            export_report(non_compliant)
+        return exit_code
             
     except Exception as e:
         logging.error(f"Compliance check failed: {str(e)}")
-        sys.exit(1)
+        return 1
+
+def main(argv=None):
+    sys.exit(run(parse_args(argv)))
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,259 @@
+#!/usr/bin/env python3
+"""
+Declarative Control Evaluation
+------------------------------
+Runs the controls from `controls` (the built-in ones, which the checks
+evaluate too, plus any `--controls` files) in two separate steps:
+
+1. collect: each resource table a control refers to is collected once by
+   the check's own inventory function (`fafo_checker.user_inventory`,
+   `unused_iam_access_keys.key_inventory`,
+   `ec2_compliance_check.collect_inventory`) and converted in bulk into a
+   DataFrame;
+2. evaluate: every control is a vectorized boolean mask over its table.
+
+The EC2 inventory is scoped like the EC2 check (`--instance-states`,
+`--tag`), so both evaluate the same instances.
+
+Rows failing any control are written to `controls_report.xlsx`, one sheet per
+resource table, with the issues and the ids of the failed controls. Exit
+codes follow the checks: 2 if any control fails, 1 if collection failed or
+was incomplete, otherwise 0.
+"""
+import argparse
+import ast
+import logging
+import sys
+import time
+from datetime import datetime, timezone
+
+# Configure logging before the checks are imported so their own
+# basicConfig calls become no-ops.
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s - %(levelname)s - %(message)s",
+    handlers=[logging.FileHandler("controls_audit.log"), logging.StreamHandler()],
+)
+
+import controls  # noqa: E402
+import ec2_compliance_check  # noqa: E402
+import fafo_checker  # noqa: E402
+import history_store  # noqa: E402
+import multi_account  # noqa: E402
+import unused_iam_access_keys  # noqa: E402
+from aws_clients import get_client  # noqa: E402
+from cli_options import add_common_options, apply_common_options  # noqa: E402
+from evidence_writer import write_report_sheets  # noqa: E402
+from records import to_columns  # noqa: E402
+
+REPORT_FILE = "controls_report.xlsx"
+# Resource table -> (inventory columns, identifying columns written to the report)
+RESOURCE_TABLES = {
+    "iam_users": (fafo_checker.INVENTORY_COLUMNS, ["user_name", "user_arn", "create_date"]),
+    "iam_access_keys": (
+        unused_iam_access_keys.INVENTORY_COLUMNS,
+        ["user_name", "access_key_id", "create_date", "last_used", "age_days"],
+    ),
+    "ec2_instances": (
+        ec2_compliance_check.INVENTORY_COLUMNS,
+        ["instance_id", "instance_type", "state", "region", "launch_time"],
+    ),
+}
+# Resource id column of each table in the history store
+RESOURCE_KEYS = {"iam_users": "user_name", "iam_access_keys": "access_key_id", "ec2_instances": "instance_id"}
+
+
+def collect_table(resource, args, region_errors):
+    """Collect one resource table's inventory rows (every scanned account)."""
+    collectors = {
+        "iam_users": lambda: fafo_checker.user_inventory(get_client("iam")),
+        "iam_access_keys": lambda: unused_iam_access_keys.key_inventory(get_client("iam")),
+        "ec2_instances": lambda: ec2_compliance_check.collect_inventory(
+            args.max_workers,
+            region_errors,
+            args.regions,
+            ec2_compliance_check.instance_filters(args.instance_states, dict(args.tag or [])),
+        ),
+    }
+    return collectors[resource]()
+
+
+def inventory_frame(rows, columns):
+    """Bulk-convert inventory rows into a DataFrame (one pass, no per-row dicts kept)."""
+    import pandas as pd  # imported lazily like the report writers
+
+    return pd.DataFrame(to_columns(rows, columns), columns=columns)
+
+
+def _report_rows(frame, columns):
+    subset = frame[columns].astype(object)
+    subset = subset.where(subset.notna(), None)  # NaT/NaN -> blank cells
+    for values in subset.itertuples(index=False, name=None):
+        yield dict(zip(columns, values))
+
+
+def evaluate_tables(control_list, collect, now=None):
+    """Collect and evaluate every table used by `control_list`.
+
+    `collect(resource)` returns that table's inventory rows. Returns
+    {resource: DataFrame of failing rows with "issues" and "failed_controls"}.
+    """
+    by_resource = {}
+    for control in control_list:
+        if control.resource not in RESOURCE_TABLES:
+            raise ValueError(f"control {control.id}: unknown resource {control.resource!r}")
+        by_resource.setdefault(control.resource, []).append(control)
+
+    results = {}
+    for resource, resource_controls in by_resource.items():
+        columns = multi_account.report_columns(RESOURCE_TABLES[resource][0])
+        frame = inventory_frame(collect(resource), columns)
+        started = time.perf_counter()
+        issues, failed = controls.evaluate(frame, resource_controls, now)
+        logging.info(
+            f"{resource}: {len(resource_controls)} controls over {len(frame)} rows in "
+            f"{time.perf_counter() - started:.3f}s – {len(issues)} non-compliant"
+        )
+        violations = frame.loc[issues.index].copy()
+        violations["issues"] = issues
+        violations["failed_controls"] = failed
+        results[resource] = violations
+    return results
+
+
+def export_report(results, filename=REPORT_FILE):
+    """One sheet per resource table: identifying columns, issues and failed control ids."""
+    generated_at = {"report_generated_at": datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M:%S")}
+    sheets = []
+    for resource, violations in results.items():
+        columns = multi_account.report_columns(RESOURCE_TABLES[resource][1]) + ["issues", "failed_controls"]
+        sheets.append(dict(
+            rows=_report_rows(violations, columns),
+            sheet_name=resource,
+            columns=columns,
+            metadata=generated_at,
+            total_column="total_non_compliant",
+            total=len(violations),
+        ))
+    return write_report_sheets(filename, sheets)
+
+
+def record_history(results, complete=True):
+    """Append one run per resource table to the history store, one violation per failed control."""
+    for resource, violations in results.items():
+        key = RESOURCE_KEYS[resource]
+        history_store.record_run(
+            f"controls.{resource}",
+            _report_rows(violations, multi_account.report_columns([key, "issues", "failed_controls"])),
+            key,
+            control=lambda row: row["failed_controls"].split(","),
+            complete=complete,
+        )
+
+
+def parse_params(values):
+    """Turn ["max_key_age_days=60", ...] into {"max_key_age_days": 60} (literals, else strings)."""
+    params = {}
+    for value in values or []:
+        name, _, raw = value.partition("=")
+        if not raw:
+            raise ValueError(f"expected NAME=VALUE, got {value!r}")
+        try:
+            params[name] = ast.literal_eval(raw)
+        except (ValueError, SyntaxError):
+            params[name] = raw
+    return params
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Evaluate declarative controls over collected inventories.")
+    parser.add_argument(
+        "--controls",
+        nargs="+",
+        default=[],
+        metavar="FILE",
+        help="Control files (YAML or JSON) added to, or replacing by id, the built-in controls.",
+    )
+    parser.add_argument(
+        "--no-default-controls",
+        action="store_true",
+        help="Only evaluate the controls from --controls files.",
+    )
+    parser.add_argument(
+        "--param",
+        action="append",
+        metavar="NAME=VALUE",
+        help="Set a control parameter, e.g. max_key_age_days=60 (repeatable).",
+    )
+    parser.add_argument(
+        "--max-workers",
+        type=int,
+        default=ec2_compliance_check.DEFAULT_MAX_WORKERS,
+        help="Regions collected concurrently for ec2_instances.",
+    )
+    parser.add_argument(
+        "--instance-states",
+        nargs="+",
+        choices=ec2_compliance_check.INSTANCE_STATES,
+        default=ec2_compliance_check.DEFAULT_INSTANCE_STATES,
+        help="Instance states collected for ec2_instances (default: all but terminated).",
+    )
+    parser.add_argument(
+        "--tag",
+        action="append",
+        type=ec2_compliance_check.parse_tag,
+        metavar="KEY=VALUE",
+        help="Only collect ec2_instances with this tag (repeatable; all must match).",
+    )
+    add_common_options(parser)
+    return parser.parse_args(argv)
+
+
+def run(args):
+    if args.shard:
+        logging.error("--shard is not supported: shard the checks and combine them with merge_shards.py")
+        return 1
+    apply_common_options(args)
+    start = time.perf_counter()
+    try:
+        control_list = controls.load_controls(
+            args.controls, parse_params(args.param), include_defaults=not args.no_default_controls
+        )
+    except (OSError, ValueError, RuntimeError) as e:
+        logging.error(f"Cannot load controls: {str(e)}")
+        return 1
+
+    region_errors = {}
+    account_errors = {}
+    try:
+        results = evaluate_tables(
+            control_list,
+            lambda resource: multi_account.collect(lambda: collect_table(resource, args, region_errors), account_errors),
+        )
+    except Exception as e:
+        logging.error(f"Control evaluation failed: {str(e)}")
+        return 1
+    if not args.no_report:
+        export_report(results)
+    record_history(results, complete=not (region_errors or account_errors))
+
+    non_compliant = sum(len(violations) for violations in results.values())
+    logging.info(
+        f"{len(control_list)} controls, {non_compliant} non-compliant resources; "
+        f"completed in {time.perf_counter() - start:.2f} seconds"
+    )
+    if non_compliant:
+        return 2
+    if region_errors or account_errors:
+        failed = multi_account.describe_failures(region_errors, account_errors)
+        logging.error(f"Collection incomplete – failed: {', '.join(failed)}")
+        return 1
+    return 0
+
+
+def main(argv=None):
+    sys.exit(run(parse_args(argv)))
+
+
+if __name__ == "__main__":
+    main()
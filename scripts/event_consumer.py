@@ -0,0 +1,454 @@
+#!/usr/bin/env python3
+"""
+CloudTrail Event Consumer
+-------------------------
+Keeps compliance results current without full rescans. An EventBridge rule
+(or a CloudTrail -> SNS subscription) delivers management events to an SQS
+queue; this script long-polls the queue and, for each relevant event, re-runs
+only the affected check for only the affected resource:
+
+- IAM user and MFA changes (`CreateUser`, `DeleteUser`, `EnableMFADevice`,
+  `DeactivateMFADevice`) re-check that user's MFA (`fafo_checker`);
+- access key changes (`CreateAccessKey`, `UpdateAccessKey`, `DeleteAccessKey`,
+  `DeleteUser`) re-check that user's keys (`unused_iam_access_keys`);
+- instance changes (`RunInstances`, `ModifyInstanceAttribute`,
+  `AttachVolume`, `CreateVolume` with an attachment, start/stop/terminate,
+  `AssociateAddress`) re-scan those instances in the event's region
+  (`ec2_compliance_check`, filtered by instance ID).
+
+Events in one receive batch are grouped, so a burst of changes to one user or
+region costs one evaluation. The current violations are persisted in a JSON
+result set (`--state-file`, written atomically); `--seed` fills it with one
+full scan first. A message is only deleted once its evaluation succeeded, so
+failures are retried when SQS redelivers it.
+
+Events are only evaluated for the scanned accounts: the `--accounts`
+selection, or without it the account of the default credentials. Events from
+any other account are skipped, never evaluated with the wrong credentials.
+
+An access key becomes unused just by aging, which no CloudTrail event
+reports. That check is therefore also re-run as a full scan whenever its last
+scan is older than `--rescan-hours`, including at startup. Accounts or regions
+a full scan could not read keep their stored violations, and the scan is
+retried on the next loop.
+
+Exit codes (with `--once`, which stops when the queue is drained): 2 if the
+result set holds violations, 1 if an evaluation failed, otherwise 0.
+"""
+import argparse
+import json
+import logging
+import os
+import sys
+import time
+from collections import defaultdict
+from datetime import date, datetime, timedelta, timezone
+
+from botocore.exceptions import ClientError
+
+# Configure logging before the checks are imported so their own
+# basicConfig calls become no-ops.
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s - %(levelname)s - %(message)s",
+    handlers=[logging.FileHandler("event_consumer_audit.log"), logging.StreamHandler()],
+)
+
+import ec2_compliance_check  # noqa: E402
+import fafo_checker  # noqa: E402
+import multi_account  # noqa: E402
+import unused_iam_access_keys  # noqa: E402
+from aws_clients import get_account_id, get_client  # noqa: E402
+from cli_options import add_common_options, apply_common_options  # noqa: E402
+
+DEFAULT_STATE_FILE = "event_compliance_state.json"
+DEFAULT_KEY_THRESHOLD_DAYS = 90
+MAX_MESSAGES = 10  # SQS receive_message maximum
+WAIT_SECONDS = 20  # SQS long-poll maximum
+MIN_WAIT_SECONDS = 1  # 0 would turn the receive loop into a busy poll
+DEFAULT_RESCAN_HOURS = 24
+CHECKS = ("iam_mfa", "iam_access_keys", "ec2")
+# Checks whose violations also change with time alone (no event), so they are re-scanned periodically
+AGING_CHECKS = ("iam_access_keys",)
+
+
+def _user_name(event):
+    return [(event.get("requestParameters") or {}).get("userName")]
+
+
+def _instance_ids(event):
+    params = event.get("requestParameters") or {}
+    response = event.get("responseElements") or {}
+    ids = [params.get("instanceId")]
+    ids += [item.get("instanceId") for item in (params.get("instancesSet") or {}).get("items", [])]
+    ids += [item.get("instanceId") for item in (response.get("instancesSet") or {}).get("items", [])]
+    # CreateVolume only matters when the new volume was attached at creation
+    ids += [item.get("instanceId") for item in (response.get("attachmentSet") or {}).get("items", [])]
+    return ids
+
+
+# CloudTrail eventName -> [(check, resource extractor)]
+EVENT_TARGETS = {
+    "CreateUser": [("iam_mfa", _user_name)],
+    "DeleteUser": [("iam_mfa", _user_name), ("iam_access_keys", _user_name)],
+    "EnableMFADevice": [("iam_mfa", _user_name)],
+    "DeactivateMFADevice": [("iam_mfa", _user_name)],
+    "CreateAccessKey": [("iam_access_keys", _user_name)],
+    "UpdateAccessKey": [("iam_access_keys", _user_name)],
+    "DeleteAccessKey": [("iam_access_keys", _user_name)],
+    **{
+        name: [("ec2", _instance_ids)]
+        for name in (
+            "RunInstances",
+            "StartInstances",
+            "StopInstances",
+            "TerminateInstances",
+            "ModifyInstanceAttribute",
+            "CreateVolume",
+            "AttachVolume",
+            "DetachVolume",
+            "AssociateAddress",
+        )
+    },
+}
+
+
+def parse_event(body):
+    """Return the CloudTrail record in an SQS message body.
+
+    Accepts EventBridge envelopes ({"detail": {...}}), SNS notifications
+    ({"Message": "<json>"}) and bare CloudTrail records.
+    """
+    message = json.loads(body)
+    if isinstance(message.get("Message"), str):
+        message = json.loads(message["Message"])
+    return message.get("detail", message)
+
+
+def event_targets(event, accounts=None):
+    """Return [(check, account_id, region, resource_id)] affected by one CloudTrail event.
+
+    `accounts` are the account IDs that may be evaluated (None: any); events of
+    other accounts affect nothing here. account_id is None without --accounts.
+    """
+    if event.get("errorCode"):
+        return []  # the API call failed, nothing changed
+    recipient = event.get("recipientAccountId")
+    if accounts is not None and recipient and recipient not in accounts:
+        logging.warning(f"Skipping {event.get('eventName')} event from account {recipient}: not a scanned account")
+        return []
+    account_id = recipient if multi_account.enabled() else None
+    region = event.get("awsRegion")
+    return [
+        (check, account_id, region if check == "ec2" else None, resource_id)
+        for check, extract in EVENT_TARGETS.get(event.get("eventName"), [])
+        for resource_id in extract(event)
+        if resource_id
+    ]
+
+
+def _evaluate_iam_mfa(region, user_names, threshold_days):
+    iam = get_client("iam")
+    return {name: [record] if (record := fafo_checker.user_without_mfa(iam, name)) else [] for name in user_names}
+
+
+def _evaluate_access_keys(region, user_names, threshold_days):
+    iam = get_client("iam")
+    results = {}
+    for name in user_names:
+        try:
+            results[name] = unused_iam_access_keys._unused_keys_for_user(iam, name, threshold_days)
+        except ClientError as error:
+            if error.response.get("Error", {}).get("Code") != "NoSuchEntity":
+                raise
+            results[name] = []  # deleted user: its keys are gone too
+    return results
+
+
+def _evaluate_ec2(region, instance_ids, threshold_days):
+    findings = []
+    filters = ec2_compliance_check.instance_filters() + [{"Name": "instance-id", "Values": sorted(instance_ids)}]
+    ec2_compliance_check._scan_region(get_client("ec2", region), region, findings, filters=filters)
+    results = {instance_id: [] for instance_id in instance_ids}  # terminated or now compliant
+    for finding in findings:
+        results[finding["instance_id"]].append(finding)
+    return results
+
+
+EVALUATORS = {"iam_mfa": _evaluate_iam_mfa, "iam_access_keys": _evaluate_access_keys, "ec2": _evaluate_ec2}
+
+
+def _json_value(value):
+    return value.isoformat() if isinstance(value, (datetime, date)) else value
+
+
+def _resource_key(account_id, resource_id):
+    return f"{account_id}/{resource_id}" if account_id else resource_id
+
+
+def load_state(path):
+    """Load the result set: {"violations": {check: {resource: [record dicts]}}, "events_processed": n}.
+
+    "scanned_at" holds the time of each check's last full scan.
+    """
+    if not os.path.exists(path):
+        return {"violations": {check: {} for check in CHECKS}, "events_processed": 0}
+    with open(path) as fh:
+        return json.load(fh)
+
+
+def save_state(state, path):
+    """Write the result set atomically so an interrupted run cannot corrupt it."""
+    state["updated_at"] = datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as fh:
+        json.dump(state, fh, indent=2)
+    os.replace(tmp_path, path)
+
+
+def update_state(state, check, account_id, results):
+    """Replace the stored violations of every evaluated resource (resolved ones are dropped)."""
+    violations = state["violations"].setdefault(check, {})
+    for resource_id, records in results.items():
+        key = _resource_key(account_id, resource_id)
+        if records:
+            violations[key] = [{name: _json_value(value) for name, value in record.items()} for record in records]
+        else:
+            violations.pop(key, None)
+
+
+def _failed_scope(record, account_errors, region_errors):
+    """True when a stored record belongs to an account or region that the last scan could not read."""
+    account_id = record.get(multi_account.ACCOUNT_COLUMN)
+    return account_id in account_errors or (account_id, record.get("region")) in region_errors
+
+
+def seed_state(state, threshold_days=DEFAULT_KEY_THRESHOLD_DAYS, checks=CHECKS):
+    """Fill the result set from one full scan of each check in `checks`.
+
+    Accounts or regions that could not be scanned keep their previously stored
+    violations, and the check's "scanned_at" is not advanced, so the next
+    rescan tries again. Returns the failures (empty when every scan was complete).
+    """
+    failures = []
+    for check in checks:
+        account_errors = {}
+        region_errors = {}
+        collectors = {
+            "iam_mfa": (fafo_checker.list_users_without_mfa, "user_name"),
+            "iam_access_keys": (lambda: unused_iam_access_keys.list_unused_keys(threshold_days), "user_name"),
+            "ec2": (lambda: ec2_compliance_check.check_ec2_compliance(region_errors=region_errors), "instance_id"),
+        }
+        collect, resource_column = collectors[check]
+        grouped = defaultdict(list)
+        for record in multi_account.collect(collect, account_errors):
+            grouped[(record.get(multi_account.ACCOUNT_COLUMN), record[resource_column])].append(record)
+        previous = state["violations"].get(check, {})
+        state["violations"][check] = {
+            key: records for key, records in previous.items()
+            if any(_failed_scope(record, account_errors, region_errors) for record in records)
+        }
+        for (account_id, resource_id), records in grouped.items():
+            update_state(state, check, account_id, {resource_id: records})
+        if account_errors or region_errors:
+            failed = multi_account.describe_failures(region_errors, account_errors)
+            logging.error(f"Scan of {check} incomplete – failed: {', '.join(failed)}; their stored results are kept")
+            failures.append(f"{check}: {', '.join(failed)}")
+        else:
+            state.setdefault("scanned_at", {})[check] = datetime.now(timezone.utc).isoformat()
+        logging.info(f"Scanned {check}: {len(state['violations'][check])} non-compliant resources")
+    return failures
+
+
+def rescan_aging_checks(state, threshold_days=DEFAULT_KEY_THRESHOLD_DAYS, rescan_hours=DEFAULT_RESCAN_HOURS):
+    """Full scan of every AGING_CHECKS check last scanned more than `rescan_hours` ago.
+
+    Returns (whether a scan ran, failures as from `seed_state`); other scan errors propagate.
+    """
+    cutoff = datetime.now(timezone.utc) - timedelta(hours=rescan_hours)
+    scanned_at = state.get("scanned_at", {})
+    due = [
+        check for check in AGING_CHECKS
+        if check not in scanned_at or datetime.fromisoformat(scanned_at[check]) < cutoff
+    ]
+    if not due:
+        return False, []
+    logging.info(f"Re-scanning {', '.join(due)}: violations also change with time, not only with events")
+    return True, seed_state(state, threshold_days, due)
+
+
+def scanned_accounts():
+    """Accounts whose events are evaluated: the --accounts selection, else the default credentials' account."""
+    if multi_account.enabled():
+        return set(multi_account.resolve_accounts(multi_account.selected_accounts()))
+    return {get_account_id()}
+
+
+def process_messages(messages, state, threshold_days=DEFAULT_KEY_THRESHOLD_DAYS, accounts=None):
+    """Evaluate the resources touched by a batch of SQS messages.
+
+    Returns (receipt handles safe to delete, number of failed evaluations).
+    Messages that are not relevant CloudTrail events (including events of
+    accounts outside `accounts`) are deleted as well.
+    """
+    groups = defaultdict(lambda: (set(), set()))  # (check, account, region) -> (resources, message indexes)
+    for index, message in enumerate(messages):
+        try:
+            targets = event_targets(parse_event(message["Body"]), accounts)
+        except (ValueError, AttributeError) as error:
+            logging.warning(f"Skipping unreadable message {message.get('MessageId')}: {error}")
+            continue
+        for check, account_id, region, resource_id in targets:
+            resources, indexes = groups[(check, account_id, region)]
+            resources.add(resource_id)
+            indexes.add(index)
+
+    failed_messages = set()
+    failures = 0
+    for (check, account_id, region), (resources, indexes) in groups.items():
+        try:
+            with multi_account.account_context(account_id):
+                results = EVALUATORS[check](region, resources, threshold_days)
+        except Exception as e:
+            logging.error(f"Re-evaluating {check} for {sorted(resources)} failed: {str(e)}")
+            failed_messages |= indexes
+            failures += 1
+            continue
+        update_state(state, check, account_id, results)
+        logging.info(f"Re-evaluated {check} for {len(resources)} resource(s) in {region or 'global'}")
+
+    state["events_processed"] = state.get("events_processed", 0) + len(messages) - len(failed_messages)
+    handles = [message["ReceiptHandle"] for index, message in enumerate(messages) if index not in failed_messages]
+    return handles, failures
+
+
+def delete_messages(sqs, queue_url, handles):
+    """Delete processed messages; return the number SQS failed to delete (they are logged and redelivered)."""
+    if not handles:
+        return 0
+    response = sqs.delete_message_batch(
+        QueueUrl=queue_url,
+        Entries=[{"Id": str(i), "ReceiptHandle": handle} for i, handle in enumerate(handles)],
+    )
+    failed = response.get("Failed", [])
+    for entry in failed:
+        # Redelivered and evaluated again, which is harmless: evaluations replace the stored result
+        logging.warning(
+            f"Could not delete message {entry.get('Id')} ({entry.get('Code')}: {entry.get('Message')}); "
+            "it will be redelivered"
+        )
+    return len(failed)
+
+
+def consume(queue_url, state_file=DEFAULT_STATE_FILE, threshold_days=DEFAULT_KEY_THRESHOLD_DAYS,
+            wait_seconds=WAIT_SECONDS, once=False, seed=False, rescan_hours=DEFAULT_RESCAN_HOURS):
+    """Long-poll the queue and keep the result set current; return (state, failed evaluations)."""
+    sqs = get_client("sqs")
+    state = load_state(state_file)
+    accounts = scanned_accounts()
+    failures = 0
+    if seed:
+        failures += len(seed_state(state, threshold_days))
+        save_state(state, state_file)
+    while True:
+        try:
+            # An incomplete rescan is retried on the next iteration (its scanned_at was not advanced)
+            rescanned, rescan_failures = rescan_aging_checks(state, threshold_days, rescan_hours)
+            failures += len(rescan_failures)
+            if rescanned:
+                save_state(state, state_file)
+        except Exception as e:
+            # Retried on the next iteration; the stored results stay as they were
+            logging.error(f"Periodic re-scan failed: {str(e)}")
+            failures += 1
+        messages = sqs.receive_message(
+            QueueUrl=queue_url, MaxNumberOfMessages=MAX_MESSAGES, WaitTimeSeconds=wait_seconds
+        ).get("Messages", [])
+        if not messages:
+            if once:
+                return state, failures
+            continue
+        handles, batch_failures = process_messages(messages, state, threshold_days, accounts)
+        failures += batch_failures
+        save_state(state, state_file)
+        delete_messages(sqs, queue_url, handles)
+
+
+def parse_wait_seconds(value):
+    """argparse type for --wait-seconds: an SQS long-poll wait of MIN_WAIT_SECONDS..WAIT_SECONDS."""
+    try:
+        seconds = int(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"expected a number of seconds, got {value!r}") from None
+    if not MIN_WAIT_SECONDS <= seconds <= WAIT_SECONDS:
+        raise argparse.ArgumentTypeError(
+            f"must be between {MIN_WAIT_SECONDS} and {WAIT_SECONDS} (0 would busy-poll the queue), got {seconds}"
+        )
+    return seconds
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Re-evaluate controls from a CloudTrail event queue (SQS).")
+    parser.add_argument("--queue-url", required=True, help="SQS queue receiving CloudTrail management events.")
+    parser.add_argument(
+        "--state-file",
+        default=DEFAULT_STATE_FILE,
+        help=f"Persisted result set (default: {DEFAULT_STATE_FILE}).",
+    )
+    parser.add_argument("--seed", action="store_true", help="Run one full scan of every check first.")
+    parser.add_argument("--once", action="store_true", help="Stop when the queue is empty (CI, cron).")
+    parser.add_argument(
+        "--wait-seconds",
+        type=parse_wait_seconds,
+        default=WAIT_SECONDS,
+        help=f"SQS long-poll wait, {MIN_WAIT_SECONDS}-{WAIT_SECONDS} (default: {WAIT_SECONDS}).",
+    )
+    parser.add_argument(
+        "--rescan-hours",
+        type=float,
+        default=DEFAULT_RESCAN_HOURS,
+        help=f"Re-run the access-key check as a full scan this often, since keys become unused without "
+             f"any event (default: {DEFAULT_RESCAN_HOURS}).",
+    )
+    parser.add_argument(
+        "--key-threshold-days",
+        type=int,
+        default=DEFAULT_KEY_THRESHOLD_DAYS,
+        help=f"Access keys unused for this many days are violations (default: {DEFAULT_KEY_THRESHOLD_DAYS}).",
+    )
+    add_common_options(parser)
+    return parser.parse_args(argv)
+
+
+def run(args):
+    if args.shard:
+        logging.error("--shard is not supported: the consumer keeps one result set for the whole estate")
+        return 1
+    apply_common_options(args)
+    start = time.perf_counter()
+    try:
+        state, failures = consume(
+            args.queue_url, args.state_file, args.key_threshold_days, args.wait_seconds, args.once, args.seed,
+            args.rescan_hours,
+        )
+    except KeyboardInterrupt:
+        state, failures = load_state(args.state_file), 0
+    except Exception as e:
+        logging.error(f"Event consumer failed: {str(e)}")
+        return 1
+    open_violations = sum(len(resources) for resources in state["violations"].values())
+    logging.info(
+        f"Processed {state.get('events_processed', 0)} events in total; {open_violations} non-compliant "
+        f"resources; completed in {time.perf_counter() - start:.2f} seconds"
+    )
+    if open_violations:
+        return 2
+    return 1 if failures else 0
+
+
+def main(argv=None):
+    sys.exit(run(parse_args(argv)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,297 @@
+"""
+Streaming Evidence Writer
+-------------------------
+Shared report writer for every check. The old pattern built a list of dicts,
+then a pandas DataFrame, then called `df.to_excel`, which keeps three copies
+of the data in memory and uses openpyxl's slow normal mode.
+
+`write_report` takes any iterable of records or row dicts (ideally the scanner's
+generator) and writes each row straight to the selected formats, so peak
+memory does not grow with the row count:
+
+- `xlsx`: openpyxl write-only (streaming) workbook, the default;
+- `csv` and `jsonl`: plain streaming text files, for SIEM and data lake ingest;
+- `parquet`: columnar file written in row groups (needs pyarrow).
+
+Several formats can be written in one pass (`configure(["xlsx", "csv"])`,
+normally via the shared `--format` option); each gets the report's file name
+with its own extension. Only the xlsx writer imports openpyxl.
+
+Metadata columns keep the layout auditors are used to, in every format:
+- constant columns such as `report_generated_at` are appended to every row;
+- a totals column (e.g. `total_buckets_found`) repeats the row count. When the
+  caller cannot supply the count up front, rows are spooled to a temporary
+  file on disk while counting and then replayed, which keeps memory flat.
+
+`write_report_sheets` writes several such sheets into one report. Sheets are
+written in order, so a later sheet's rows may depend on an earlier sheet's
+generator having run (e.g. drill-down rows for the rules just written). In
+the flat formats every sheet after the first goes to `<name>_<sheet>.<ext>`.
+"""
+import csv
+import json
+import logging
+import os
+import pickle
+import tempfile
+from datetime import date, datetime
+
+from records import Record
+
+FORMATS = ("xlsx", "csv", "jsonl", "parquet")
+DEFAULT_FORMATS = ("xlsx",)
+PARQUET_ROW_GROUP = 10000
+
+_formats = list(DEFAULT_FORMATS)
+
+
+def configure(formats=None):
+    """Select the output formats for every report written from now on."""
+    formats = list(dict.fromkeys(formats or DEFAULT_FORMATS))
+    unknown = set(formats) - set(FORMATS)
+    if unknown:
+        raise ValueError(f"unknown report format(s): {', '.join(sorted(unknown))}")
+    _formats[:] = formats
+
+
+def _excel_value(value):
+    """Excel cannot store timezone-aware datetimes; drop tzinfo (keeps wall time)."""
+    if isinstance(value, datetime) and value.tzinfo is not None:
+        return value.replace(tzinfo=None)
+    return value
+
+
+def _text_value(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    return value
+
+
+def _spool(rows):
+    """Count rows by pickling them to a temp file; return (count, replay generator)."""
+    spool = tempfile.TemporaryFile()
+    count = 0
+    for row in rows:
+        pickle.dump(row, spool, protocol=pickle.HIGHEST_PROTOCOL)
+        count += 1
+    spool.seek(0)
+
+    def replay():
+        with spool:
+            while True:
+                try:
+                    yield pickle.load(spool)
+                except EOFError:
+                    return
+
+    return count, replay()
+
+
+class _XlsxSheet:
+    def __init__(self, workbook, sheet_name, header):
+        self.ws = workbook.create_sheet(sheet_name)
+        self.ws.append(header)
+
+    def append(self, values):
+        self.ws.append([_excel_value(value) for value in values])
+
+    def close(self):
+        pass
+
+
+class _CsvFile:
+    def __init__(self, path, header):
+        self.fh = open(path, "w", newline="", encoding="utf-8")
+        self.writer = csv.writer(self.fh)
+        self.writer.writerow(header)
+
+    def append(self, values):
+        self.writer.writerow([_text_value(value) for value in values])
+
+    def close(self):
+        self.fh.close()
+
+
+class _JsonlFile:
+    def __init__(self, path, header):
+        self.fh = open(path, "w", encoding="utf-8")
+        self.header = header
+
+    def append(self, values):
+        record = {key: _text_value(value) for key, value in zip(self.header, values)}
+        self.fh.write(json.dumps(record, default=str) + "\n")
+
+    def close(self):
+        self.fh.close()
+
+
+class _ParquetFile:
+    """Buffers rows column-wise and writes a row group every PARQUET_ROW_GROUP rows.
+
+    Column types come from the first non-empty value seen in the first row
+    group; values that do not fit (and columns with no sample) are written as
+    strings.
+    """
+
+    def __init__(self, path, header):
+        try:
+            import pyarrow.parquet  # noqa: F401  Imported lazily: only parquet output needs it
+        except ImportError as e:
+            raise RuntimeError("parquet output needs pyarrow (pip install pyarrow)") from e
+        self.path = path
+        self.header = header
+        self.columns = [[] for _ in header]
+        self.schema = None
+        self.writer = None
+
+    def append(self, values):
+        for column, value in zip(self.columns, values):
+            column.append(value)
+        if len(self.columns[0]) >= PARQUET_ROW_GROUP:
+            self._flush()
+
+    def _infer_schema(self):
+        import pyarrow as pa
+
+        fields = []
+        for name, column in zip(self.header, self.columns):
+            sample = next((value for value in column if value is not None), None)
+            if isinstance(sample, bool):
+                kind = pa.bool_()
+            elif isinstance(sample, int):
+                kind = pa.int64()
+            elif isinstance(sample, float):
+                kind = pa.float64()
+            elif isinstance(sample, datetime):
+                kind = pa.timestamp("us", tz="UTC" if sample.tzinfo else None)
+            else:
+                kind = pa.string()
+            fields.append(pa.field(name, kind))
+        return pa.schema(fields)
+
+    def _flush(self):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        if self.schema is None:
+            self.schema = self._infer_schema()
+            self.writer = pq.ParquetWriter(self.path, self.schema)
+        if self.columns[0]:
+            arrays = []
+            for field, column in zip(self.schema, self.columns):
+                if pa.types.is_string(field.type):
+                    column = [None if value is None else str(_text_value(value)) for value in column]
+                arrays.append(pa.array(column, type=field.type))
+            self.writer.write_table(pa.Table.from_arrays(arrays, schema=self.schema))
+        self.columns = [[] for _ in self.header]
+
+    def close(self):
+        self._flush()
+        self.writer.close()
+
+
+_FILE_WRITERS = {"csv": _CsvFile, "jsonl": _JsonlFile, "parquet": _ParquetFile}
+
+
+def _output_path(filename, fmt, sheet_index=0, sheet_name=None):
+    root = os.path.splitext(str(filename))[0]
+    if fmt != "xlsx" and sheet_index:
+        root = f"{root}_{sheet_name}"
+    return f"{root}.{fmt}"
+
+
+def write_report(rows, filename, sheet_name, columns, metadata=None, total_column=None, total=None):
+    """Stream rows into the report, in every configured format.
+
+    Args:
+        rows (iterable): Records (see `records`) or row dicts; missing
+            fields are left blank.
+        filename (str): Report path (.xlsx); the extension is replaced per format.
+        sheet_name (str): Worksheet title.
+        columns (list): Data columns, in order.
+        metadata (dict): Constant columns appended to every row,
+            e.g. {"report_generated_at": "2024-01-01 00:00:00"}.
+        total_column (str): Optional column holding the total row count.
+        total (int): Row count for `total_column` if already known;
+            otherwise rows are spooled to disk to count them first.
+
+    Returns:
+        int: Number of data rows written.
+    """
+    sheet = dict(
+        rows=rows,
+        sheet_name=sheet_name,
+        columns=columns,
+        metadata=metadata,
+        total_column=total_column,
+        total=total,
+    )
+    return write_report_sheets(filename, [sheet])[0]
+
+
+def _write_sheet(writers, rows, columns, metadata=None, total_column=None, total=None):
+    metadata = metadata or {}
+    if total_column and total is None:
+        total, rows = _spool(rows)
+
+    header = list(columns) + list(metadata)
+    trailer = list(metadata.values())
+    if total_column:
+        header.append(total_column)
+        trailer.append(total)
+
+    outputs = [open_writer(header) for open_writer in writers]
+    written = 0
+    try:
+        for row in rows:
+            if isinstance(row, Record):
+                values = row.values_for(columns) + trailer
+            else:
+                values = [row.get(column) for column in columns] + trailer
+            for output in outputs:
+                output.append(values)
+            written += 1
+    finally:
+        for output in outputs:
+            output.close()
+    return written
+
+
+def write_report_sheets(filename, sheets):
+    """Stream several sheets into one report, in every configured format.
+
+    Args:
+        filename (str): Report path (.xlsx); the extension is replaced per format.
+        sheets (list): One dict per sheet with the keyword arguments of
+            `write_report` (rows, sheet_name, columns, metadata,
+            total_column, total).
+
+    Returns:
+        list: Number of data rows written to each sheet.
+    """
+    workbook = None
+    if "xlsx" in _formats:
+        # Imported lazily so gate-only and non-Excel runs never load openpyxl
+        from openpyxl import Workbook
+
+        workbook = Workbook(write_only=True)
+
+    paths = [_output_path(filename, "xlsx")] if workbook is not None else []
+    written = []
+    for index, sheet in enumerate(sheets):
+        sheet = dict(sheet)
+        sheet_name = sheet.pop("sheet_name")
+        writers = []
+        for fmt in _formats:
+            if fmt == "xlsx":
+                writers.append(lambda header, name=sheet_name: _XlsxSheet(workbook, name, header))
+            else:
+                path = _output_path(filename, fmt, index, sheet_name)
+                writers.append(lambda header, cls=_FILE_WRITERS[fmt], path=path: cls(path, header))
+                paths.append(path)
+        written.append(_write_sheet(writers, **sheet))
+
+    if workbook is not None:
+        workbook.save(_output_path(filename, "xlsx"))
+    logging.info(f"Report saved: {', '.join(paths)} ({sum(written)} rows)")
+    return written
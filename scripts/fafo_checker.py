@@ -12,19 +12,46 @@ Purpose
 
 Why each import is necessary
 ---------------------------
-- **boto3** – AWS SDK to query IAM API.
-- **pandas** – Build tabular report and export to XLSX.
+- **boto3** (via `aws_clients`) – AWS SDK to query IAM API.
+- **evidence_writer** – Stream the report into XLSX with openpyxl's write-only
+  mode (imported lazily, so `--no-report` gate runs never load openpyxl).
 - **logging** – Persist evidence of the run (who, when, result).
 - **datetime** – Timestamping for audit trails.
 - **sys** – Exit codes for CI pipelines.
+- **argparse** – `--credential-report` switch for the bulk IAM path.
+
+Modes
+-----
+By default every user is checked with `list_mfa_devices` (one call per user).
+`--credential-report` answers the check from a single IAM credential report
+and only falls back to `list_mfa_devices` for rows the report cannot resolve.
 """
 
-import boto3
-import pandas as pd
+import argparse
 import logging
 from datetime import datetime
 import sys
 
+from botocore.exceptions import ClientError
+
+import controls
+import history_store
+import multi_account
+import rate_limiter
+import sharding
+import response_cache
+from aws_clients import get_client
+from cli_options import add_common_options, apply_common_options
+from evidence_writer import write_report
+from iam_credential_report import (
+    count_api_calls,
+    current_users,
+    fetch_credential_report,
+    iter_credential_report,
+    parse_report_date,
+)
+from records import UserRecord
+
 # Configure logging: writes BOTH to console and a file `fafo_audit.log`.
 logging.basicConfig(
     level=logging.INFO,
@@ -35,84 +62,204 @@ logging.basicConfig(
     ]
 )
 
+REPORT_COLUMNS = list(UserRecord.FIELDS)
+# Facts collected per user before the MFA control is evaluated
+INVENTORY_COLUMNS = ["user_name", "user_arn", "create_date", "mfa_devices"]
 
-def list_users_without_mfa():
-    """Return a list of IAM users that have *zero* MFA devices."""
-    iam = boto3.client("iam")
+
+def _user_record(user_name, user_arn, create_date):
+    """Shape a non-compliant user for the Excel report."""
+    return UserRecord(user_name, user_arn, create_date, create_date.strftime("%Y-%m-%d %H:%M:%S"))
+
+
+def _inventory_row(user, mfa_devices):
+    """Fact row (INVENTORY_COLUMNS) for a `list_users` / `get_user` entry."""
+    return {
+        "user_name": user["UserName"],
+        "user_arn": user["Arn"],
+        "create_date": user["CreateDate"],
+        "mfa_devices": mfa_devices,
+    }
+
+
+def _users_failing_controls(rows):
+    """Evaluate the built-in iam_users controls (`controls.DEFAULT_CONTROLS`); return the failing users."""
+    failing = controls.evaluate_rows(rows, INVENTORY_COLUMNS, controls.builtin_controls("iam_users"))
+    return [_user_record(row["user_name"], row["user_arn"], row["create_date"]) for row, _ in failing]
+
+
+def user_without_mfa(iam, user_name):
+    """Single-user path (event consumer): the user's record if it fails the MFA control, else None.
+
+    A user that no longer exists is not a violation and also returns None.
+    """
+    try:
+        user = rate_limiter.call(iam, "get_user", UserName=user_name)["User"]
+    except ClientError as error:
+        if error.response.get("Error", {}).get("Code") == "NoSuchEntity":
+            return None
+        raise
+    failing = _users_failing_controls([_inventory_row(user, _mfa_device_count(iam, user))])
+    return failing[0] if failing else None
+
+
+def _mfa_device_count(iam, user):
+    logging.debug(f"Checking MFA for user: {user['UserName']}")
+    mfa_response = rate_limiter.call(iam, "list_mfa_devices", UserName=user["UserName"])
+    return len(mfa_response["MFADevices"])
+
+
+def user_inventory(iam):
+    """Per-user path: one fact row per IAM user (INVENTORY_COLUMNS), nothing evaluated.
+
+    One `list_mfa_devices` call per user; the calls fan out through
+    `rate_limiter`, which adapts concurrency to IAM throttling and retries
+    throttled calls.
+    """
     paginator = iam.get_paginator("list_users")
-    users_no_mfa = []
 
     logging.info("Fetching IAM user list via pagination …")
+    users = [user for page in paginator.paginate() for user in page["Users"]]
+    # With --shard, only this shard's users are looked up
+    users = sharding.select(users, key=lambda user: user["UserName"])
+
+    counts = rate_limiter.fan_out(lambda user: _mfa_device_count(iam, user), users, iam)
+    return [_inventory_row(user, count) for user, count in zip(users, counts)]
+
+
+def _users_without_mfa_per_user(iam):
+    """Per-user path: evaluate the MFA control over `user_inventory`."""
+    return _users_failing_controls(user_inventory(iam))
+
+
+def _users_without_mfa_from_report(iam):
+    """Bulk path: read `mfa_active` from the credential report.
+
+    Rows whose `mfa_active` value is missing or unexpected fall back to
+    `list_mfa_devices` for that user only, as do users created after the
+    report was generated (absent from it). The rows are then evaluated like
+    the per-user inventory.
+    """
+    logging.info("Fetching IAM credential report …")
+    users = current_users(iam)
+    rows = []
+    fallbacks = 0
+
+    for row in iter_credential_report(fetch_credential_report(iam)):
+        user_name = row["user"]
+        # Users deleted since the report was generated are not violations
+        if user_name not in users or not sharding.owns(user_name):
+            continue
+        mfa_active = row.get("mfa_active")
+        if mfa_active in ("true", "false"):
+            # The report only says whether MFA is active: 1 stands for "at least one device"
+            mfa_devices = int(mfa_active == "true")
+        else:
+            fallbacks += 1
+            logging.debug(f"Credential report cannot resolve MFA for {user_name} – querying directly")
+            mfa_devices = _mfa_device_count(iam, users[user_name])
+        rows.append({
+            "user_name": user_name,
+            "user_arn": row["arn"],
+            "create_date": parse_report_date(row["user_creation_time"]),
+            "mfa_devices": mfa_devices,
+        })
+
+    reported = {row["user_name"] for row in rows}
+    missing = sharding.select(
+        (user for user_name, user in users.items() if user_name not in reported), key=lambda user: user["UserName"]
+    )
+    if missing:
+        logging.info(f"{len(missing)} users are newer than the credential report – checking their MFA directly")
+        counts = rate_limiter.fan_out(lambda user: _mfa_device_count(iam, user), missing, iam)
+        rows.extend(_inventory_row(user, count) for user, count in zip(missing, counts))
+
+    if fallbacks:
+        logging.info(f"Per-user MFA fallback used for {fallbacks} report rows")
+    return _users_failing_controls(rows)
+
+
+def list_users_without_mfa(use_credential_report: bool = False):
+    """Return a list of IAM users that have *zero* MFA devices."""
+    iam = get_client("iam")
+    mode = "credential-report" if use_credential_report else "per-user"
 
     try:
-        for page in paginator.paginate():
-            for user in page["Users"]:
-                user_name = user["UserName"]
-                logging.debug(f"Checking MFA for user: {user_name}")
-
-                mfa_response = iam.list_mfa_devices(UserName=user_name)
-                if len(mfa_response["MFADevices"]) == 0:
-                    # Record non-compliant user details
-                    users_no_mfa.append(
-                        {
-                            "user_name": user_name,
-                            "user_arn": user["Arn"],
-                            "create_date": user["CreateDate"],
-                            "create_date_str": user["CreateDate"].strftime("%Y-%m-%d %H:%M:%S"),
-                        }
-                    )
+        with count_api_calls(iam) as api_calls:
+            if use_credential_report:
+                users_no_mfa = _users_without_mfa_from_report(iam)
+            else:
+                users_no_mfa = _users_without_mfa_per_user(iam)
 
         logging.info(f"Total IAM users without MFA: {len(users_no_mfa)}")
+        logging.info(f"IAM API calls ({mode} mode): {sum(api_calls.values())} {dict(api_calls)}")
         return users_no_mfa
 
     except Exception as error:
+        # Re-raise: an empty list here would read as "all users compliant"
         logging.error(f"Failed to evaluate MFA status: {error}")
-        return []
-
-
-def export_excel(data: list, filename: str = "iam_users_without_mfa.xlsx"):
-    """Export list of dicts to an Excel file with pandas/openpyxl."""
-    # DataFrame construction – safe even if list is empty.
-    df = pd.DataFrame(data)
-
-    if df.empty:
-        logging.warning("No non-compliant users found – Excel will contain headers only.")
-        df = pd.DataFrame(columns=[
-            "user_name",
-            "user_arn",
-            "create_date",
-            "create_date_str",
-            "report_generated_at",
-            "total_non_compliant_users",
-        ])
-    else:
-        # Remove timezone from datetimes (Excel limitation)
-        df["create_date"] = pd.to_datetime(df["create_date"]).dt.tz_localize(None)
-
-    # Add metadata columns
-    df["report_generated_at"] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    df["total_non_compliant_users"] = len(data)
-
-    # Write to Excel
-    df.to_excel(filename, index=False, sheet_name="IAM_Users_No_MFA")
-    logging.info(f"Excel report saved: {filename}")
-
-
-def main():
+        raise
+
+
+def export_excel(data, filename: str = "iam_users_without_mfa.xlsx"):
+    """Stream non-compliant users into the evidence file(s) selected with --format."""
+    written = write_report(
+        data,
+        filename,
+        sheet_name="IAM_Users_No_MFA",
+        columns=multi_account.report_columns(REPORT_COLUMNS),
+        # Add metadata columns
+        metadata={"report_generated_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S")},
+        total_column="total_non_compliant_users",
+        total=len(data) if isinstance(data, list) else None,
+    )
+    if not written:
+        logging.warning("No non-compliant users found – Excel contains headers only.")
+    return written
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Flag IAM users without MFA.")
+    parser.add_argument(
+        "--credential-report",
+        action="store_true",
+        help="Answer the check from one IAM credential report instead of per-user calls.",
+    )
+    add_common_options(parser)
+    return parser.parse_args(argv)
+
+
+def run(args):
+    """Run the check, write the report and return the CI exit code."""
+    apply_common_options(args)
     logging.info("=== Starting FAFO MFA Compliance Check ===")
     start = datetime.now()
 
-    users_no_mfa = list_users_without_mfa()
-    export_excel(users_no_mfa)
+    account_errors = {}
+    try:
+        users_no_mfa = multi_account.collect(
+            lambda: list_users_without_mfa(use_credential_report=args.credential_report), account_errors
+        )
+    except Exception:
+        return 1
+    rate_limiter.log_metrics("iam")
+    # Exit code 0 if compliant, 2 if violations found (convention for CI pipelines);
+    # accounts that could not be scanned must not pass as compliant
+    exit_code = 2 if users_no_mfa else (1 if account_errors else 0)
+    if sharding.enabled():
+        sharding.write_partial("iam_mfa", exit_code, {"users": users_no_mfa}, complete=not account_errors)
+    elif not args.no_report:
+        export_excel(users_no_mfa)
+    history_store.record_run("iam_mfa", users_no_mfa, "user_name", complete=not account_errors)
 
     duration = (datetime.now() - start).total_seconds()
-    logging.info(f"Completed in {duration:.2f} seconds")
+    logging.info(f"Completed in {duration:.2f} seconds{response_cache.stats_summary()}")
     logging.info("=== FAFO Compliance Check Complete ===")
+    return exit_code
+
 
-    # Exit code 0 if compliant, 2 if violations found (convention for CI pipelines)
-    if users_no_mfa:
-        sys.exit(2)
-    sys.exit(0)
+def main(argv=None):
+    sys.exit(run(parse_args(argv)))
 
 
 if __name__ == "__main__":
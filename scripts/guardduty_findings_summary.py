@@ -2,98 +2,413 @@
 """
 GuardDuty Findings Summary
 -------------------------
-This Week-3 extension collects active GuardDuty findings, groups them by severity,
-and exports a summary Excel report for auditors.
+This Week-3 extension collects active GuardDuty findings from every enabled
+region, groups them by severity, and exports a summary Excel report for auditors.
+Findings are streamed straight into per-severity counters, so memory use does
+not grow with the number of findings.
+
+`--incremental` keeps a per-detector `updatedAt` high-water mark and a rolling
+24h finding set in a local state file, so scheduled runs only download what
+changed since the previous run while the summary covers the same window.
+
+`--min-severity High` pushes a severity criterion into `list_findings`, so
+findings below the gate are never listed or downloaded; `--regions` limits the
+regions scanned.
 
 Why each import is necessary:
-- **boto3**: AWS SDK to query GuardDuty detectors and findings.
-- **pandas**: Build tabular report and export to Excel.
+- **boto3** (via `aws_clients`): AWS SDK to query GuardDuty detectors and findings.
+- **pandas**: `summarise_findings` DataFrame for interactive use (imported lazily).
+- **evidence_writer**: Streams the summary into the report formats chosen with --format.
 - **logging**: Persist audit trail.
 - **datetime**: Timestamping and 24-hour cutoff.
 - **sys**: Exit codes for CI pipelines.
+- **collections / concurrent.futures**: Severity counters and the batch fetch pool.
+- **argparse**: `--max-workers` tuning.
 """
-import boto3
-import pandas as pd
+import argparse
+import json
 import logging
-from datetime import datetime, timedelta
+import os
+from collections import Counter
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from datetime import datetime, timedelta, timezone
 import sys
 
+import history_store
+import multi_account
+import sharding
+from aws_clients import get_client
+from cli_options import add_common_options, apply_common_options
+from evidence_writer import write_report
+from records import SeverityCount, to_frame
+
 logging.basicConfig(
     level=logging.INFO,
     format="%(asctime)s - %(levelname)s - %(message)s",
     handlers=[logging.FileHandler("guardduty_audit.log"), logging.StreamHandler()],
 )
 
-def get_active_detector_ids():
-    """Return list of GuardDuty detector IDs in the account/region."""
-    gd = boto3.client("guardduty")
-    response = gd.list_detectors()
-    return response.get("DetectorIds", [])
-
-def fetch_findings(detector_id):
-    """Fetch findings from the given detector created in the last 24h."""
-    gd = boto3.client("guardduty")
-    start_time = (datetime.utcnow() - timedelta(days=1)).strftime("%Y-%m-%dT%H:%M:%SZ")
-    finding_ids = gd.list_findings(
+# get_findings accepts at most 50 finding IDs per request.
+GET_FINDINGS_BATCH = 50
+DEFAULT_MAX_WORKERS = 8
+# Upper bound (inclusive) of each severity band, matching the GuardDuty console.
+SEVERITY_BANDS = [(3.9, "Low"), (6.9, "Medium"), (8.9, "High"), (10, "Critical")]
+# Lowest severity of each band, for the server-side severity criterion
+SEVERITY_FLOORS = {"Low": 0, "Medium": 4, "High": 7, "Critical": 9}
+WINDOW = timedelta(days=1)
+DEFAULT_STATE_FILE = "guardduty_state.json"
+
+def _epoch_ms(moment):
+    return int(moment.timestamp() * 1000)
+
+def window_start_ms():
+    """Start of the 24h summary window, in epoch milliseconds."""
+    return _epoch_ms(datetime.now(timezone.utc) - WINDOW)
+
+def get_enabled_regions():
+    """Return the regions enabled for this account."""
+    ec2 = get_client("ec2")
+    return [region["RegionName"] for region in ec2.describe_regions()["Regions"]]
+
+def get_active_detector_ids(gd):
+    """Return list of GuardDuty detector IDs in the client's region."""
+    detector_ids = []
+    for page in gd.get_paginator("list_detectors").paginate():
+        detector_ids.extend(page.get("DetectorIds", []))
+    return detector_ids
+
+def finding_criteria(since_ms, min_severity=0):
+    """`FindingCriteria` for findings updated since `since_ms` with severity >= `min_severity`."""
+    criterion = {
+        "updatedAt": {
+            "Gte": since_ms
+        }
+    }
+    if min_severity:
+        criterion["severity"] = {"GreaterThanOrEqual": min_severity}
+    return {"Criterion": criterion}
+
+def iter_finding_id_batches(gd, detector_id, since_ms=None, min_severity=0):
+    """Yield finding IDs updated since `since_ms` (default: last 24h), one page (<= 50 IDs) at a time.
+
+    GuardDuty compares `updatedAt` criteria in epoch milliseconds. Findings
+    below `min_severity` are filtered out by the API.
+    """
+    if since_ms is None:
+        since_ms = window_start_ms()
+    paginator = gd.get_paginator("list_findings")
+    pages = paginator.paginate(
         DetectorId=detector_id,
-        FindingCriteria={
-            "Criterion": {
-                "updatedAt": {
-                    "Gte": int((datetime.utcnow() - timedelta(days=1)).timestamp())
-                }
-            }
-        },
-    )["FindingIds"]
-    if not finding_ids:
-        return []
-    findings = gd.get_findings(DetectorId=detector_id, FindingIds=finding_ids)["Findings"]
-    return findings
+        FindingCriteria=finding_criteria(since_ms, min_severity),
+        PaginationConfig={"PageSize": GET_FINDINGS_BATCH},
+    )
+    for page in pages:
+        finding_ids = page["FindingIds"]
+        for start in range(0, len(finding_ids), GET_FINDINGS_BATCH):
+            yield finding_ids[start:start + GET_FINDINGS_BATCH]
+
+def fetch_findings(gd, detector_id, since_ms=None, min_severity=0):
+    """Yield findings from one detector updated in the last 24h (or since `since_ms`).
+
+    `list_findings` is paginated and details are requested in 50-ID batches,
+    so busy detectors are covered completely without exceeding the API cap.
+    """
+    for finding_ids in iter_finding_id_batches(gd, detector_id, since_ms, min_severity):
+        if finding_ids:
+            yield from gd.get_findings(DetectorId=detector_id, FindingIds=finding_ids)["Findings"]
+
+def iter_all_findings(regions=None, max_workers=DEFAULT_MAX_WORKERS, region_errors=None, since=None, min_severity=0):
+    """Yield findings (severity >= `min_severity`) from every detector in every region.
+
+    `since` optionally maps "region/detector_id" to an epoch-ms lower bound
+    for `updatedAt` (see `cursor_key`); detectors not in it use the 24h window.
+
+    One shared client is used per region. Finding IDs are listed page by page and
+    each 50-ID batch is fetched on a thread pool; at most `2 * max_workers`
+    batches are in flight, so memory stays flat however many findings exist.
+    Regions that fail are logged and recorded in `region_errors`
+    ((account_id, region) -> error message, see `multi_account.region_key`).
+    """
+    if regions is None:
+        regions = get_enabled_regions()
+    # With --shard, this runner reads only its share of the regions
+    regions = sharding.select_regions(regions)
+    if region_errors is None:
+        region_errors = {}
+    since = since or {}
+    clients = {
+        region: get_client("guardduty", region, max_pool_connections=max_workers)
+        for region in regions
+    }
+    # Resolved here: pool threads do not see the scanned account
+    keys = {region: multi_account.region_key(region) for region in regions}
+
+    def detectors(region):
+        try:
+            return get_active_detector_ids(clients[region])
+        except Exception as e:
+            logging.error(f"Listing detectors in {multi_account.region_name(keys[region])} failed: {str(e)}")
+            region_errors[keys[region]] = str(e)
+            return []
+
+    def fetch_batch(region, detector_id, finding_ids):
+        try:
+            return clients[region].get_findings(DetectorId=detector_id, FindingIds=finding_ids)["Findings"]
+        except Exception as e:
+            logging.error(
+                f"Fetching findings for detector {detector_id} in {multi_account.region_name(keys[region])} "
+                f"failed: {str(e)}"
+            )
+            region_errors[keys[region]] = str(e)
+            return []
+
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        in_flight = set()
+        for region, detector_ids in zip(regions, pool.map(detectors, regions)):
+            gd = clients[region]
+            for detector_id in detector_ids:
+                try:
+                    since_ms = since.get(cursor_key(region, detector_id))
+                    for finding_ids in iter_finding_id_batches(gd, detector_id, since_ms, min_severity):
+                        if not finding_ids:
+                            continue
+                        in_flight.add(pool.submit(fetch_batch, region, detector_id, finding_ids))
+                        if len(in_flight) >= 2 * max_workers:
+                            done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                            for future in done:
+                                yield from future.result()
+                except Exception as e:
+                    logging.error(
+                        f"Listing findings for detector {detector_id} in {multi_account.region_name(keys[region])} "
+                        f"failed: {str(e)}"
+                    )
+                    region_errors[keys[region]] = str(e)
+        for future in in_flight:
+            yield from future.result()
+
+def cursor_key(region, detector_id):
+    """State-file key for one detector."""
+    return f"{region}/{detector_id}"
+
+def finding_cursor_key(finding):
+    """State-file key for the detector that produced `finding` (parsed from its ARN)."""
+    # arn:aws:guardduty:<region>:<account>:detector/<detector_id>/finding/<finding_id>
+    detector_id = finding["Arn"].split(":", 5)[5].split("/")[1]
+    return cursor_key(finding["Region"], detector_id)
+
+def account_state_file(path, account_id=None):
+    """Per-account state file in multi-account mode (guardduty_state.<account>.json)."""
+    if account_id is None:
+        return path
+    root, ext = os.path.splitext(path)
+    return f"{root}.{account_id}{ext}"
+
+def load_state(path):
+    """Load the incremental state: {"region/detector": {"cursor": ms, "findings": {id: [severity, updated_ms]}}}."""
+    if not os.path.exists(path):
+        return {}
+    with open(path) as fh:
+        return json.load(fh)
+
+def save_state(state, path):
+    """Write the state atomically so an interrupted run cannot corrupt it."""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as fh:
+        json.dump(state, fh, separators=(",", ":"))
+    os.replace(tmp_path, path)
+
+def collect_incremental(state, regions=None, max_workers=DEFAULT_MAX_WORKERS, region_errors=None, min_severity=0):
+    """Fetch only findings updated since each detector's high-water mark.
+
+    New findings are merged (by ID) into the stored rolling set, entries older
+    than the 24h window are pruned, and `state` is updated in place. Cursors
+    only advance for regions that completed without errors, so a failed batch
+    is fetched again next run. Returns the number of findings fetched.
+
+    Each detector remembers the `min_severity` its cursor was built with; if a
+    later run asks for a lower one, that detector's window is fetched again.
+    """
+    if region_errors is None:
+        region_errors = {}
+    start_ms = window_start_ms()
+    since = {
+        key: max(entry["cursor"], start_ms)
+        for key, entry in state.items()
+        if entry.get("min_severity", 0) <= min_severity
+    }
+    cursors = {}
+    fetched = 0
+
+    for finding in iter_all_findings(regions, max_workers, region_errors, since=since, min_severity=min_severity):
+        key = finding_cursor_key(finding)
+        entry = state.setdefault(key, {"cursor": start_ms, "findings": {}})
+        updated_ms = _epoch_ms(datetime.fromisoformat(finding["UpdatedAt"].replace("Z", "+00:00")))
+        entry["findings"][finding["Id"]] = [finding["Severity"], updated_ms]
+        cursors[key] = max(cursors.get(key, entry["cursor"]), updated_ms)
+        fetched += 1
+
+    for key, cursor in cursors.items():
+        if multi_account.region_key(key.split("/", 1)[0]) not in region_errors:
+            state[key]["cursor"] = cursor
+            state[key]["min_severity"] = min_severity
+    for key, entry in list(state.items()):
+        entry["findings"] = {
+            finding_id: value for finding_id, value in entry["findings"].items() if value[1] >= start_ms
+        }
+        if not entry["findings"] and entry["cursor"] < start_ms:
+            del state[key]
+    return fetched
+
+def iter_stored_findings(state, min_severity=0):
+    """Yield the rolling 24h set in the shape `count_by_severity` expects."""
+    for entry in state.values():
+        for severity, _ in entry["findings"].values():
+            if severity >= min_severity:
+                yield {"Severity": severity}
+
+def severity_label(severity):
+    """Map a numeric severity to its band label (None outside 0 < severity <= 10)."""
+    if severity <= 0:
+        return None
+    for upper, label in SEVERITY_BANDS:
+        if severity <= upper:
+            return label
+    return None
+
+def count_by_severity(all_findings):
+    """Return a Counter of findings per severity label.
+
+    Accepts any iterable (including the `iter_all_findings` generator) and
+    only keeps per-band counters, so findings are never held in memory.
+    """
+    counts = Counter()
+    for f in all_findings:
+        label = severity_label(f["Severity"])
+        if label:
+            counts[label] += 1
+    return counts
+
+def severity_summary_frame(counts):
+    """Turn severity counters into the report DataFrame (empty when no findings)."""
+    if not counts:
+        import pandas as pd  # imported lazily so gate-only runs never load pandas/openpyxl
+
+        return pd.DataFrame()
+    return to_frame(severity_rows(counts), SeverityCount)
 
 def summarise_findings(all_findings):
     """Return pandas DataFrame summarising by severity."""
-    records = []
-    for f in all_findings:
-        records.append(
-            {
-                "finding_id": f["Id"],
-                "type": f["Type"],
-                "severity": f["Severity"],
-                "title": f["Title"],
-                "region": f["Region"],
-                "created_at": f["CreatedAt"],
-            }
-        )
-    df = pd.DataFrame(records)
-    if df.empty:
-        return df
-    summary = (
-        df.groupby(pd.cut(df["severity"], [0, 3.9, 6.9, 8.9, 10], labels=["Low", "Medium", "High", "Critical"]))
-        .size()
-        .reset_index(name="count")
-    )
-    return summary
+    return severity_summary_frame(count_by_severity(all_findings))
+
+def severity_rows(counts):
+    """Report rows (SeverityCount) for every band; none when there are no findings."""
+    if not counts:
+        return []
+    return [SeverityCount(label, counts[label]) for _, label in SEVERITY_BANDS]
 
-def export_excel(df, filename="guardduty_findings_summary.xlsx"):
-    """Export DataFrame to Excel with openpyxl backend."""
-    if df.empty:
+def merge_severity_rows(rows):
+    """Add up severity rows from several shards (per account with --accounts), in band order."""
+    counts = {}
+    for row in rows:
+        account_counts = counts.setdefault(row.get(multi_account.ACCOUNT_COLUMN), Counter())
+        account_counts[row["severity"]] += row["count"]
+    merged = []
+    for account_id, account_counts in counts.items():
+        for row in severity_rows(+account_counts):  # + drops zero counts, so all-zero accounts get no rows
+            merged.append(multi_account.tag_account(row, account_id) if account_id else row)
+    return merged
+
+def export_excel(rows, filename="guardduty_findings_summary.xlsx"):
+    """Write the severity summary rows to the report (xlsx by default, see --format)."""
+    if not rows:
         logging.info("No recent findings – creating placeholder report")
-        df = pd.DataFrame(columns=["severity", "count"])
-    df["report_generated_at"] = datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S")
-    df.to_excel(filename, index=False, sheet_name="GD_Findings_Summary")
-    logging.info(f"Excel report saved: {filename}")
+    return write_report(
+        rows,
+        filename,
+        sheet_name="GD_Findings_Summary",
+        columns=multi_account.report_columns(list(SeverityCount.FIELDS)),
+        metadata={"report_generated_at": datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S")},
+    )
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Summarise GuardDuty findings from the last 24h.")
+    parser.add_argument(
+        "--max-workers",
+        type=int,
+        default=DEFAULT_MAX_WORKERS,
+        help=f"Concurrent get_findings batches (default: {DEFAULT_MAX_WORKERS}).",
+    )
+    parser.add_argument(
+        "--incremental",
+        action="store_true",
+        help="Fetch only findings updated since the last run and keep a rolling 24h set in --state-file.",
+    )
+    parser.add_argument(
+        "--state-file",
+        default=DEFAULT_STATE_FILE,
+        help=f"Incremental cursor and rolling finding store (default: {DEFAULT_STATE_FILE}).",
+    )
+    parser.add_argument(
+        "--min-severity",
+        choices=list(SEVERITY_FLOORS),
+        default="Low",
+        help="Only fetch findings of this severity band or higher (filtered by the API). Default: Low (all).",
+    )
+    add_common_options(parser)
+    return parser.parse_args(argv)
 
-def main():
+def run(args):
+    """Run the check, write the report and return the CI exit code."""
+    apply_common_options(args)
     logging.info("=== GuardDuty Findings Summary ===")
-    detector_ids = get_active_detector_ids()
-    all_findings = []
-    for det in detector_ids:
-        all_findings.extend(fetch_findings(det))
-    summary_df = summarise_findings(all_findings)
-    export_excel(summary_df)
-
-    non_zero = summary_df["count"].sum() if not summary_df.empty else 0
+    region_errors = {}
+    account_errors = {}
+    min_severity = SEVERITY_FLOORS[args.min_severity]
+
+    def collect_rows():
+        if args.incremental:
+            state_file = account_state_file(args.state_file, multi_account.current_account())
+            if sharding.enabled():
+                # Each shard keeps the cursors of its own regions
+                state_file = sharding.shard_file(state_file)
+            state = load_state(state_file)
+            fetched = collect_incremental(
+                state, args.regions, args.max_workers, region_errors, min_severity=min_severity
+            )
+            save_state(state, state_file)
+            logging.info(f"Incremental fetch: {fetched} new/updated findings since last run")
+            counts = count_by_severity(iter_stored_findings(state, min_severity))
+        else:
+            counts = count_by_severity(iter_all_findings(
+                args.regions, args.max_workers, region_errors, min_severity=min_severity
+            ))
+        return severity_rows(counts)
+
+    # With --accounts: one set of severity rows per account
+    rows = multi_account.collect(collect_rows, account_errors)
+    # One violation per severity band with findings, e.g. control "guardduty", resource "High"
+    history_store.record_run(
+        "guardduty", [row for row in rows if row["count"]], "severity",
+        complete=not (region_errors or account_errors),
+    )
+
+    non_zero = sum(row["count"] for row in rows)
     logging.info(f"Total findings last 24h: {non_zero}")
-    sys.exit(2 if non_zero else 0)
+    exit_code = 2 if non_zero else 0
+    if not non_zero and (region_errors or account_errors):
+        failed = multi_account.describe_failures(region_errors, account_errors)
+        logging.error(f"Scan incomplete – failed: {', '.join(failed)}")
+        exit_code = 1
+    if sharding.enabled():
+        sharding.write_partial(
+            "guardduty", exit_code, {"severity": rows}, complete=not (region_errors or account_errors)
+        )
+    elif not args.no_report:
+        export_excel(rows)
+    return exit_code
+
+def main(argv=None):
+    sys.exit(run(parse_args(argv)))
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,313 @@
+#!/usr/bin/env python3
+"""
+Historical Compliance Store
+---------------------------
+Every check overwrites its report, and the `*_audit.log` files are the only
+history. With `--history` (a common option), each check also appends its
+results to a local SQLite database (`--history-db`, default
+`compliance_history.db`):
+
+- `runs`: one row per check run (check, start time, run date, violation
+  count, whether the scan was complete);
+- `violations`: one row per non-compliant resource per run, with the control,
+  resource id and account.
+
+Rows carry their run date (`YYYY-MM-DD`), and the indexes cover
+(resource, control, account), (run date, control) and (check, run), so
+the trend queries below read only the rows they need. `prune --keep-days`
+drops whole days.
+
+Run this module to query the store:
+
+    python scripts/history_store.py first-seen --resource alice
+    python scripts/history_store.py open --check ec2
+    python scripts/history_store.py daily --days 30
+    python scripts/history_store.py diff --check iam_mfa
+
+`diff` (also logged by every check after it records a run) lists the
+violations that are new or resolved since the check's previous complete run.
+"""
+import argparse
+import json
+import logging
+import sqlite3
+import sys
+import threading
+from contextlib import closing
+from datetime import datetime, timedelta, timezone
+
+DEFAULT_DB = "compliance_history.db"
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    run_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    check_name TEXT NOT NULL,
+    started_at TEXT NOT NULL,
+    run_date TEXT NOT NULL,
+    violations INTEGER NOT NULL,
+    complete INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS violations (
+    run_id INTEGER NOT NULL REFERENCES runs(run_id),
+    run_date TEXT NOT NULL,
+    check_name TEXT NOT NULL,
+    control TEXT NOT NULL,
+    resource_id TEXT NOT NULL,
+    account_id TEXT NOT NULL DEFAULT '',
+    details TEXT
+);
+CREATE INDEX IF NOT EXISTS runs_by_check ON runs (check_name, run_id);
+-- Leads with resource_id so `first-seen --resource` (with or without --control) is an index search;
+-- replaces violations_by_resource (control first), which could only be scanned for that query
+DROP INDEX IF EXISTS violations_by_resource;
+CREATE INDEX IF NOT EXISTS violations_by_resource_id ON violations (resource_id, control, account_id, run_id);
+CREATE INDEX IF NOT EXISTS violations_by_date ON violations (run_date, control);
+CREATE INDEX IF NOT EXISTS violations_by_run ON violations (run_id, control);
+"""
+
+_settings = {"db": None}
+_lock = threading.Lock()
+
+
+def configure(db=None):
+    """Record check results in `db` from now on (None: history off)."""
+    _settings["db"] = db
+
+
+def enabled():
+    return _settings["db"] is not None
+
+
+def connect(db=None):
+    """Open the store (creating the schema on first use)."""
+    connection = sqlite3.connect(db or _settings["db"] or DEFAULT_DB, timeout=30)
+    connection.row_factory = sqlite3.Row
+    connection.executescript(SCHEMA)
+    return connection
+
+
+def _text(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return value
+
+
+def record_run(check, rows, resource_column, control=None, complete=True, db=None, started_at=None):
+    """Append one check run and its violations; return the diff against the previous run.
+
+    Args:
+        check (str): Check name, e.g. "iam_mfa".
+        rows (iterable): Non-compliant rows (records or dicts).
+        resource_column (str): Column holding the resource id.
+        control (str or callable): Control name (default: the check name), or
+            a function returning the control(s) violated by a row.
+        complete (bool): False when regions or accounts could not be scanned.
+
+    Returns None when history is off.
+    """
+    db = db or _settings["db"]
+    if db is None:
+        return None
+    started_at = started_at or datetime.now(timezone.utc)
+    run_date = started_at.strftime("%Y-%m-%d")
+    entries = []
+    for row in rows:
+        controls = control(row) if callable(control) else [control or check]
+        details = json.dumps({key: _text(value) for key, value in dict(row).items()}, default=str)
+        for name in controls:
+            entries.append((run_date, check, name, str(row[resource_column]), row.get("account_id") or "", details))
+
+    with _lock, closing(connect(db)) as connection, connection:
+        cursor = connection.execute(
+            "INSERT INTO runs (check_name, started_at, run_date, violations, complete) VALUES (?, ?, ?, ?, ?)",
+            (check, started_at.isoformat(), run_date, len(entries), int(complete)),
+        )
+        run_id = cursor.lastrowid
+        connection.executemany(
+            "INSERT INTO violations (run_id, run_date, check_name, control, resource_id, account_id, details) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            [(run_id, *entry) for entry in entries],
+        )
+        changes = _diff(connection, check, run_id)
+    logging.info(
+        f"History: {check} run {run_id} recorded in {db} – "
+        f"{len(changes['new'])} new, {len(changes['resolved'])} resolved since the previous run"
+    )
+    return changes
+
+
+def _diff(connection, check, run_id=None):
+    current = run_id or connection.execute(
+        "SELECT MAX(run_id) FROM runs WHERE check_name = ?", (check,)
+    ).fetchone()[0]
+    if current is None:
+        return {"check": check, "run_id": None, "previous_run_id": None, "new": [], "resolved": []}
+    # Compare with the previous complete run: a partial scan would report spurious resolutions
+    previous = connection.execute(
+        "SELECT MAX(run_id) FROM runs WHERE check_name = ? AND run_id < ? AND complete = 1", (check, current)
+    ).fetchone()[0]
+
+    def keys(run):
+        if run is None:
+            return set()
+        return {
+            (row["control"], row["resource_id"], row["account_id"])
+            for row in connection.execute(
+                "SELECT control, resource_id, account_id FROM violations WHERE run_id = ?", (run,)
+            )
+        }
+
+    now, before = keys(current), keys(previous)
+    as_dicts = lambda items: [  # noqa: E731
+        {"control": c, "resource_id": r, "account_id": a} for c, r, a in sorted(items)
+    ]
+    return {
+        "check": check,
+        "run_id": current,
+        "previous_run_id": previous,
+        "new": as_dicts(now - before),
+        "resolved": as_dicts(before - now),
+    }
+
+
+def diff(check, db=None):
+    """New and resolved violations of a check's latest run since its previous complete run."""
+    with closing(connect(db)) as connection:
+        return _diff(connection, check)
+
+
+def first_seen(resource_id, control=None, account_id=None, db=None):
+    """When each (control, account) first and most recently reported `resource_id`."""
+    query = (
+        "SELECT v.control, v.account_id, MIN(r.started_at) AS first_seen, MAX(r.started_at) AS last_seen, "
+        "COUNT(*) AS runs FROM violations v JOIN runs r USING (run_id) WHERE v.resource_id = ?"
+    )
+    params = [resource_id]
+    if control:
+        query += " AND v.control = ?"
+        params.append(control)
+    if account_id:
+        query += " AND v.account_id = ?"
+        params.append(account_id)
+    query += " GROUP BY v.control, v.account_id ORDER BY v.control, v.account_id"
+    with closing(connect(db)) as connection:
+        return [dict(row) for row in connection.execute(query, params)]
+
+
+def open_violations(check, db=None, now=None):
+    """Violations in the check's latest run, with how long each has been open without interruption.
+
+    A violation opens at its first run after the latest complete run of the
+    same check in which it was absent (incomplete scans do not close it).
+    """
+    now = now or datetime.now(timezone.utc)
+    query = """
+        WITH latest AS (SELECT MAX(run_id) AS run_id FROM runs WHERE check_name = :check),
+        current AS (
+            SELECT v.control, v.resource_id, v.account_id
+            FROM violations v JOIN latest ON v.run_id = latest.run_id
+        ),
+        -- The latest complete run of the check in which each current violation was absent
+        gaps AS (
+            SELECT c.control, c.resource_id, c.account_id, MAX(r.run_id) AS run_id
+            FROM current c JOIN runs r ON r.check_name = :check AND r.complete = 1
+            WHERE NOT EXISTS (
+                SELECT 1 FROM violations seen
+                WHERE seen.resource_id = c.resource_id AND seen.control = c.control
+                  AND seen.account_id = c.account_id AND seen.run_id = r.run_id)
+            GROUP BY c.control, c.resource_id, c.account_id
+        )
+        SELECT c.control, c.resource_id, c.account_id, MIN(r.started_at) AS open_since
+        FROM current c
+        JOIN violations later
+          ON later.resource_id = c.resource_id AND later.control = c.control AND later.account_id = c.account_id
+        JOIN runs r ON r.run_id = later.run_id AND r.check_name = :check
+        LEFT JOIN gaps g
+          ON g.resource_id = c.resource_id AND g.control = c.control AND g.account_id = c.account_id
+        WHERE later.run_id > COALESCE(g.run_id, 0)
+        GROUP BY c.control, c.resource_id, c.account_id
+        ORDER BY open_since, c.control, c.resource_id
+    """
+    with closing(connect(db)) as connection:
+        rows = [dict(row) for row in connection.execute(query, {"check": check})]
+    for row in rows:
+        opened = datetime.fromisoformat(row["open_since"])
+        row["open_days"] = round((now - opened).total_seconds() / 86400, 2)
+    return rows
+
+
+def daily_counts(days=30, control=None, db=None, today=None):
+    """Distinct non-compliant resources per day and control over the last `days` days."""
+    today = today or datetime.now(timezone.utc)
+    since = (today - timedelta(days=days - 1)).strftime("%Y-%m-%d")
+    query = (
+        "SELECT run_date, control, COUNT(DISTINCT account_id || '/' || resource_id) AS violations "
+        "FROM violations WHERE run_date >= ?"
+    )
+    params = [since]
+    if control:
+        query += " AND control = ?"
+        params.append(control)
+    query += " GROUP BY run_date, control ORDER BY run_date, control"
+    with closing(connect(db)) as connection:
+        return [dict(row) for row in connection.execute(query, params)]
+
+
+def prune(keep_days, db=None, today=None):
+    """Delete runs and violations older than `keep_days` days; return the violation rows removed."""
+    today = today or datetime.now(timezone.utc)
+    cutoff = (today - timedelta(days=keep_days)).strftime("%Y-%m-%d")
+    with closing(connect(db)) as connection, connection:
+        removed = connection.execute("DELETE FROM violations WHERE run_date < ?", (cutoff,)).rowcount
+        connection.execute("DELETE FROM runs WHERE run_date < ?", (cutoff,))
+    return removed
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Query the historical compliance store.")
+    parser.add_argument("--history-db", default=DEFAULT_DB, help=f"Store path (default: {DEFAULT_DB}).")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    seen = commands.add_parser("first-seen", help="When a resource was first and last non-compliant.")
+    seen.add_argument("--resource", required=True, help="Resource id (user name, instance id, …).")
+    seen.add_argument("--control", help="Only this control / check.")
+    seen.add_argument("--account", help="Only this account.")
+
+    opened = commands.add_parser("open", help="Open violations of a check and how long each has been open.")
+    opened.add_argument("--check", required=True)
+
+    daily = commands.add_parser("daily", help="Daily violation counts per control.")
+    daily.add_argument("--days", type=int, default=30)
+    daily.add_argument("--control")
+
+    changes = commands.add_parser("diff", help="New and resolved violations since the previous run.")
+    changes.add_argument("--check", required=True)
+
+    cleanup = commands.add_parser("prune", help="Delete history older than --keep-days.")
+    cleanup.add_argument("--keep-days", type=int, required=True)
+    return parser.parse_args(argv)
+
+
+def run(args):
+    queries = {
+        "first-seen": lambda: first_seen(args.resource, args.control, args.account, db=args.history_db),
+        "open": lambda: open_violations(args.check, db=args.history_db),
+        "daily": lambda: daily_counts(args.days, args.control, db=args.history_db),
+        "diff": lambda: diff(args.check, db=args.history_db),
+        "prune": lambda: {"removed": prune(args.keep_days, db=args.history_db)},
+    }
+    try:
+        result = queries[args.command]()
+    except sqlite3.Error as e:
+        logging.error(f"History query failed: {str(e)}")
+        return 1
+    print(json.dumps(result, indent=2, default=str))
+    return 0
+
+
+def main(argv=None):
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+    sys.exit(run(parse_args(argv)))
+
+
+if __name__ == "__main__":
+    main()
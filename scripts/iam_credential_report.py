@@ -0,0 +1,103 @@
+"""
+IAM Credential Report Helpers
+-----------------------------
+Bulk alternative to the per-user IAM calls made by `fafo_checker.py` and
+`unused_iam_access_keys.py`. One `generate_credential_report` /
+`get_credential_report` round-trip returns MFA and access-key status for every
+user in the account as a CSV, so the checks need O(1) API calls instead of
+O(users + keys).
+
+The report can be up to 4 hours old and only reports what AWS could resolve;
+callers fall back to the per-user APIs for rows it cannot answer. Because of
+its age, the report is compared with `list_users` (`current_users`): users
+created after it was generated are checked with the per-user APIs, and rows
+of users deleted since are ignored.
+"""
+import contextvars
+import csv
+import io
+import logging
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from datetime import datetime
+
+import aws_clients
+
+ROOT_ACCOUNT_ROW = "<root_account>"
+
+
+_active_counter = contextvars.ContextVar("iam_api_call_counter", default=None)
+
+
+@contextmanager
+def count_api_calls(client):
+    """Count API calls made through `client` within this context, keyed by operation.
+
+    Clients are shared between checks (see `aws_clients`), so only calls made
+    from this context are counted: the calling thread plus any work fanned out
+    with `rate_limiter.fan_out`, which copies the context into its workers.
+    Calls made through `rate_limiter.call` (on the client's scheduled twin)
+    are counted too. The handlers are removed on exit.
+    """
+    calls = Counter()
+    lock = threading.Lock()
+    token = _active_counter.set(calls)
+    clients = {id(c): c for c in (client, aws_clients.scheduled_client(client))}.values()
+
+    def _count(model, **kwargs):
+        if _active_counter.get() is calls:
+            with lock:
+                calls[model.name] += 1
+
+    for counted in clients:
+        counted.meta.events.register("before-call", _count)
+    try:
+        yield calls
+    finally:
+        for counted in clients:
+            counted.meta.events.unregister("before-call", _count)
+        _active_counter.reset(token)
+
+
+def fetch_credential_report(iam, poll_seconds: float = 2.0, max_attempts: int = 30):
+    """Generate (if needed) and download the credential report as raw CSV bytes."""
+    for _ in range(max_attempts):
+        state = iam.generate_credential_report()["State"]
+        if state == "COMPLETE":
+            break
+        logging.info(f"Credential report generation {state.lower()} – waiting …")
+        time.sleep(poll_seconds)
+    else:
+        raise TimeoutError("IAM credential report was not ready in time")
+    return iam.get_credential_report()["Content"]
+
+
+def current_users(iam):
+    """{user name: `list_users` entry} for every IAM user that exists now."""
+    paginator = iam.get_paginator("list_users")
+    return {user["UserName"]: user for page in paginator.paginate() for user in page["Users"]}
+
+
+def iter_credential_report(content: bytes):
+    """Stream-parse credential report CSV bytes, yielding one dict per IAM user.
+
+    The `<root_account>` row is skipped because neither check covers root.
+    """
+    reader = csv.DictReader(io.TextIOWrapper(io.BytesIO(content), encoding="utf-8"))
+    for row in reader:
+        if row.get("user") == ROOT_ACCOUNT_ROW:
+            continue
+        yield row
+
+
+def parse_report_date(value):
+    """Convert a report timestamp to an aware datetime.
+
+    Returns None for the report's "never" markers (`N/A`, `no_information`,
+    `not_supported`) and raises ValueError for anything else unparsable.
+    """
+    if value in (None, "", "N/A", "no_information", "not_supported"):
+        return None
+    return datetime.fromisoformat(value)
@@ -4,16 +4,37 @@ S3 Bucket Listing Script for GRC Compliance
 ============================================
 This script demonstrates Week 2 concepts from the Python GRC study plan:
 - Using boto3 to interact with AWS APIs
-- Processing data with pandas
+- Shaping API results into report rows
 - Exporting results to Excel for audit evidence
 - Adding logging for compliance tracking
+
+Deep audit (--deep)
+-------------------
+Evaluates four controls for every bucket: default encryption, public access
+block, versioning and server access logging. Each bucket's region is resolved
+once (and cached), its control calls go to a client in that region (no 301
+redirect round-trips), and buckets are evaluated concurrently with results
+streamed straight into the Excel report. Exit code 2 if any bucket fails a
+control.
 """
 
-import boto3  # AWS SDK for Python - handles authentication and API calls
-import pandas as pd  # Data manipulation library for creating tables/DataFrames
+import argparse  # Command-line options shared by every check
 import logging  # Built-in Python logging for audit trails
 from datetime import datetime  # For timestamping our reports
 import sys  # For system exit codes if errors occur
+import threading  # Protects the bucket-region cache shared by worker threads
+
+from botocore.exceptions import ClientError  # AWS error responses (e.g. "no encryption configured")
+
+from aws_clients import get_client  # Shared, cached boto3 clients (AWS SDK for Python)
+from cli_options import add_common_options, apply_common_options  # --no-report and other options shared by all checks
+from evidence_writer import write_report  # Streaming evidence writer (xlsx/csv/jsonl/parquet via --format)
+import history_store  # --history: append violations to the historical compliance store
+import multi_account  # --accounts: scan several AWS accounts through an assumed role
+import rate_limiter  # Throttle-aware scheduler for the per-bucket control calls
+import sharding  # --shard: split buckets across CI runners by a hash of their name
+import response_cache  # Optional on-disk cache for read-only API calls (--cache)
+from records import BucketRecord  # Compact slotted row type shared by all checks
 
 # Configure logging to create audit-quality evidence
 # This creates a log file with timestamps showing what the script did
@@ -26,39 +47,63 @@ logging.basicConfig(
     ]
 )
 
+# Data columns of the Excel report, in order
+REPORT_COLUMNS = ['bucket_name', 'creation_date', 'creation_date_str']
+# Extra columns written by the deep audit
+DEEP_REPORT_COLUMNS = REPORT_COLUMNS + [
+    'region', 'default_encryption', 'public_access_block', 'versioning', 'access_logging', 'issues'
+]
+# Buckets evaluated at the same time in deep mode (also the per-region client pool size)
+DEEP_MAX_WORKERS = 64
+# Buckets requested per list_buckets page
+LIST_BUCKETS_PAGE_SIZE = 1000
+
+# Bucket name -> region, filled once per bucket and shared by all worker threads
+_bucket_regions = {}
+_bucket_regions_lock = threading.Lock()
+
 def get_s3_buckets():
     """
     Retrieve all S3 buckets in the AWS account.
     
     Returns:
-        list: List of bucket dictionaries with name and creation date
+        list: List of BucketRecord rows with name and creation date
+    
+    Raises:
+        Exception: Any error listing the buckets (access denied, throttling, ...)
     """
     try:
-        # Create S3 client using default credentials (from ~/.aws/credentials or IAM role)
+        # Get the shared S3 client using default credentials (from ~/.aws/credentials or IAM role)
         # boto3 automatically handles authentication, region selection, and retries
-        s3_client = boto3.client('s3')
+        s3_client = get_client('s3')
         
         logging.info("Connecting to AWS S3 service...")
         
         # Call the list_buckets API - this is the core AWS interaction
-        # Returns metadata about all buckets the current user can access
-        response = s3_client.list_buckets()
+        # Returns metadata about all buckets the current user can access,
+        # one page at a time (the paginator follows the ContinuationToken)
+        paginator = s3_client.get_paginator('list_buckets')
+        pages = paginator.paginate(PaginationConfig={'PageSize': LIST_BUCKETS_PAGE_SIZE})
         
-        # Extract the 'Buckets' list from the API response
+        # Extract the 'Buckets' list from each page of the API response
         # AWS APIs return JSON with metadata; we only need the bucket data
-        buckets = response['Buckets']
+        buckets = [bucket for page in pages for bucket in page['Buckets']]
         
         logging.info(f"Successfully retrieved {len(buckets)} S3 buckets")
         
-        # Transform AWS response into a cleaner format for pandas
-        # Each bucket becomes a dictionary with standardized field names
+        # With --shard, keep only this runner's share of the buckets
+        buckets = sharding.select(buckets, key=lambda bucket: bucket['Name'])
+        
+        # Transform AWS response into a cleaner format for the report
+        # Each bucket becomes a slotted BucketRecord (no per-row dict, region strings interned)
         bucket_list = []
         for bucket in buckets:
-            bucket_info = {
-                'bucket_name': bucket['Name'],  # Human-readable bucket identifier
-                'creation_date': bucket['CreationDate'],  # When bucket was created
-                'creation_date_str': bucket['CreationDate'].strftime('%Y-%m-%d %H:%M:%S')  # Formatted for Excel
-            }
+            bucket_info = BucketRecord(
+                bucket_name=bucket['Name'],  # Human-readable bucket identifier
+                creation_date=bucket['CreationDate'],  # When bucket was created
+                creation_date_str=bucket['CreationDate'].strftime('%Y-%m-%d %H:%M:%S'),  # Formatted for Excel
+                region=bucket.get('BucketRegion'),  # Returned by paginated list_buckets; used by --deep
+            )
             bucket_list.append(bucket_info)
             
         return bucket_list
@@ -66,66 +111,213 @@ def get_s3_buckets():
     except Exception as e:
         # Log any errors for troubleshooting and compliance documentation
         logging.error(f"Failed to retrieve S3 buckets: {str(e)}")
-        # Return empty list so script can continue and produce a report showing the error
-        return []
+        # Re-raise: an empty list here would read as "no buckets, all compliant"
+        # (run() exits 1; with --accounts the account is recorded as failed)
+        raise
 
-def create_excel_report(bucket_data, filename='s3_buckets_report.xlsx'):
+def resolve_bucket_region(bucket_name, hint=None):
+    """
+    Return a bucket's region, calling GetBucketLocation at most once per bucket.
+    
+    Args:
+        bucket_name (str): Bucket to locate
+        hint (str): Region already known from list_buckets, if any
+    """
+    with _bucket_regions_lock:
+        if bucket_name in _bucket_regions:
+            return _bucket_regions[bucket_name]
+    if hint:
+        region = hint
+    else:
+        location = rate_limiter.call(get_client('s3'), 'get_bucket_location', Bucket=bucket_name)
+        # Legacy location values: None/empty means us-east-1, "EU" means eu-west-1
+        constraint = location.get('LocationConstraint')
+        region = {None: 'us-east-1', '': 'us-east-1', 'EU': 'eu-west-1'}.get(constraint, constraint)
+    with _bucket_regions_lock:
+        _bucket_regions[bucket_name] = region
+    return region
+
+def _get_bucket_control(s3_client, operation, bucket_name, not_configured_code):
+    """
+    Call one bucket-configuration API; return None when the setting is simply not configured.
+    """
+    try:
+        return rate_limiter.call(s3_client, operation, Bucket=bucket_name)
+    except ClientError as e:
+        if e.response.get('Error', {}).get('Code') == not_configured_code:
+            return None
+        raise
+
+def audit_bucket(bucket):
+    """
+    Evaluate encryption, public access block, versioning and logging for one bucket.
+    
+    Args:
+        bucket (BucketRecord): Bucket record from get_s3_buckets()
+    
+    Returns:
+        BucketRecord: A copy of the bucket record with the control columns and an 'issues' summary filled in
+    """
+    # In multi-account mode the bucket's account decides which credentials are used
+    with multi_account.account_context(bucket.get(multi_account.ACCOUNT_COLUMN)):
+        return _audit_bucket(bucket)
+
+def _audit_bucket(bucket):
+    name = bucket['bucket_name']
+    result = bucket.copy()
+    issues = []
+    try:
+        region = resolve_bucket_region(name, bucket.get('region'))
+    except ClientError as e:
+        result['issues'] = f"Region lookup failed ({e.response['Error']['Code']})"
+        return result
+    result['region'] = region
+    # Regional client: calls go straight to the bucket's region, no 301 redirects
+    s3_client = get_client('s3', region, max_pool_connections=DEEP_MAX_WORKERS)
+
+    def check(column, operation, not_configured_code, evaluate):
+        try:
+            response = _get_bucket_control(s3_client, operation, name, not_configured_code)
+            result[column], issue = evaluate(response)
+        except ClientError as e:
+            code = e.response.get('Error', {}).get('Code')
+            # An unreadable control counts as failed, never as compliant
+            result[column], issue = f"ERROR: {code}", f"{column} check failed ({code})"
+        if issue:
+            issues.append(issue)
+
+    def encryption(response):
+        rules = (response or {}).get('ServerSideEncryptionConfiguration', {}).get('Rules', [])
+        algorithms = [r['ApplyServerSideEncryptionByDefault']['SSEAlgorithm'] for r in rules
+                      if 'ApplyServerSideEncryptionByDefault' in r]
+        if algorithms:
+            return ", ".join(algorithms), None
+        return "None", "No default encryption"
+
+    def public_access_block(response):
+        settings = (response or {}).get('PublicAccessBlockConfiguration', {})
+        if settings and all(settings.values()):
+            return "All blocked", None
+        return ("Partial" if settings else "None"), "Public access not fully blocked"
+
+    def versioning(response):
+        status = (response or {}).get('Status', 'Disabled')
+        return status, (None if status == 'Enabled' else "Versioning not enabled")
+
+    def access_logging(response):
+        target = (response or {}).get('LoggingEnabled', {}).get('TargetBucket')
+        return (target, None) if target else ("Disabled", "Server access logging disabled")
+
+    check('default_encryption', 'get_bucket_encryption', 'ServerSideEncryptionConfigurationNotFoundError', encryption)
+    check('public_access_block', 'get_public_access_block', 'NoSuchPublicAccessBlockConfiguration', public_access_block)
+    check('versioning', 'get_bucket_versioning', None, versioning)
+    check('access_logging', 'get_bucket_logging', None, access_logging)
+    result['issues'] = "; ".join(issues)
+    return result
+
+def iter_bucket_audits(buckets, max_workers=DEEP_MAX_WORKERS):
+    """
+    Audit buckets concurrently, yielding each result as soon as it is ready.
+    """
+    return rate_limiter.iter_fan_out(audit_bucket, buckets, max_workers)
+
+def create_excel_report(bucket_data, filename='s3_buckets_report.xlsx', columns=REPORT_COLUMNS):
     """
     Create an Excel report from S3 bucket data.
     
     Args:
-        bucket_data (list): List of bucket dictionaries
+        bucket_data (list or iterable): Bucket records; generators are streamed
         filename (str): Output Excel file name
+        columns (list): Data columns to write (REPORT_COLUMNS or DEEP_REPORT_COLUMNS)
+
+    Raises:
+        Exception: Whatever producing the records raised (e.g. a bucket audit
+            that could not reach S3); only report-writing errors are logged here.
     """
+    # Errors raised while producing the rows, as opposed to writing them
+    source_errors = []
     try:
-        # Convert list of dictionaries to pandas DataFrame
-        # DataFrame is like an Excel table - rows and columns with headers
-        df = pd.DataFrame(bucket_data)
-        
-        if df.empty:
-            # Handle case where no buckets were found or API call failed
-            logging.warning("No bucket data to export - creating empty report")
-            # Create a DataFrame with just headers to show the expected structure
-            df = pd.DataFrame(columns=['bucket_name', 'creation_date', 'creation_date_str'])
-        
-        # Convert timezone-aware datetimes to timezone-naive so Excel (openpyxl) doesn’t error
-        if 'creation_date' in df.columns and not df['creation_date'].empty:
-            # Pandas helper: remove timezone info; keeps local (UTC) value
-            df['creation_date'] = pd.to_datetime(df['creation_date']).dt.tz_localize(None)
+        # Keep the first few rows for the console preview while the rest stream through
+        sample = []
 
-        # Add metadata columns for audit purposes
-        # These help auditors understand when and how the report was generated
-        df['report_generated_at'] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-        df['total_buckets_found'] = len(bucket_data)
-        
-        # Export to Excel file
-        # Excel format is preferred by auditors and compliance teams
-        df.to_excel(filename, index=False, sheet_name='S3_Buckets')
+        def rows():
+            iterator = iter(bucket_data)
+            while True:
+                try:
+                    bucket = next(iterator)
+                except StopIteration:
+                    return
+                except Exception as e:
+                    source_errors.append(e)
+                    raise
+                if len(sample) < 3:
+                    sample.append(bucket)
+                yield bucket
+
+        # Stream rows into the report (every --format at once) instead of
+        # building a DataFrame first; timezone info is dropped for Excel and
+        # the metadata columns below are added to every row for audit purposes
+        total = write_report(
+            rows(),
+            filename,
+            sheet_name='S3_Buckets',
+            columns=multi_account.report_columns(columns),  # account_id first with --accounts
+            metadata={'report_generated_at': datetime.now().strftime('%Y-%m-%d %H:%M:%S')},
+            total_column='total_buckets_found',
+            total=len(bucket_data) if isinstance(bucket_data, list) else None,
+        )
+
+        if not total:
+            # Handle case where no buckets were found or API call failed
+            # The report still gets the headers to show the expected structure
+            logging.warning("No bucket data to export - created empty report")
         
-        logging.info(f"Excel report saved as: {filename}")
-        logging.info(f"Report contains {len(bucket_data)} bucket records")
+        logging.info(f"Report contains {total} bucket records")
         
         # Display summary to console for immediate verification
         print(f"\n=== S3 Bucket Summary ===")
-        print(f"Total buckets found: {len(bucket_data)}")
+        print(f"Total buckets found: {total}")
         print(f"Report saved to: {filename}")
         
-        if bucket_data:
+        if sample:
             print(f"\nSample buckets:")
             # Show first few buckets as a preview
-            for i, bucket in enumerate(bucket_data[:3]):
+            for i, bucket in enumerate(sample):
                 print(f"  {i+1}. {bucket['bucket_name']} (created: {bucket['creation_date_str']})")
-            if len(bucket_data) > 3:
-                print(f"  ... and {len(bucket_data) - 3} more")
+            if total > 3:
+                print(f"  ... and {total - 3} more")
         
     except Exception as e:
+        if source_errors:
+            # An incomplete scan must fail the run, not pass as a shorter report
+            raise
         logging.error(f"Failed to create Excel report: {str(e)}")
         print(f"Error creating report: {str(e)}")
 
-def main():
+def parse_args(argv=None):
     """
-    Main execution function - orchestrates the entire process.
+    Parse command-line options (--deep, --max-workers and the shared ones, e.g. --no-report).
     """
+    parser = argparse.ArgumentParser(description="List S3 buckets for audit evidence.")
+    parser.add_argument(
+        '--deep',
+        action='store_true',
+        help="Audit encryption, public access block, versioning and access logging for every bucket.",
+    )
+    parser.add_argument(
+        '--max-workers',
+        type=int,
+        default=DEEP_MAX_WORKERS,
+        help=f"Buckets audited concurrently in --deep mode (default: {DEEP_MAX_WORKERS}).",
+    )
+    add_common_options(parser)
+    return parser.parse_args(argv)
+
+def run(args):
+    """
+    Run the audit, write the report and return the exit code.
+    """
+    apply_common_options(args)
     logging.info("=== Starting S3 Bucket Audit Script ===")
     
     # Record start time for performance tracking
@@ -134,28 +326,77 @@ def main():
     try:
         # Step 1: Retrieve bucket data from AWS
         logging.info("Step 1: Retrieving S3 bucket information...")
-        buckets = get_s3_buckets()
+        # (with --accounts, once per account; each bucket is tagged with its account_id)
+        account_errors = {}
+        buckets = multi_account.collect(get_s3_buckets, account_errors)
         
-        # Step 2: Create Excel report for auditors
-        logging.info("Step 2: Generating Excel compliance report...")
-        create_excel_report(buckets)
+        exit_code = 0
+        audits = []  # deep-audit rows kept for the partial result of a sharded run
+        if args.deep:
+            # Step 2 (deep): audit every bucket and stream results into the report
+            logging.info(f"Step 2: Auditing {len(buckets)} buckets with {args.max_workers} workers...")
+            failing = []
+
+            def audited():
+                for result in iter_bucket_audits(buckets, args.max_workers):
+                    if result.get('issues'):
+                        failing.append(result)
+                    yield result
+
+            if sharding.enabled():
+                audits = list(audited())
+            elif args.no_report:
+                for _ in audited():
+                    pass
+            else:
+                create_excel_report(audited(), filename='s3_bucket_audit_report.xlsx', columns=DEEP_REPORT_COLUMNS)
+            rate_limiter.log_metrics('s3')
+            history_store.record_run('s3_buckets', failing, 'bucket_name', complete=not account_errors)
+            logging.info(f"Buckets failing at least one control: {len(failing)}")
+            exit_code = 2 if failing else 0
+        # Step 2: Create Excel report for auditors (skipped in gate-only mode)
+        elif args.no_report:
+            logging.info("Step 2: Skipped - gate-only mode (--no-report)")
+        elif sharding.enabled():
+            logging.info("Step 2: Skipped - sharded run, the report is written by merge_shards.py")
+        else:
+            logging.info("Step 2: Generating Excel compliance report...")
+            create_excel_report(buckets)
+        if exit_code == 0 and account_errors:
+            # An account that could not be listed must not pass as compliant
+            exit_code = 1
+        
+        if sharding.enabled():
+            sharding.write_partial(
+                's3_buckets',
+                exit_code,
+                {'buckets': buckets, 'audits': audits},
+                options={'deep': args.deep},
+                complete=not account_errors,
+            )
         
         # Calculate and log execution time for performance monitoring
         end_time = datetime.now()
         execution_time = (end_time - start_time).total_seconds()
         
-        logging.info(f"Script completed successfully in {execution_time:.2f} seconds")
+        logging.info(f"Script completed successfully in {execution_time:.2f} seconds{response_cache.stats_summary()}")
         logging.info("=== S3 Bucket Audit Complete ===")
         
-        # Exit with success code
-        sys.exit(0)
+        # Exit with success code (2 if the deep audit found non-compliant buckets)
+        return exit_code
         
     except Exception as e:
         # Handle any unexpected errors gracefully
         logging.error(f"Script failed with error: {str(e)}")
         print(f"Script failed: {str(e)}")
         # Exit with error code to indicate failure to calling systems
-        sys.exit(1)
+        return 1
+
+def main(argv=None):
+    """
+    Main execution function - orchestrates the entire process.
+    """
+    sys.exit(run(parse_args(argv)))
 
 # Standard Python idiom - only run main() if script is executed directly
 # This allows the script to be imported as a module without auto-execution
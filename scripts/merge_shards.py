@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+"""
+Merge Sharded Check Results
+---------------------------
+Combines the partial results written by checks run with `--shard I/N` (one
+per CI runner) into the report and exit code an unsharded run would have
+produced:
+
+    python scripts/run_all_checks.py --shard 1/3     # on runner 1 (2/3, 3/3 on the others)
+    python scripts/merge_shards.py                   # after collecting shards/ from every runner
+
+Every shard 1..N of a check must be present. Rows are concatenated in shard
+order (GuardDuty severity counts are added up) and written by the check's
+own report function, honouring `--format`. The exit code of each check and
+the combined exit code follow `run_all_checks.py`. With `--history`, the
+merged run is recorded in the history store (shards never record their own).
+"""
+import argparse
+import logging
+import os
+import sys
+
+# Configure logging before the checks are imported so their own
+# basicConfig calls become no-ops.
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s - %(levelname)s - %(message)s",
+    handlers=[logging.FileHandler("compliance_merge.log"), logging.StreamHandler()],
+)
+
+import config_noncompliant_rules  # noqa: E402
+import ec2_compliance_check  # noqa: E402
+import evidence_writer  # noqa: E402
+import fafo_checker  # noqa: E402
+import guardduty_findings_summary  # noqa: E402
+import history_store  # noqa: E402
+import list_s3_buckets  # noqa: E402
+import multi_account  # noqa: E402
+import run_all_checks  # noqa: E402
+import sharding  # noqa: E402
+import unused_iam_access_keys  # noqa: E402
+
+
+def _write_s3(tables, options):
+    # As in an unsharded run: the audit report with --deep, else the bucket list
+    if options.get("deep"):
+        list_s3_buckets.create_excel_report(
+            tables["audits"], filename="s3_bucket_audit_report.xlsx", columns=list_s3_buckets.DEEP_REPORT_COLUMNS
+        )
+    else:
+        list_s3_buckets.create_excel_report(tables["buckets"])
+
+
+# Check -> fn(merged tables, options) writing the final report
+REPORTS = {
+    "iam_mfa": lambda tables, options: fafo_checker.export_excel(tables["users"]),
+    "iam_access_keys": lambda tables, options: unused_iam_access_keys.export_excel(tables["keys"]),
+    "ec2": lambda tables, options: ec2_compliance_check.export_report(tables["instances"]),
+    "s3_buckets": _write_s3,
+    "config_rules": lambda tables, options: config_noncompliant_rules.export_excel(
+        tables["rules"], details=options.get("details"), detail_rows=tables["resources"]
+    ),
+    "guardduty": lambda tables, options: guardduty_findings_summary.export_excel(
+        guardduty_findings_summary.merge_severity_rows(tables["severity"])
+    ),
+}
+# Check -> (fn(merged tables, options) returning the violations, resource id column) for --history
+VIOLATIONS = {
+    "iam_mfa": (lambda tables, options: tables["users"], "user_name"),
+    "iam_access_keys": (lambda tables, options: tables["keys"], "access_key_id"),
+    "ec2": (lambda tables, options: tables["instances"], "instance_id"),
+    "s3_buckets": (
+        lambda tables, options: [row for row in tables["audits"] if row.get("issues")] if options.get("deep") else None,
+        "bucket_name",
+    ),
+    "config_rules": (lambda tables, options: tables["rules"], "config_rule"),
+    "guardduty": (
+        lambda tables, options: [
+            row for row in guardduty_findings_summary.merge_severity_rows(tables["severity"]) if row["count"]
+        ],
+        "severity",
+    ),
+}
+
+
+def merge_check(check, directory=sharding.DEFAULT_SHARD_DIR, write=True):
+    """Merge one check's partials: write its report (unless `write` is False) and return its exit code."""
+    partials = sharding.read_partials(check, directory)
+    tables = {name: [] for name in partials[0]["tables"]}
+    for partial in partials:
+        for name, rows in partial["tables"].items():
+            tables[name].extend(rows)
+    options = partials[0]["options"]
+    exit_code = run_all_checks.combine_exit_codes([partial["exit_code"] for partial in partials])
+    # The partials know whether reports carry an account_id column
+    multi_account.configure(partials[0]["accounts"])
+    try:
+        if write:
+            REPORTS[check](tables, options)
+        violations, resource_column = VIOLATIONS[check]
+        rows = violations(tables, options)
+        if rows is not None:
+            complete = all(partial["complete"] for partial in partials)
+            history_store.record_run(check, rows, resource_column, complete=complete)
+    finally:
+        multi_account.configure()
+    logging.info(f"{check}: merged {len(partials)} shards – exit code {exit_code}")
+    return exit_code
+
+
+def available_checks(directory):
+    """Checks that have at least one partial result in `directory`."""
+    names = os.listdir(directory) if os.path.isdir(directory) else []
+    return [check for check in run_all_checks.CHECKS if any(name.startswith(f"{check}.shard-") for name in names)]
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Merge partial results of sharded checks into the final reports.")
+    parser.add_argument(
+        "--checks",
+        nargs="+",
+        choices=sorted(run_all_checks.CHECKS),
+        help="Checks to merge (default: every check with partial results in --shard-dir).",
+    )
+    parser.add_argument(
+        "--shard-dir",
+        default=sharding.DEFAULT_SHARD_DIR,
+        help=f"Directory holding the partial results (default: {sharding.DEFAULT_SHARD_DIR}).",
+    )
+    parser.add_argument("--no-report", action="store_true", help="Only compute the merged exit code.")
+    parser.add_argument(
+        "--format",
+        nargs="+",
+        choices=evidence_writer.FORMATS,
+        default=list(evidence_writer.DEFAULT_FORMATS),
+        help="Report format(s), as for the checks. Default: xlsx.",
+    )
+    parser.add_argument("--history", action="store_true", help="Record the merged runs in the history store.")
+    parser.add_argument(
+        "--history-db",
+        default=history_store.DEFAULT_DB,
+        help=f"History store path (default: {history_store.DEFAULT_DB}).",
+    )
+    return parser.parse_args(argv)
+
+
+def run(args):
+    evidence_writer.configure(args.format)
+    history_store.configure(args.history_db if args.history else None)
+    checks = args.checks or available_checks(args.shard_dir)
+    if not checks:
+        logging.error(f"No partial results found in {args.shard_dir}")
+        return 1
+    codes = []
+    for check in checks:
+        try:
+            codes.append(merge_check(check, args.shard_dir, write=not args.no_report))
+        except (OSError, ValueError) as e:
+            logging.error(f"Cannot merge {check}: {str(e)}")
+            codes.append(1)
+    exit_code = run_all_checks.combine_exit_codes(codes)
+    logging.info(f"Merged {', '.join(checks)} – exit code {exit_code}")
+    return exit_code
+
+
+def main(argv=None):
+    sys.exit(run(parse_args(argv)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,139 @@
+"""
+Multi-Account Scanning
+----------------------
+Runs a check's collection step in many AWS accounts and merges the results.
+
+With `--accounts` (IDs, or `ALL` for every active account in the AWS
+Organization) each account is scanned through an assumed role (`--role`, a
+role name or an ARN template containing `{account_id}`). Accounts are spread
+over a thread pool (`--account-workers`); inside each task `aws_clients`
+hands out clients for that account's cached, self-refreshing credentials and
+the API rate limiters are scoped to the account.
+
+Every returned row gets an `account_id` column, so each check still writes one
+report. An account that cannot be scanned is logged and recorded in
+`account_errors` while the others finish, like a failed region. Failed regions
+are recorded per account (`region_key`), so logs name the account and region.
+
+Without `--accounts` nothing changes: the check runs once with the default
+credentials and its reports have no `account_id` column.
+"""
+import contextvars
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+import aws_clients
+from records import ACCOUNT_FIELD, Record
+
+DEFAULT_ROLE = "OrganizationAccountAccessRole"
+DEFAULT_ACCOUNT_WORKERS = 8
+ACCOUNT_COLUMN = ACCOUNT_FIELD
+
+_settings = {"accounts": None, "role": DEFAULT_ROLE, "max_workers": DEFAULT_ACCOUNT_WORKERS}
+_current_account = contextvars.ContextVar("scanned_account", default=None)
+
+
+def configure(accounts=None, role=DEFAULT_ROLE, max_workers=DEFAULT_ACCOUNT_WORKERS):
+    """Select the accounts to scan (None: the default credentials only)."""
+    _settings.update(accounts=accounts or None, role=role, max_workers=max_workers)
+
+
+def enabled():
+    return bool(_settings["accounts"])
+
+
+def selected_accounts():
+    """The accounts selected with `configure` (None: the default credentials only)."""
+    return _settings["accounts"]
+
+
+def report_columns(columns):
+    """Prefix report columns with `account_id` when scanning several accounts."""
+    return [ACCOUNT_COLUMN] + list(columns) if enabled() else list(columns)
+
+
+def current_account():
+    """Account being scanned in this context (None: the default credentials)."""
+    return _current_account.get()
+
+
+def region_key(region):
+    """Key of `region` in a check's `region_errors`: (account_id, region), account_id None without --accounts."""
+    return current_account(), region
+
+
+def region_name(key):
+    """Readable form of a `region_key`: "account_id/region", or just the region without --accounts."""
+    account_id, region = key
+    return f"{account_id}/{region}" if account_id else region
+
+
+def describe_failures(region_errors, account_errors):
+    """Names of the regions and accounts that could not be scanned, for the "scan incomplete" log line."""
+    regions = sorted(region_errors, key=lambda key: (key[0] or "", key[1]))
+    return [region_name(key) for key in regions] + [f"account {account}" for account in sorted(account_errors)]
+
+
+def resolve_accounts(accounts):
+    """Expand `ALL` into every active account of the AWS Organization."""
+    if [a.upper() for a in accounts] != ["ALL"]:
+        return list(accounts)
+    org = aws_clients.get_client("organizations")
+    return [
+        account["Id"]
+        for page in org.get_paginator("list_accounts").paginate()
+        for account in page["Accounts"]
+        if account["Status"] == "ACTIVE"
+    ]
+
+
+def tag_account(row, account_id):
+    """Set a row's `account_id` (records are updated in place, dicts are copied)."""
+    if isinstance(row, Record):
+        row[ACCOUNT_COLUMN] = account_id
+        return row
+    return {ACCOUNT_COLUMN: account_id, **row}
+
+
+@contextmanager
+def account_context(account_id):
+    """Route `get_client` calls in this context to `account_id` (no-op for None)."""
+    if account_id is None:
+        yield
+        return
+    session = aws_clients.assume_role_session(account_id, _settings["role"])
+    token = _current_account.set(account_id)
+    try:
+        with aws_clients.use_session(session, account_id):
+            yield
+    finally:
+        _current_account.reset(token)
+
+
+def collect(fn, account_errors=None):
+    """Call `fn()` once per account and return its rows, tagged with `account_id`.
+
+    `fn` returns an iterable of records or row dicts; it is consumed inside the account's
+    context, so generators make their API calls with the right credentials.
+    Without `--accounts`, this is simply `fn()` (generators stay lazy).
+    """
+    if not enabled():
+        return fn()
+    if account_errors is None:
+        account_errors = {}
+    accounts = resolve_accounts(_settings["accounts"])
+    logging.info(f"Scanning {len(accounts)} accounts with role {_settings['role']}")
+
+    def scan(account_id):
+        try:
+            with account_context(account_id):
+                return [tag_account(row, account_id) for row in fn()]
+        except Exception as e:
+            logging.error(f"Account {account_id} scan failed: {str(e)}")
+            account_errors[account_id] = str(e)
+            return []
+
+    with ThreadPoolExecutor(max_workers=max(1, min(_settings["max_workers"], len(accounts)))) as pool:
+        results = pool.map(lambda account_id: contextvars.copy_context().run(scan, account_id), accounts)
+        return [row for rows in results for row in rows]
@@ -0,0 +1,294 @@
+"""
+Throttle-Aware API Scheduler
+----------------------------
+All per-resource API fan-out (per-user IAM calls, per-instance EC2 probes)
+goes through this module instead of calling clients directly.
+
+For each (service, region) an `AdaptiveLimiter` keeps:
+- a token bucket capping the request rate;
+- an adaptive concurrency limit (additive increase after a window of clean
+  calls, multiplicative decrease when throttling shows up).
+
+Throttled calls, AWS server errors and transient connection failures
+(`TRANSIENT_ERRORS`: connection refused or closed, read and connect timeouts)
+are retried with full-jitter exponential backoff instead of failing the
+control. Only after `max_retries`
+does the error propagate, so a check reports an error rather than a false
+"compliant" result.
+
+The scheduler is the only retry layer for its calls: `call` uses the client's
+scheduled twin from `aws_clients`, which makes a single attempt, so every
+throttle reaches the limiter immediately instead of after botocore's own
+retries. Responses that a client without that twin already had to retry
+(`ResponseMetadata.RetryAttempts`) still count as congestion; responses served
+from the response cache or a replayed snapshot report no retries
+(`without_retry_attempts`).
+
+Per-service metrics (calls, throttles, retries, throughput) are available from
+`metrics()` and logged by `log_metrics()`.
+
+API limits apply per account, so when several accounts are scanned at once
+(`aws_clients.use_session`) each account gets its own limiters via `scope`.
+"""
+import contextvars
+import logging
+import random
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, as_completed, wait
+
+from botocore import exceptions as botocore_exceptions
+from botocore.exceptions import ClientError
+
+THROTTLE_CODES = {
+    "Throttling",
+    "ThrottlingException",
+    "ThrottledException",
+    "RequestLimitExceeded",
+    "RequestThrottled",
+    "RequestThrottledException",
+    "TooManyRequestsException",
+    "SlowDown",
+}
+# Network failures botocore's standard retry mode retries; the scheduled clients leave them to the scheduler
+# (ConnectionError covers EndpointConnectionError and ConnectTimeoutError, HTTPClientError covers
+# ConnectionClosedError and ReadTimeoutError)
+TRANSIENT_ERRORS = (botocore_exceptions.ConnectionError, botocore_exceptions.HTTPClientError)
+# (requests per second, max concurrency) per service; tuned to AWS's published
+# API rate limits with headroom.
+SERVICE_LIMITS = {
+    "iam": (15.0, 8),
+    "ec2": (20.0, 16),
+    # S3 bucket-configuration calls are limited per bucket, not per account
+    "s3": (500.0, 64),
+    "guardduty": (10.0, 8),
+    "config": (8.0, 8),
+}
+DEFAULT_LIMITS = (10.0, 8)
+MAX_RETRIES = 8
+BACKOFF_BASE = 0.2
+BACKOFF_CAP = 20.0
+
+_registry_lock = threading.Lock()
+_limiters = {}
+# Account whose limits the current context draws on (None: the default credentials)
+scope = contextvars.ContextVar("rate_limit_scope", default=None)
+
+
+def is_throttle(error):
+    """True when a ClientError is an AWS throttling response."""
+    return isinstance(error, ClientError) and error.response.get("Error", {}).get("Code") in THROTTLE_CODES
+
+
+def is_server_error(error):
+    """True when a ClientError is a transient AWS server error (HTTP 5xx)."""
+    if not isinstance(error, ClientError):
+        return False
+    return error.response.get("ResponseMetadata", {}).get("HTTPStatusCode", 0) >= 500
+
+
+def without_retry_attempts(parsed):
+    """A stored response as served again: no retries were needed to get it this time."""
+    metadata = parsed.get("ResponseMetadata") if isinstance(parsed, dict) else None
+    if not metadata or not metadata.get("RetryAttempts"):
+        return parsed
+    return {**parsed, "ResponseMetadata": {**metadata, "RetryAttempts": 0}}
+
+
+class TokenBucket:
+    """Thread-safe token bucket; `take()` blocks until a token is available."""
+
+    def __init__(self, rate, burst=None):
+        self.rate = rate
+        self.capacity = burst or rate
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def take(self):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+class AdaptiveLimiter:
+    """Rate and concurrency limits for one (service, region), adapted to throttling."""
+
+    def __init__(self, name, rate, max_concurrency, max_retries=MAX_RETRIES):
+        self.name = name
+        self.max_rate = rate
+        self.min_rate = max(rate / 16, 0.5)
+        self.max_concurrency = max_concurrency
+        self.concurrency = max(1, max_concurrency // 2)
+        self.max_retries = max_retries
+        self.bucket = TokenBucket(rate)
+        self.stats = {"calls": 0, "throttles": 0, "retries": 0, "errors": 0}
+        self._first_call = None
+        self._last_call = None
+        self._active = 0
+        self._clean_calls = 0
+        self._cond = threading.Condition()
+
+    def _acquire(self):
+        with self._cond:
+            while self._active >= self.concurrency:
+                self._cond.wait()
+            self._active += 1
+        self.bucket.take()
+
+    def _release(self, congested):
+        with self._cond:
+            self._active -= 1
+            now = time.monotonic()
+            self._first_call = self._first_call or now
+            self._last_call = now
+            self.stats["calls"] += 1
+            if congested:
+                self.concurrency = max(1, self.concurrency // 2)
+                self.bucket.rate = max(self.min_rate, self.bucket.rate / 2)
+                self._clean_calls = 0
+            else:
+                self._clean_calls += 1
+                if self._clean_calls >= self.concurrency:
+                    self.concurrency = min(self.max_concurrency, self.concurrency + 1)
+                    self.bucket.rate = min(self.max_rate, self.bucket.rate * 1.1)
+                    self._clean_calls = 0
+            self._cond.notify_all()
+
+    def call(self, fn, *args, **kwargs):
+        """Call `fn` within the limits, retrying throttling, server and connection errors with jittered backoff."""
+        for attempt in range(self.max_retries + 1):
+            self._acquire()
+            congested = False
+            try:
+                result = fn(*args, **kwargs)
+                retries = result.get("ResponseMetadata", {}).get("RetryAttempts", 0) if isinstance(result, dict) else 0
+                if retries:
+                    congested = True
+                    self._count("retries", retries)
+                return result
+            except ClientError as error:
+                if is_throttle(error):
+                    congested = True
+                    self._count("throttles")
+                elif not is_server_error(error):
+                    self._count("errors")
+                    raise
+                if attempt == self.max_retries:
+                    self._count("errors")
+                    raise
+            except TRANSIENT_ERRORS:
+                # Not a sign of API congestion, so concurrency is left alone
+                if attempt == self.max_retries:
+                    self._count("errors")
+                    raise
+            finally:
+                self._release(congested)
+            self._count("retries")
+            time.sleep(random.uniform(0, min(BACKOFF_CAP, BACKOFF_BASE * 2 ** attempt)))
+
+    def _count(self, name, amount=1):
+        with self._cond:
+            self.stats[name] += amount
+
+    def metrics(self):
+        with self._cond:
+            elapsed = (self._last_call - self._first_call) if self._first_call else 0
+            return {
+                **self.stats,
+                "throughput_per_s": round(self.stats["calls"] / elapsed, 2) if elapsed else None,
+                "concurrency": self.concurrency,
+                "rate_per_s": round(self.bucket.rate, 2),
+            }
+
+
+def get_limiter(service, region=None):
+    """Return the shared limiter for (service, region) in the current account scope."""
+    account = scope.get()
+    key = (service, region, account)
+    with _registry_lock:
+        if key not in _limiters:
+            rate, concurrency = SERVICE_LIMITS.get(service, DEFAULT_LIMITS)
+            name = f"{service}/{region or 'global'}" + (f"@{account}" if account else "")
+            _limiters[key] = AdaptiveLimiter(name, rate, concurrency)
+        return _limiters[key]
+
+
+def _limiter_for(client):
+    return get_limiter(client.meta.service_model.service_name, client.meta.region_name)
+
+
+def call(client, operation, **params):
+    """Invoke `client.<operation>(**params)` through the client's service limiter.
+
+    The call goes to the client's scheduled twin, so botocore does not retry it as well.
+    """
+    import aws_clients  # imported here: aws_clients imports this module
+
+    client = aws_clients.scheduled_client(client)
+    return _limiter_for(client).call(getattr(client, operation), **params)
+
+
+def fan_out(fn, items, client, max_workers=None):
+    """Apply `fn` to every item on a thread pool sized for the client's limiter.
+
+    Returns results in input order. The limiter, not the pool size, decides how
+    many calls run at once. Each task runs in a copy of the caller's context so
+    context-local state (e.g. API call counters) follows the work.
+    """
+    items = list(items)
+    if not items:
+        return []
+    limiter = _limiter_for(client)
+    workers = min(len(items), max_workers or limiter.max_concurrency, limiter.max_concurrency)
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(contextvars.copy_context().run, fn, item) for item in items]
+        return [future.result() for future in futures]
+
+
+def iter_fan_out(fn, items, max_workers):
+    """Like `fan_out`, but yield results as they complete.
+
+    At most `2 * max_workers` tasks are in flight, so results can be streamed
+    into a report without holding the whole input or output in memory.
+    """
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        in_flight = set()
+        for item in items:
+            in_flight.add(pool.submit(contextvars.copy_context().run, fn, item))
+            if len(in_flight) >= 2 * max_workers:
+                done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield future.result()
+        for future in as_completed(in_flight):
+            yield future.result()
+
+
+def metrics(service=None):
+    """Return {"service/region": metrics} for every limiter (optionally one service)."""
+    with _registry_lock:
+        limiters = list(_limiters.items())
+    return {limiter.name: limiter.metrics() for (svc, _, _), limiter in limiters if service in (None, svc)}
+
+
+def log_metrics(service=None):
+    """Log one line of scheduler metrics per (service, region) that made calls."""
+    for name, stats in metrics(service).items():
+        if stats["calls"]:
+            logging.info(
+                f"API scheduler {name}: {stats['calls']} calls, {stats['throttles']} throttles, "
+                f"{stats['retries']} retries, {stats['throughput_per_s']} calls/s"
+            )
+
+
+def reset():
+    """Forget all limiters and metrics (used by tests)."""
+    with _registry_lock:
+        _limiters.clear()
@@ -0,0 +1,200 @@
+"""
+Shared Record Types
+-------------------
+Compact row types used by every check instead of per-row dicts.
+
+A dict per finding costs a hash table per row, and the same region, state or
+severity string is stored again in every row. The record classes here use
+`__slots__` (a fixed attribute array, no per-instance dict) and intern their
+categorical fields with `sys.intern`, so each distinct "us-east-1" or
+"running" is held once however many rows refer to it.
+
+Records still read like the dicts they replace: `record["region"]`,
+`record.get("issues")`, `dict(record)` and `{**record}` all work, so the
+report writer, multi-account tagging and existing callers are unchanged.
+Every record has an optional `account_id`, set when several accounts are
+scanned (see `multi_account`).
+
+`to_columns` and `to_frame` convert records in bulk straight into column
+lists or a DataFrame (categorical fields become pandas categories), without
+building an intermediate list of dicts.
+"""
+import sys
+
+ACCOUNT_FIELD = "account_id"
+
+
+def _intern(value):
+    return sys.intern(value) if type(value) is str else value
+
+
+class Record:
+    """Base class: subclasses list their report fields in `FIELDS` (also their slots)."""
+
+    __slots__ = (ACCOUNT_FIELD,)
+    FIELDS = ()
+    CATEGORICAL = ()
+    _KEYS = frozenset({ACCOUNT_FIELD})
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls._KEYS = frozenset(cls.FIELDS) | {ACCOUNT_FIELD}
+
+    def __init__(self, *args, account_id=None, **kwargs):
+        if len(args) > len(self.FIELDS):
+            raise TypeError(f"{type(self).__name__} takes at most {len(self.FIELDS)} positional fields")
+        values = dict(zip(self.FIELDS, args), **kwargs)
+        unknown = set(values) - set(self.FIELDS)
+        if unknown:
+            raise TypeError(f"{type(self).__name__} has no field(s): {', '.join(sorted(unknown))}")
+        categorical = self.CATEGORICAL
+        for name in self.FIELDS:
+            value = values.get(name)
+            setattr(self, name, _intern(value) if name in categorical else value)
+        self.account_id = _intern(account_id)
+
+    # Mapping interface, so records drop in where row dicts were used
+    def keys(self):
+        if self.account_id is None:
+            return list(self.FIELDS)
+        return [ACCOUNT_FIELD, *self.FIELDS]
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __len__(self):
+        return len(self.keys())
+
+    def __contains__(self, key):
+        return key in self._KEYS and (key != ACCOUNT_FIELD or self.account_id is not None)
+
+    def __getitem__(self, key):
+        if key not in self._KEYS:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def __setitem__(self, key, value):
+        if key not in self._KEYS:
+            raise KeyError(key)
+        setattr(self, key, _intern(value) if key in self.CATEGORICAL or key == ACCOUNT_FIELD else value)
+
+    def get(self, key, default=None):
+        if key not in self._KEYS:
+            return default
+        value = getattr(self, key)
+        return default if value is None and key == ACCOUNT_FIELD else value
+
+    def values_for(self, columns):
+        """Values of `columns`, in order (None for unknown columns)."""
+        return [getattr(self, column) if column in self._KEYS else None for column in columns]
+
+    def items(self):
+        return [(key, getattr(self, key)) for key in self.keys()]
+
+    def as_dict(self):
+        return {key: getattr(self, key) for key in self.keys()}
+
+    def copy(self):
+        clone = object.__new__(type(self))
+        for name in self.FIELDS:
+            setattr(clone, name, getattr(self, name))
+        clone.account_id = self.account_id
+        return clone
+
+    # Slotted classes have no __dict__; spell out pickling (used when reports spool rows)
+    def __getstate__(self):
+        return tuple(getattr(self, name) for name in self.FIELDS) + (self.account_id,)
+
+    def __setstate__(self, state):
+        for name, value in zip(self.FIELDS, state):
+            setattr(self, name, _intern(value) if name in self.CATEGORICAL else value)
+        self.account_id = _intern(state[-1])
+
+    def __eq__(self, other):
+        if type(other) is not type(self):
+            return NotImplemented
+        return self.__getstate__() == other.__getstate__()
+
+    __hash__ = None
+
+    def __repr__(self):
+        fields = ", ".join(f"{key}={getattr(self, key)!r}" for key in self.keys())
+        return f"{type(self).__name__}({fields})"
+
+
+class UserRecord(Record):
+    """IAM user without MFA (fafo_checker)."""
+
+    __slots__ = FIELDS = ("user_name", "user_arn", "create_date", "create_date_str")
+
+
+class AccessKeyRecord(Record):
+    """Unused IAM access key (unused_iam_access_keys)."""
+
+    __slots__ = FIELDS = ("user_name", "access_key_id", "create_date", "last_used", "age_days")
+
+
+class InstanceFinding(Record):
+    """Non-compliant EC2 instance (ec2_compliance_check)."""
+
+    __slots__ = FIELDS = ("instance_id", "instance_type", "state", "region", "launch_time", "issues")
+    CATEGORICAL = ("instance_type", "state", "region")
+
+
+class BucketRecord(Record):
+    """S3 bucket; the control columns are filled in by the --deep audit (list_s3_buckets)."""
+
+    __slots__ = FIELDS = (
+        "bucket_name", "creation_date", "creation_date_str", "region",
+        "default_encryption", "public_access_block", "versioning", "access_logging", "issues",
+    )
+    CATEGORICAL = ("region", "default_encryption", "public_access_block", "versioning")
+
+
+class ConfigRuleRecord(Record):
+    """Non-compliant AWS Config rule (config_noncompliant_rules)."""
+
+    __slots__ = FIELDS = ("config_rule", "compliance_type", "noncompliant_count")
+    CATEGORICAL = ("compliance_type",)
+
+
+class ConfigResourceRecord(Record):
+    """Non-compliant resource of a Config rule (config_noncompliant_rules --details)."""
+
+    __slots__ = FIELDS = (
+        "config_rule", "resource_type", "resource_id", "compliance_type", "result_recorded_time", "annotation",
+    )
+    CATEGORICAL = ("config_rule", "resource_type", "compliance_type")
+
+
+class SeverityCount(Record):
+    """Findings per severity band (guardduty_findings_summary)."""
+
+    __slots__ = FIELDS = ("severity", "count")
+    CATEGORICAL = ("severity",)
+
+
+def to_columns(records, columns):
+    """Transpose records (or row dicts) into {column: [values]} in one pass."""
+    data = {column: [] for column in columns}
+    appends = [data[column].append for column in columns]
+    for record in records:
+        if isinstance(record, Record):
+            values = record.values_for(columns)
+        else:
+            values = [record.get(column) for column in columns]
+        for append, value in zip(appends, values):
+            append(value)
+    return data
+
+
+def to_frame(records, record_type, columns=None):
+    """Build a DataFrame straight from records; categorical fields become pandas categories."""
+    import pandas as pd  # imported lazily so gate-only runs never load pandas
+
+    columns = list(columns or record_type.FIELDS)
+    frame = pd.DataFrame(to_columns(records, columns), columns=columns)
+    for column in record_type.CATEGORICAL:
+        if column in frame:
+            frame[column] = frame[column].astype("category")
+    return frame
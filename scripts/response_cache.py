@@ -0,0 +1,189 @@
+"""
+On-Disk AWS Response Cache
+--------------------------
+Opt-in cache for slow-changing, read-only API calls (regions, user and bucket
+lists, detectors, Config compliance summaries) that the checks repeat many
+times a day.
+
+The cache hooks into botocore's event system, so the scripts do not change:
+`aws_clients.get_client` attaches it to every client once `enable()` has been
+called (normally via the shared `--cache` option).
+
+- `before-parameter-build` computes the key from
+  (account, region, service, operation, params);
+- `before-call` returns a fresh cached response, which skips the HTTP request;
+- `after-call` stores successful responses.
+
+Only operations listed in `DEFAULT_TTLS` (or given a TTL explicitly) are
+cached. Entries live in one pickle file each; total size is bounded and the
+least recently used entries are evicted first. `refresh=True` (`--refresh`)
+ignores existing entries but still stores new responses.
+"""
+import argparse
+import hashlib
+import json
+import logging
+import os
+import pickle
+import tempfile
+import threading
+import time
+from collections import Counter
+
+from botocore.awsrequest import AWSResponse
+
+from rate_limiter import without_retry_attempts
+
+DEFAULT_CACHE_DIR = ".aws_response_cache"
+DEFAULT_MAX_BYTES = 100 * 1024 * 1024
+# Seconds each operation may be served from cache.
+DEFAULT_TTLS = {
+    "ec2.DescribeRegions": 24 * 3600,
+    "iam.ListUsers": 900,
+    "s3.ListBuckets": 900,
+    "s3.GetBucketLocation": 24 * 3600,
+    "guardduty.ListDetectors": 3600,
+    "config.DescribeComplianceByConfigRule": 900,
+}
+
+_lock = threading.Lock()
+_cache = None
+
+
+class ResponseCache:
+    """Size-bounded LRU store of parsed API responses with per-operation TTLs."""
+
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, ttls=None, max_bytes=DEFAULT_MAX_BYTES, refresh=False):
+        self.cache_dir = cache_dir
+        self.ttls = {**DEFAULT_TTLS, **(ttls or {})}
+        self.max_bytes = max_bytes
+        self.refresh = refresh
+        self.stats = Counter()
+        self._lock = threading.Lock()
+        os.makedirs(cache_dir, exist_ok=True)
+        self._sizes = {
+            entry.path: entry.stat().st_size for entry in os.scandir(cache_dir) if entry.name.endswith(".pkl")
+        }
+
+    def ttl_for(self, operation_key):
+        return self.ttls.get(operation_key)
+
+    def _path(self, key):
+        digest = hashlib.sha256(json.dumps(key, sort_keys=True, default=str).encode()).hexdigest()
+        return os.path.join(self.cache_dir, f"{digest}.pkl")
+
+    def get(self, key, ttl):
+        """Return the cached response for `key` if younger than `ttl`, else None."""
+        path = self._path(key)
+        if self.refresh:
+            self._count("bypassed")
+            return None
+        try:
+            with open(path, "rb") as fh:
+                stored_at, response = pickle.load(fh)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            self._count("misses")
+            return None
+        if time.time() - stored_at > ttl:
+            self._count("misses")
+            return None
+        os.utime(path)  # mark as recently used for LRU eviction
+        self._count("hits")
+        return response
+
+    def _count(self, name):
+        with self._lock:
+            self.stats[name] += 1
+
+    def put(self, key, response):
+        """Store a response, then evict least recently used entries over the size limit."""
+        path = self._path(key)
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix=".tmp")
+        with os.fdopen(fd, "wb") as fh:
+            pickle.dump((time.time(), response), fh, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+        with self._lock:
+            self._sizes[path] = os.path.getsize(path)
+            self._evict()
+
+    def _evict(self):
+        total = sum(self._sizes.values())
+        if total <= self.max_bytes:
+            return
+        by_age = sorted(self._sizes, key=lambda p: os.path.getmtime(p) if os.path.exists(p) else 0)
+        for path in by_age:
+            if total <= self.max_bytes:
+                break
+            total -= self._sizes.pop(path)
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            self.stats["evictions"] += 1
+
+    def attach(self, client, account_id):
+        """Register the cache handlers on one client's event system."""
+        service = client.meta.service_model.service_name
+        region = client.meta.region_name
+
+        def build_key(params, model, context, **kwargs):
+            operation_key = f"{service}.{model.name}"
+            ttl = self.ttl_for(operation_key)
+            if ttl:
+                context["response_cache"] = ((account_id, region, service, model.name, params), ttl)
+
+        def lookup(context, **kwargs):
+            entry = context.get("response_cache")
+            if not entry:
+                return None
+            response = self.get(*entry)
+            if response is None:
+                return None
+            context["response_cache_hit"] = True
+            return AWSResponse(url="", status_code=200, headers={}, raw=None), without_retry_attempts(response)
+
+        def store(http_response, parsed, context, **kwargs):
+            entry = context.get("response_cache")
+            if entry and not context.get("response_cache_hit") and http_response.status_code < 300:
+                self.put(entry[0], parsed)
+
+        client.meta.events.register("before-parameter-build", build_key)
+        client.meta.events.register_first("before-call", lookup)
+        client.meta.events.register("after-call", store)
+
+
+def enable(cache_dir=DEFAULT_CACHE_DIR, ttls=None, max_bytes=DEFAULT_MAX_BYTES, refresh=False):
+    """Turn the cache on for clients created from now on; returns the cache."""
+    global _cache
+    with _lock:
+        if _cache is None:
+            _cache = ResponseCache(cache_dir, ttls, max_bytes, refresh)
+            logging.info(f"AWS response cache enabled: {cache_dir}{' (refresh)' if refresh else ''}")
+        return _cache
+
+
+def disable():
+    global _cache
+    with _lock:
+        _cache = None
+
+
+def get_cache():
+    """Return the active cache, or None when caching is off."""
+    return _cache
+
+
+def stats_summary():
+    """Short hit/miss text for the "Completed in … seconds" log line ("" when off)."""
+    cache = _cache
+    if cache is None:
+        return ""
+    return f" (cache hits: {cache.stats['hits']}, misses: {cache.stats['misses']})"
+
+
+def parse_ttl_override(value):
+    """argparse type for "service.Operation=SECONDS": return ("service.Operation", SECONDS)."""
+    operation_key, _, seconds = value.partition("=")
+    if not operation_key or not seconds.isdigit():
+        raise argparse.ArgumentTypeError(f"expected service.Operation=SECONDS, e.g. iam.ListUsers=300, got {value!r}")
+    return operation_key, int(seconds)
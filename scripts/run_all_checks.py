@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+"""
+Run All Compliance Checks
+-------------------------
+Single-process entry point for CI. Instead of six Python processes that each
+pay the boto3/pandas/openpyxl import and credential-resolution cost one after
+another, the selected checks run concurrently in one process and share the
+cached clients from `aws_clients`.
+
+Each check writes its usual report. The shared options from `cli_options`
+(`--no-report`, `--cache`, `--metrics`, …) are forwarded to every check. The combined exit code keeps the
+per-script convention: 2 if any check found violations, otherwise 1 if any
+check errored, otherwise 0. A per-check timing summary is logged and written
+to `compliance_run_summary.json`.
+"""
+import argparse
+import json
+import logging
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+# Configure logging before the checks are imported so their own
+# basicConfig calls become no-ops and every thread logs to one file.
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s - %(threadName)s - %(levelname)s - %(message)s",
+    handlers=[logging.FileHandler("compliance_run.log"), logging.StreamHandler()],
+)
+
+import config_noncompliant_rules  # noqa: E402
+import ec2_compliance_check  # noqa: E402
+import fafo_checker  # noqa: E402
+import guardduty_findings_summary  # noqa: E402
+import list_s3_buckets  # noqa: E402
+import unused_iam_access_keys  # noqa: E402
+import response_cache  # noqa: E402
+from cli_options import add_common_options, apply_common_options, common_argv  # noqa: E402
+
+CHECKS = {
+    "iam_mfa": fafo_checker,
+    "s3_buckets": list_s3_buckets,
+    "ec2": ec2_compliance_check,
+    "config_rules": config_noncompliant_rules,
+    "guardduty": guardduty_findings_summary,
+    "iam_access_keys": unused_iam_access_keys,
+}
+SUMMARY_FILE = "compliance_run_summary.json"
+
+
+def run_check(name, argv=None):
+    """Run one check in the current thread and return its result dict."""
+    threading.current_thread().name = name
+    module = CHECKS[name]
+    start = time.perf_counter()
+    try:
+        exit_code = module.run(module.parse_args(argv or []))
+    except Exception as e:
+        logging.error(f"Check {name} failed: {str(e)}")
+        exit_code = 1
+    return {"check": name, "exit_code": exit_code, "seconds": round(time.perf_counter() - start, 3)}
+
+
+def combine_exit_codes(codes):
+    """2 if any violation, else 1 if any error, else 0."""
+    if 2 in codes:
+        return 2
+    if any(code not in (0, 2) for code in codes):
+        return 1
+    return 0
+
+
+def write_summary(results, total_seconds, filename=SUMMARY_FILE):
+    """Log the per-check timing table and save it as JSON."""
+    for result in sorted(results, key=lambda r: r["seconds"], reverse=True):
+        logging.info(f"{result['check']:<16} exit={result['exit_code']}  {result['seconds']:.2f}s")
+    summary = {
+        "report_generated_at": datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M:%S"),
+        "total_seconds": round(total_seconds, 3),
+        "exit_code": combine_exit_codes([r["exit_code"] for r in results]),
+        "checks": results,
+    }
+    with open(filename, "w") as fh:
+        json.dump(summary, fh, indent=2)
+    logging.info(f"Timing summary saved: {filename}")
+    return summary
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Run the selected compliance checks concurrently.")
+    parser.add_argument(
+        "--checks",
+        nargs="+",
+        choices=sorted(CHECKS),
+        default=list(CHECKS),
+        help="Checks to run (default: all).",
+    )
+    parser.add_argument(
+        "--max-workers",
+        type=int,
+        default=len(CHECKS),
+        help="Checks run at the same time (default: all of them).",
+    )
+    add_common_options(parser)
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    # Enable shared features (cache, metrics) before any check creates a client
+    apply_common_options(args)
+    logging.info(f"=== Running compliance checks: {', '.join(args.checks)} ===")
+    start = time.perf_counter()
+
+    check_argv = common_argv(args)
+    with ThreadPoolExecutor(max_workers=max(1, args.max_workers)) as pool:
+        results = list(pool.map(lambda name: run_check(name, check_argv), args.checks))
+
+    summary = write_summary(results, time.perf_counter() - start)
+    logging.info(
+        f"Completed in {summary['total_seconds']:.2f} seconds{response_cache.stats_summary()}"
+        f" – exit code {summary['exit_code']}"
+    )
+    sys.exit(summary["exit_code"])
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,166 @@
+"""
+Work Sharding
+-------------
+`--shard I/N` (a common option) runs shard I (1-based) of N, so one check can
+be spread over N CI runners. The split is deterministic, so every runner
+computes the same partition without coordinating:
+
+- EC2 and GuardDuty: regions, sorted and dealt round-robin (each shard gets
+  an equal share of the enabled regions);
+- IAM checks: users, by a hash of the user name;
+- S3: buckets, by a hash of the bucket name;
+- Config: rules, by a hash of the rule name.
+
+Names are hashed with CRC32, not Python's `hash()` (salted per process).
+
+A sharded check writes its rows and exit code to a partial result file,
+`<shard dir>/<check>.shard-I-of-N.json`, instead of its report.
+`merge_shards.py` combines the partials into the same report and exit code
+as an unsharded run.
+"""
+import argparse
+import json
+import logging
+import os
+import zlib
+from datetime import datetime
+
+import multi_account
+from records import Record
+
+DEFAULT_SHARD_DIR = "shards"
+
+_settings = {"shard": None, "directory": DEFAULT_SHARD_DIR}
+_RECORD_TYPES = {cls.__name__: cls for cls in Record.__subclasses__()}
+
+
+def parse_shard(value):
+    """argparse type for "I/N": return (I, N) with 1 <= I <= N."""
+    try:
+        index, count = (int(part) for part in value.split("/"))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"expected I/N, e.g. 1/4, got {value!r}") from None
+    if not 1 <= index <= count:
+        raise argparse.ArgumentTypeError(f"shard index must be between 1 and {count}, got {value!r}")
+    return index, count
+
+
+def configure(shard=None, directory=DEFAULT_SHARD_DIR):
+    """Run as shard (I, N) from now on (None: unsharded)."""
+    _settings.update(shard=tuple(shard) if shard else None, directory=directory)
+
+
+def enabled():
+    return _settings["shard"] is not None
+
+
+def current():
+    """(I, N) of this run, or None."""
+    return _settings["shard"]
+
+
+def owns(key):
+    """True if this shard owns the user, bucket or rule named `key` (always True unsharded)."""
+    if not enabled():
+        return True
+    index, count = _settings["shard"]
+    return zlib.crc32(key.encode()) % count == index - 1
+
+
+def select(items, key=lambda item: item):
+    """The items whose `key(item)` this shard owns."""
+    if not enabled():
+        return list(items)
+    return [item for item in items if owns(key(item))]
+
+
+def select_regions(regions):
+    """This shard's regions: every N-th of the sorted region names."""
+    if not enabled():
+        return list(regions)
+    index, count = _settings["shard"]
+    return sorted(regions)[index - 1::count]
+
+
+def shard_file(path, shard=None):
+    """`path` with the shard in its name (guardduty_state.json -> guardduty_state.shard-1-of-4.json)."""
+    index, count = shard or _settings["shard"]
+    root, ext = os.path.splitext(path)
+    return f"{root}.shard-{index}-of-{count}{ext}"
+
+
+def partial_path(check, shard=None, directory=None):
+    return shard_file(os.path.join(directory or _settings["directory"], f"{check}.json"), shard)
+
+
+def _encode(value):
+    if isinstance(value, datetime):
+        return {"$datetime": value.isoformat()}
+    raise TypeError(f"cannot store {type(value).__name__} in a partial result")
+
+
+def _decode(value):
+    if set(value) == {"$datetime"}:
+        return datetime.fromisoformat(value["$datetime"])
+    return value
+
+
+def _encode_rows(rows):
+    rows = list(rows)
+    record_type = type(rows[0]).__name__ if rows and isinstance(rows[0], Record) else None
+    return {"record_type": record_type, "rows": [dict(row) for row in rows]}
+
+
+def _decode_rows(table):
+    record_type = _RECORD_TYPES.get(table["record_type"])
+    if record_type is None:
+        return table["rows"]
+    return [record_type(**row) for row in table["rows"]]
+
+
+def write_partial(check, exit_code, tables, options=None, complete=True):
+    """Write this shard's result: {table name: rows}, the exit code and the options the report needs.
+
+    `complete` is False when regions or accounts of this shard could not be scanned.
+    """
+    index, count = _settings["shard"]
+    path = partial_path(check)
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    partial = {
+        "check": check,
+        "shard": index,
+        "shards": count,
+        "exit_code": exit_code,
+        "complete": complete,
+        "accounts": multi_account.selected_accounts(),
+        "options": options or {},
+        "tables": {name: _encode_rows(rows) for name, rows in tables.items()},
+    }
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as fh:
+        json.dump(partial, fh, default=_encode, separators=(",", ":"))
+    os.replace(tmp_path, path)
+    logging.info(f"Shard {index}/{count} of {check}: partial result saved to {path} (exit code {exit_code})")
+    return path
+
+
+def read_partials(check, directory=DEFAULT_SHARD_DIR):
+    """Load every partial of `check`; raise ValueError unless exactly shards 1..N of one N are present."""
+    prefix = f"{check}.shard-"
+    names = sorted(name for name in os.listdir(directory) if name.startswith(prefix) and name.endswith(".json"))
+    partials = []
+    for name in names:
+        with open(os.path.join(directory, name)) as fh:
+            partial = json.load(fh, object_hook=_decode)
+        partial["tables"] = {table: _decode_rows(rows) for table, rows in partial["tables"].items()}
+        partials.append(partial)
+    if not partials:
+        raise ValueError(f"no partial results for {check} in {directory}")
+    counts = {partial["shards"] for partial in partials}
+    if len(counts) > 1:
+        raise ValueError(f"{check}: partials from different shard counts {sorted(counts)}")
+    (count,) = counts
+    missing = sorted(set(range(1, count + 1)) - {partial["shard"] for partial in partials})
+    if missing:
+        raise ValueError(f"{check}: missing shard(s) {', '.join(f'{index}/{count}' for index in missing)}")
+    return sorted(partials, key=lambda partial: partial["shard"])
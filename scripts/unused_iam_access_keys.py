@@ -4,70 +4,217 @@ Unused IAM Access Keys Checker
 ------------------------------
 Flags active access keys that have not been used in the last 90 days.
 Outputs Excel + audit log. Exit 2 if any unused keys detected.
+
+`--credential-report` reads last-used dates from one IAM credential report
+instead of calling `get_access_key_last_used` per key. Every user's keys are
+still listed (`list_access_keys`, which recovers the key IDs the report lacks)
+and matched to the report's key slots by creation time. Keys the report does
+not know (created after it was generated) and users it cannot resolve fall
+back to the per-key `get_access_key_last_used` path, so both modes examine
+the same keys.
 """
-import boto3
-import pandas as pd
+import argparse
 import logging
 from datetime import datetime, timedelta, timezone
 import sys
 
+import controls
+import history_store
+import multi_account
+import rate_limiter
+import sharding
+from aws_clients import get_client
+from cli_options import add_common_options, apply_common_options
+from evidence_writer import write_report
+from iam_credential_report import (
+    count_api_calls,
+    current_users,
+    fetch_credential_report,
+    iter_credential_report,
+    parse_report_date,
+)
+from records import AccessKeyRecord
+
 logging.basicConfig(
     level=logging.INFO,
     format="%(asctime)s - %(levelname)s - %(message)s",
     handlers=[logging.FileHandler("iam_keys_audit.log"), logging.StreamHandler()],
 )
 
-def list_unused_keys(threshold_days: int = 90):
-    iam = boto3.client("iam")
+REPORT_COLUMNS = list(AccessKeyRecord.FIELDS)
+# Facts collected per access key before the last-use control is evaluated
+INVENTORY_COLUMNS = ["user_name", "access_key_id", "status", "create_date", "last_used", "age_days"]
+
+def _key_record(row):
+    return AccessKeyRecord(**{column: row[column] for column in REPORT_COLUMNS})
+
+def _unused_keys(rows, threshold_days):
+    """Evaluate the built-in iam_access_keys controls (`controls.DEFAULT_CONTROLS`); return the failing keys."""
+    control_list = controls.builtin_controls("iam_access_keys", {"max_key_age_days": threshold_days})
+    return [_key_record(row) for row, _ in controls.evaluate_rows(rows, INVENTORY_COLUMNS, control_list)]
+
+def _keys_for_user(iam, username, known_last_used=None):
+    """Fact rows (INVENTORY_COLUMNS) for a user's keys.
+
+    Last use is only looked up for active keys, and not for keys whose
+    creation time (to the second) is in `known_last_used` ({creation time:
+    last use}, from the credential report).
+    """
+    known_last_used = known_last_used or {}
+    rows = []
+    keys = rate_limiter.call(iam, "list_access_keys", UserName=username)["AccessKeyMetadata"]
+    for key in keys:
+        last_used = None
+        created = key["CreateDate"].replace(microsecond=0)
+        if key["Status"] != "Active":
+            pass  # inactive keys cannot be used, so skip the lookup
+        elif created in known_last_used:
+            last_used = known_last_used[created]
+        else:
+            last_used_resp = rate_limiter.call(iam, "get_access_key_last_used", AccessKeyId=key["AccessKeyId"])
+            last_used = last_used_resp.get("AccessKeyLastUsed", {}).get("LastUsedDate")
+        rows.append({
+            "user_name": username,
+            "access_key_id": key["AccessKeyId"],
+            "status": key["Status"],
+            "create_date": key["CreateDate"],
+            "last_used": last_used,
+            "age_days": (datetime.now(timezone.utc) - key["CreateDate"]).days,
+        })
+    return rows
+
+def _unused_keys_for_user(iam, username, threshold_days):
+    """Single-user path (event consumer): list the user's keys, look up each key's last use and evaluate."""
+    return _unused_keys(_keys_for_user(iam, username), threshold_days)
+
+def key_inventory(iam):
+    """Per-user path: fact rows for every access key of every IAM user, nothing evaluated."""
     paginator = iam.get_paginator("list_users")
+    # With --shard, only this shard's users are looked up
+    usernames = sharding.select(user["UserName"] for page in paginator.paginate() for user in page["Users"])
+    # Per-user lookups fan out through the throttle-aware scheduler
+    per_user = rate_limiter.fan_out(lambda name: _keys_for_user(iam, name), usernames, iam)
+    return [row for rows in per_user for row in rows]
+
+def _report_last_used(row):
+    """Return {creation time: last use} for the active key slots of a credential report row.
+
+    Creation times (`last_rotated`) are truncated to the second, as in
+    `_keys_for_user`. Raises ValueError when a slot cannot be interpreted.
+    """
+    last_used = {}
+    for slot in (1, 2):
+        active = row.get(f"access_key_{slot}_active")
+        if active == "false":
+            continue
+        if active != "true":
+            raise ValueError(f"unexpected access_key_{slot}_active value: {active!r}")
+        last_rotated = parse_report_date(row[f"access_key_{slot}_last_rotated"])
+        if last_rotated is None:
+            raise ValueError(f"active access_key_{slot} has no creation date")
+        last_used[last_rotated.replace(microsecond=0)] = parse_report_date(row[f"access_key_{slot}_last_used_date"])
+    return last_used
+
+def _unused_keys_from_report(iam, threshold_days):
+    """Bulk path: last-use dates from the credential report, keys from `list_access_keys`.
+
+    The report has no key IDs, so every user's keys are listed and matched
+    to its key slots by creation time (`last_rotated`). Keys without a
+    matching slot, users whose row cannot be parsed and users created after
+    the report was generated (absent from it) have their last use looked up
+    per key instead.
+    """
+    users = current_users(iam)
+    known_last_used = {}
+    fallbacks = 0
+
+    for row in iter_credential_report(fetch_credential_report(iam)):
+        username = row["user"]
+        # Users deleted since the report was generated have no keys left
+        if username not in users or not sharding.owns(username):
+            continue
+        try:
+            known_last_used[username] = _report_last_used(row)
+        except (KeyError, ValueError) as error:
+            logging.debug(f"Credential report cannot resolve keys for {username} ({error}) – querying directly")
+            fallbacks += 1
+            known_last_used[username] = {}
+
+    missing = sharding.select(username for username in users if username not in known_last_used)
+    if missing:
+        logging.info(f"{len(missing)} users are newer than the credential report – checking their keys directly")
+    usernames = list(known_last_used) + missing
+    per_user = rate_limiter.fan_out(
+        lambda name: _keys_for_user(iam, name, known_last_used.get(name)), usernames, iam
+    )
+
+    if fallbacks:
+        logging.info(f"Per-user access key fallback used for {fallbacks} report rows")
+    return _unused_keys([row for rows in per_user for row in rows], threshold_days)
+
+def list_unused_keys(threshold_days: int = 90, use_credential_report: bool = False):
+    iam = get_client("iam")
     # Use timezone-aware UTC datetime to avoid deprecation warnings
     cutoff = datetime.now(timezone.utc) - timedelta(days=threshold_days)
-    unused = []
+    mode = "credential-report" if use_credential_report else "per-user"
 
     logging.info(f"Scanning IAM users for keys unused since {cutoff:%Y-%m-%d}")
 
-    for page in paginator.paginate():
-        for user in page["Users"]:
-            username = user["UserName"]
-            keys = iam.list_access_keys(UserName=username)["AccessKeyMetadata"]
-            for key in keys:
-                if key["Status"] != "Active":
-                    continue  # ignore inactive keys
-                last_used_resp = iam.get_access_key_last_used(AccessKeyId=key["AccessKeyId"])
-                last_used = last_used_resp.get("AccessKeyLastUsed", {}).get("LastUsedDate")
-                if last_used is None or last_used < cutoff:
-                    unused.append(
-                        {
-                            "user_name": username,
-                            "access_key_id": key["AccessKeyId"],
-                            "create_date": key["CreateDate"],
-                            "last_used": last_used,
-                            "age_days": (datetime.now(timezone.utc) - key["CreateDate"]).days,
-                        }
-                    )
+    with count_api_calls(iam) as api_calls:
+        if use_credential_report:
+            unused = _unused_keys_from_report(iam, threshold_days)
+        else:
+            unused = _unused_keys(key_inventory(iam), threshold_days)
+
+    logging.info(f"IAM API calls ({mode} mode): {sum(api_calls.values())} {dict(api_calls)}")
     return unused
 
 def export_excel(data, filename="iam_unused_access_keys.xlsx"):
-    df = pd.DataFrame(data)
-    if df.empty:
+    written = write_report(
+        data,
+        filename,
+        sheet_name="Unused_Access_Keys",
+        columns=multi_account.report_columns(REPORT_COLUMNS),
+        metadata={"report_generated_at": datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M:%S")},
+    )
+    if not written:
         logging.info("No unused active keys detected – placeholder report created")
-        df = pd.DataFrame(columns=["user_name", "access_key_id", "create_date", "last_used", "age_days"])
-    else:
-        # Remove timezone info for Excel compatibility
-        df["create_date"] = pd.to_datetime(df["create_date"]).dt.tz_localize(None)
-        if df["last_used"].notna().any():
-            df["last_used"] = pd.to_datetime(df["last_used"]).dt.tz_localize(None)
-    df["report_generated_at"] = datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
-    df.to_excel(filename, index=False, sheet_name="Unused_Access_Keys")
-    logging.info(f"Excel report saved: {filename}")
-
-def main():
+    return written
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Flag active IAM access keys unused for 90+ days.")
+    parser.add_argument(
+        "--credential-report",
+        action="store_true",
+        help="Answer the check from one IAM credential report instead of per-key calls.",
+    )
+    add_common_options(parser)
+    return parser.parse_args(argv)
+
+def run(args):
+    """Run the check, write the report and return the CI exit code."""
+    apply_common_options(args)
     logging.info("=== Unused IAM Access Keys Check ===")
-    unused_keys = list_unused_keys()
-    export_excel(unused_keys)
-    violations = len(unused_keys)
-    logging.info(f"Total unused active keys: {violations}")
-    sys.exit(2 if violations else 0)
+    account_errors = {}
+    try:
+        unused_keys = multi_account.collect(
+            lambda: list_unused_keys(use_credential_report=args.credential_report), account_errors
+        )
+    except Exception as error:
+        logging.error(f"Failed to evaluate access keys: {error}")
+        return 1
+    rate_limiter.log_metrics("iam")
+    exit_code = 2 if unused_keys else (1 if account_errors else 0)
+    if sharding.enabled():
+        sharding.write_partial("iam_access_keys", exit_code, {"keys": unused_keys}, complete=not account_errors)
+    elif not args.no_report:
+        export_excel(unused_keys)
+    history_store.record_run("iam_access_keys", unused_keys, "access_key_id", complete=not account_errors)
+    logging.info(f"Total unused active keys: {len(unused_keys)}")
+    return exit_code
+
+def main(argv=None):
+    sys.exit(run(parse_args(argv)))
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,33 @@
+"""Shared pytest fixtures – fake AWS credentials and an isolated working directory."""
+import sys
+
+import pytest
+
+sys.path.append("scripts")
+
+import api_metrics  # noqa: E402  pylint: disable=import-error
+import api_snapshot  # noqa: E402  pylint: disable=import-error
+import evidence_writer  # noqa: E402  pylint: disable=import-error
+import history_store  # noqa: E402  pylint: disable=import-error
+import multi_account  # noqa: E402  pylint: disable=import-error
+import sharding  # noqa: E402  pylint: disable=import-error
+from aws_clients import clear_client_cache  # noqa: E402  pylint: disable=import-error
+
+
+@pytest.fixture(autouse=True)
+def aws_credentials(monkeypatch, tmp_path):
+    """Point boto3 at dummy credentials, write reports into a temp directory and start with no cached clients or selected accounts."""
+    monkeypatch.setenv("AWS_ACCESS_KEY_ID", "testing")
+    monkeypatch.setenv("AWS_SECRET_ACCESS_KEY", "testing")
+    monkeypatch.setenv("AWS_SESSION_TOKEN", "testing")
+    monkeypatch.setenv("AWS_DEFAULT_REGION", "us-east-1")
+    monkeypatch.chdir(tmp_path)
+    clear_client_cache()
+    yield
+    clear_client_cache()
+    multi_account.configure()
+    api_metrics.disable()
+    api_snapshot.disable()
+    evidence_writer.configure()
+    history_store.configure()
+    sharding.configure()
@@ -0,0 +1,42 @@
+"""Unit tests for the per-operation API metrics hooks."""
+import json
+import sys
+
+import pytest
+from botocore.exceptions import ClientError
+from moto import mock_aws
+
+sys.path.append("scripts")
+
+import api_metrics  # noqa: E402  pylint: disable=import-error
+from aws_clients import get_client  # noqa: E402  pylint: disable=import-error
+
+
+@mock_aws
+def test_calls_errors_and_latency_are_recorded_per_operation(tmp_path):
+    api_metrics.enable(tmp_path / "metrics", job="unit")
+    iam = get_client("iam")
+    iam.create_user(UserName="metrics-user")
+    iam.list_users()
+    iam.list_users()
+    with pytest.raises(ClientError):
+        iam.get_user(UserName="missing")
+
+    json_path, prom_path = api_metrics.write()
+
+    operations = json.loads(open(json_path).read())["operations"]
+    list_users = operations["iam.ListUsers@aws-global"]
+    assert list_users["calls"] == 2
+    assert sum(list_users["latency_buckets"]) == 2
+    assert list_users["request_bytes"] > 0 and list_users["response_bytes"] > 0
+    assert operations["iam.GetUser@aws-global"]["errors"] == 1
+
+    prom = open(prom_path).read()
+    labels = 'check="unit",service="iam",operation="ListUsers",region="aws-global"'
+    assert f"grc_aws_api_calls_total{{{labels}}} 2" in prom
+    assert f'grc_aws_api_latency_seconds_bucket{{{labels},le="+Inf"}} 2' in prom
+
+
+def test_clients_are_not_instrumented_unless_enabled():
+    get_client("iam")
+    assert api_metrics.get_metrics() is None
@@ -0,0 +1,88 @@
+"""Unit tests for api_snapshot: record a run under moto, then replay it offline."""
+import csv
+import json
+import lzma
+import sys
+from datetime import datetime, timezone
+
+import boto3
+from moto import mock_aws
+
+sys.path.append("scripts")
+
+import api_snapshot  # noqa: E402  pylint: disable=import-error
+import scripts.ec2_compliance_check as ec2_compliance_check  # noqa: E402  pylint: disable=import-error
+import scripts.fafo_checker as fafo_checker  # noqa: E402  pylint: disable=import-error
+from aws_clients import clear_client_cache  # noqa: E402  pylint: disable=import-error
+
+
+def _read(path):
+    # report_generated_at differs between runs; regions finish in any order
+    with open(path, newline="") as fh:
+        rows = [{k: v for k, v in row.items() if k != "report_generated_at"} for row in csv.DictReader(fh)]
+    return sorted(rows, key=lambda row: sorted(row.items()))
+
+
+def test_time_window_parameters_are_masked():
+    """Keys should not depend on the time window, only on the other parameters."""
+    key = api_snapshot.call_key("default", "us-east-1", "guardduty", "ListFindings", {
+        "DetectorId": "d1", "FindingCriteria": {"Criterion": {"updatedAt": {"Gte": 1767225600000}}},
+    })
+    later = api_snapshot.call_key("default", "us-east-1", "guardduty", "ListFindings", {
+        "DetectorId": "d1", "FindingCriteria": {"Criterion": {"updatedAt": {"Gte": 1767312000000}}},
+    })
+    other = api_snapshot.call_key("default", "us-east-1", "guardduty", "ListFindings", {"DetectorId": "d2"})
+    assert key == later != other
+    # Large numbers outside time fields are real parameters
+    sizes = [
+        api_snapshot.call_key("default", "us-east-1", "ec2", "CreateVolume", {"Size": 1, "Iops": size})
+        for size in (3_000_000_000, 4_000_000_000)
+    ]
+    assert sizes[0] != sizes[1]
+
+
+def test_snapshot_file_is_json_with_tagged_values(tmp_path):
+    """Datetimes and bytes survive a save/load round trip; the file holds no pickled objects."""
+    path = str(tmp_path / "estate.snapshot")
+    recorded = api_snapshot.Snapshot(path, "record", default_region="us-east-1")
+    created = datetime(2026, 3, 1, 6, 0, tzinfo=timezone.utc)
+    recorded.record("report", 200, {"Content": b"user,arn\n", "GeneratedTime": created})
+    recorded.save()
+
+    with lzma.open(path, "rt", encoding="utf-8") as fh:
+        assert json.load(fh)["version"] == api_snapshot.FORMAT_VERSION
+    replayed = api_snapshot.Snapshot.load(path)
+    status, parsed = replayed.next_response("report")
+    assert (status, parsed) == (200, {"Content": b"user,arn\n", "GeneratedTime": created})
+
+
+def test_replay_reproduces_recorded_run_offline(tmp_path, monkeypatch):
+    """A replay should give the recorded exit codes and reports with no AWS endpoint or credentials."""
+    snapshot = str(tmp_path / "estate.snapshot")
+    argv = ["--format", "csv", "--regions", "us-east-1", "eu-west-1"]
+    with mock_aws():
+        iam = boto3.client("iam", region_name="us-east-1")
+        iam.create_user(UserName="alice")
+        for region in ("us-east-1", "eu-west-1"):
+            ec2 = boto3.client("ec2", region_name=region)
+            ec2.run_instances(ImageId=ec2.describe_images()["Images"][0]["ImageId"], MinCount=1, MaxCount=1)
+
+        assert fafo_checker.run(fafo_checker.parse_args(["--record", snapshot, *argv])) == 2
+        assert ec2_compliance_check.run(ec2_compliance_check.parse_args(["--record", snapshot, *argv])) == 2
+        api_snapshot.save()
+    recorded = {name: _read(tmp_path / name) for name in ("iam_users_without_mfa.csv", "ec2_compliance_report.csv")}
+    api_snapshot.disable()
+    clear_client_cache()
+
+    # Outside moto, without credentials or a default region: every call must come from the snapshot
+    for name in ("AWS_ACCESS_KEY_ID", "AWS_SECRET_ACCESS_KEY", "AWS_SESSION_TOKEN", "AWS_DEFAULT_REGION"):
+        monkeypatch.delenv(name)
+    assert fafo_checker.run(fafo_checker.parse_args(["--replay", snapshot, *argv])) == 2
+    assert ec2_compliance_check.run(ec2_compliance_check.parse_args(["--replay", snapshot, *argv])) == 2
+    assert {name: _read(tmp_path / name) for name in recorded} == recorded
+    assert api_snapshot.get_snapshot().replayed > 0
+
+    # A call that was never recorded fails instead of reaching AWS
+    clear_client_cache()
+    missing = ec2_compliance_check.parse_args(["--replay", snapshot, "--regions", "us-west-2"])
+    assert ec2_compliance_check.run(missing) == 1
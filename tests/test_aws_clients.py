@@ -0,0 +1,40 @@
+"""Unit tests for the shared boto3 client factory."""
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+from botocore.credentials import Credentials
+
+sys.path.append("scripts")
+
+import aws_clients  # noqa: E402  pylint: disable=import-error
+
+
+def test_clients_are_cached_per_service_and_region():
+    east = aws_clients.get_client("ec2", "us-east-1")
+    assert aws_clients.get_client("ec2", "us-east-1") is east
+    assert aws_clients.get_client("ec2", "eu-west-1") is not east
+    assert aws_clients.get_client("s3", "us-east-1") is not east
+
+
+def test_client_config_uses_adaptive_retries_and_requested_pool():
+    client = aws_clients.get_client("guardduty", "us-east-1", max_pool_connections=25)
+    assert client.meta.config.retries["mode"] == "adaptive"
+    assert client.meta.config.max_pool_connections == 25
+    # A smaller request reuses the larger pool
+    assert aws_clients.get_client("guardduty", "us-east-1", max_pool_connections=5) is client
+
+
+def test_concurrent_callers_share_one_client():
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        clients = set(map(id, pool.map(lambda _: aws_clients.get_client("iam"), range(32))))
+    assert len(clients) == 1
+
+
+def test_default_session_clients_survive_credential_rotation(monkeypatch):
+    """Rotated default credentials (instance role, SSO) must keep using the cached clients."""
+    client = aws_clients.get_client("ec2", "us-east-1")
+    session = aws_clients.get_session()
+    monkeypatch.setattr(session, "get_credentials", lambda: Credentials("rotated", "rotated"))
+
+    assert aws_clients.get_client("ec2", "us-east-1") is client
+    assert len(aws_clients._clients) == 1
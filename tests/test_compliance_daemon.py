@@ -0,0 +1,68 @@
+"""Unit tests for the compliance watch daemon."""
+import json
+import sys
+import threading
+import urllib.error
+import urllib.request
+
+import boto3
+from moto import mock_aws
+
+sys.path.append("scripts")
+
+import scripts.compliance_daemon as compliance_daemon  # noqa: E402  pylint: disable=import-error
+
+
+def _get(server, path):
+    url = f"http://127.0.0.1:{server.server_port}{path}"
+    try:
+        with urllib.request.urlopen(url, timeout=5) as response:
+            return response.status, json.loads(response.read())
+    except urllib.error.HTTPError as e:
+        return e.code, json.loads(e.read())
+
+
+def test_checks_run_on_their_own_interval_and_results_are_served():
+    calls = []
+
+    def run_check(name, argv):
+        calls.append(name)
+        return {"check": name, "exit_code": 2 if name == "ec2" else 0, "seconds": 0.01}
+
+    daemon = compliance_daemon.ComplianceDaemon({"iam_mfa": 600, "ec2": 60}, run_check=run_check)
+    server = compliance_daemon.make_server(daemon, port=0)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        assert _get(server, "/gate")[0] == 503  # nothing evaluated yet
+
+        for future in daemon.run_due(now=0):
+            future.result()
+        assert sorted(calls) == ["ec2", "iam_mfa"]
+        assert daemon.run_due() == []  # neither interval has elapsed yet
+
+        status, body = _get(server, "/results")
+        assert status == 200 and body["exit_code"] == 2 and body["pending"] == []
+        assert body["checks"]["ec2"]["runs"] == 1 and body["checks"]["ec2"]["interval_seconds"] == 60
+        assert _get(server, "/gate")[0] == 422
+        assert _get(server, "/results/iam_mfa")[1]["exit_code"] == 0
+        assert _get(server, "/results/nope")[0] == 404
+    finally:
+        server.shutdown()
+        daemon.stop()
+
+
+@mock_aws
+def test_daemon_runs_real_checks_with_shared_options():
+    boto3.client("iam", region_name="us-east-1").create_user(UserName="judy")  # no MFA
+
+    args = compliance_daemon.parse_args(["--checks", "iam_mfa", "--interval", "iam_mfa=30", "--no-report"])
+    daemon = compliance_daemon.ComplianceDaemon(
+        compliance_daemon.parse_intervals(args.interval, args.checks), compliance_daemon.common_argv(args)
+    )
+    for future in daemon.run_due():
+        future.result()
+
+    snapshot = daemon.snapshot()
+    assert snapshot["exit_code"] == 2
+    assert snapshot["checks"]["iam_mfa"]["next_run_in_seconds"] > 25
+    daemon.stop()
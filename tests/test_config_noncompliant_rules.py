@@ -0,0 +1,97 @@
+"""Unit tests for config_noncompliant_rules (moto has no Config compliance APIs, so a fake client is used)."""
+import sys
+from types import SimpleNamespace
+
+from openpyxl import load_workbook
+
+sys.path.append("scripts")
+
+import scripts.config_noncompliant_rules as config_rules  # noqa: E402  pylint: disable=import-error
+
+
+class FakeConfig:
+    """Config client with a paginated rule summary and NextToken-paged resource details."""
+
+    meta = SimpleNamespace(service_model=SimpleNamespace(service_name="config"), region_name="us-east-1")
+
+    def __init__(self, resources_per_rule):
+        self.resources_per_rule = resources_per_rule
+        self.detail_calls = []
+        self.summary_calls = []
+
+    def get_paginator(self, operation):
+        rules = [
+            {
+                "ConfigRuleName": name,
+                "Compliance": {
+                    "ComplianceType": "NON_COMPLIANT",
+                    "NonCompliantResourceCount": {"CappedCount": len(ids), "CapExceeded": False},
+                },
+            }
+            for name, ids in self.resources_per_rule.items()
+        ]
+
+        fake = self
+
+        class Paginator:
+            def paginate(self, **kwargs):
+                fake.summary_calls.append(kwargs)
+                wanted = kwargs.get("ConfigRuleNames")
+                return iter([{"ComplianceByConfigRules": [
+                    rule for rule in rules if wanted is None or rule["ConfigRuleName"] in wanted
+                ]}])
+
+        return Paginator()
+
+    def get_compliance_details_by_config_rule(self, ConfigRuleName, ComplianceTypes, Limit, NextToken=None):
+        self.detail_calls.append(ConfigRuleName)
+        ids = self.resources_per_rule[ConfigRuleName]
+        start = int(NextToken or 0)
+        page = {
+            "EvaluationResults": [
+                {
+                    "EvaluationResultIdentifier": {
+                        "EvaluationResultQualifier": {
+                            "ConfigRuleName": ConfigRuleName,
+                            "ResourceType": "AWS::S3::Bucket",
+                            "ResourceId": resource_id,
+                        }
+                    },
+                    "ComplianceType": "NON_COMPLIANT",
+                }
+                for resource_id in ids[start:start + Limit]
+            ]
+        }
+        if start + Limit < len(ids):
+            page["NextToken"] = str(start + Limit)
+        return page
+
+
+def test_details_sheet_lists_every_resource_across_pages(monkeypatch):
+    """A rule with 250 resources needs three detail pages; every resource gets a row."""
+    cfg = FakeConfig({
+        "s3-bucket-versioning-enabled": [f"bucket-{i}" for i in range(250)],
+        "s3-bucket-logging-enabled": ["bucket-x"],
+    })
+    monkeypatch.setattr(config_rules, "get_client", lambda *args, **kwargs: cfg)
+
+    written = config_rules.export_excel(config_rules.iter_noncompliant_rules(), details=True, max_workers=4)
+
+    assert written == 2
+    assert sorted(cfg.detail_calls).count("s3-bucket-versioning-enabled") == 3
+    workbook = load_workbook("config_noncompliant_rules.xlsx")
+    assert workbook.sheetnames == ["Config_NonCompliant", "Config_NonCompliant_Resources"]
+    rows = list(workbook["Config_NonCompliant_Resources"].values)[1:]
+    assert len(rows) == 251
+    assert ("s3-bucket-logging-enabled", "AWS::S3::Bucket", "bucket-x") in {row[:3] for row in rows}
+
+
+def test_rule_allow_list_is_passed_to_the_api_in_chunks(monkeypatch):
+    names = [f"rule-{i}" for i in range(30)]
+    cfg = FakeConfig({name: ["r"] for name in names + ["other-rule"]})
+    monkeypatch.setattr(config_rules, "get_client", lambda *args, **kwargs: cfg)
+
+    records = list(config_rules.iter_noncompliant_rules(names))
+
+    assert sorted(r["config_rule"] for r in records) == sorted(names)
+    assert [len(call["ConfigRuleNames"]) for call in cfg.summary_calls] == [25, 5]
@@ -0,0 +1,157 @@
+"""Unit tests for the declarative control engine and its evaluation script."""
+import json
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+
+import boto3
+import numpy as np
+import pandas as pd
+import pytest
+from moto import mock_aws
+from openpyxl import load_workbook
+
+sys.path.append("scripts")
+
+import controls  # noqa: E402  pylint: disable=import-error
+import scripts.ec2_compliance_check as ec2_check  # noqa: E402  pylint: disable=import-error
+import scripts.evaluate_controls as evaluate_controls  # noqa: E402  pylint: disable=import-error
+import scripts.fafo_checker as fafo_checker  # noqa: E402  pylint: disable=import-error
+
+NOW = datetime(2024, 6, 1, tzinfo=timezone.utc)
+AMI_ID = "ami-12c6146b"  # moto's default Amazon Linux image
+
+
+def test_expressions_compile_to_masks_with_params_and_templates():
+    frame = pd.DataFrame({
+        "user_name": ["a", "b", "c"],
+        "status": ["Active", "Active", "Inactive"],
+        "last_used": [NOW - timedelta(days=200), None, None],
+        "volumes": [["vol-1", "vol-2"], [], None],
+    })
+    unused = controls.Control(
+        "unused", "iam_access_keys",
+        'status == "Active" and (isnull(last_used) or days_since(last_used) > max_key_age_days)',
+        "{user_name}: unused for {max_key_age_days} days",
+        params={"max_key_age_days": 180},
+    )
+    volumes = controls.Control("vols", "t", "size(volumes) > 0 and status in ['Active']", "Volumes: {volumes}")
+
+    issues, failed = controls.evaluate(frame, [unused, volumes], NOW)
+
+    assert issues.to_dict() == {0: "a: unused for 180 days; Volumes: vol-1, vol-2", 1: "b: unused for 180 days"}
+    assert failed.to_dict() == {0: "unused,vols", 1: "unused"}
+
+
+def test_not_and_in_work_on_scalars_and_columns():
+    """`not` of a scalar param is a bool (not ~True == -2), and `in` accepts a scalar on the left."""
+    frame = pd.DataFrame({"a": [1, 2], "tags": [["prod", "pci"], None]})
+
+    assert controls.compile_expression("not flag", {"flag": True})(frame, NOW) is False
+    flagged = controls.Control("c", "t", "a > 1 and not flag", "x", params={"flag": True})
+    assert not flagged.mask(frame, NOW).any()
+    tagged = controls.Control("c", "t", '"prod" in tags and "dev" not in tags and label in ["x"]', "x", {"label": "x"})
+    assert tagged.mask(frame, NOW).tolist() == [True, False]
+
+
+@pytest.mark.parametrize("expression", ["__import__('os').system('id')", "status.upper() == 'X'", "status[0]", "x ="])
+def test_unsupported_syntax_is_rejected_when_loading(expression):
+    with pytest.raises(ValueError):
+        controls.Control("bad", "t", expression, "never")
+
+
+def test_control_files_add_and_replace_controls(tmp_path):
+    path = tmp_path / "controls.json"
+    path.write_text(json.dumps({
+        "params": {"max_key_age_days": 30},
+        "controls": [{"id": "ec2-public-ip", "resource": "ec2_instances", "when": "False", "issue": "off"}],
+    }))
+
+    loaded = {control.id: control for control in controls.load_controls([str(path)], {"max_key_age_days": 45})}
+
+    assert loaded["ec2-public-ip"].when == "False"
+    assert loaded["iam-access-key-unused"].params["max_key_age_days"] == 45
+    assert set(loaded) == {control["id"] for control in controls.DEFAULT_CONTROLS}
+
+
+def test_hundreds_of_controls_over_100k_rows_in_one_pass():
+    rows = 100_000
+    rng = np.random.default_rng(0)
+    frame = pd.DataFrame({
+        "state": rng.choice(["running", "stopped"], rows),
+        "cpu": rng.integers(0, 100, rows),
+        "public_ip": np.where(rng.random(rows) < 0.1, "203.0.113.1", None),
+    })
+    control_list = [
+        controls.Control(f"c{i}", "ec2_instances", f'state == "running" and cpu >= {i % 100} and notnull(public_ip)', "hot")
+        for i in range(200)
+    ]
+
+    start = time.perf_counter()
+    issues, _ = controls.evaluate(frame, control_list, NOW)
+
+    expected = (frame["state"] == "running") & frame["public_ip"].notna()
+    assert len(issues) == expected.sum()
+    assert time.perf_counter() - start < 20
+
+
+@mock_aws
+def test_default_controls_match_the_checks(tmp_path):
+    iam = boto3.client("iam", region_name="us-east-1")
+    iam.create_user(UserName="nina")  # no MFA
+    iam.create_access_key(UserName="nina")  # never used
+    boto3.client("ec2", region_name="us-east-1").run_instances(ImageId=AMI_ID, MinCount=1, MaxCount=1)
+    legacy_users = {record["user_name"] for record in fafo_checker.list_users_without_mfa()}
+    legacy_instances = {record["instance_id"] for record in ec2_check.check_ec2_compliance(regions=["us-east-1"])}
+
+    exit_code = evaluate_controls.run(evaluate_controls.parse_args(["--regions", "us-east-1"]))
+
+    assert exit_code == 2
+    workbook = load_workbook(tmp_path / evaluate_controls.REPORT_FILE)
+    assert workbook.sheetnames == ["iam_users", "iam_access_keys", "ec2_instances"]
+    users = list(workbook["iam_users"].iter_rows(min_row=2, values_only=True))
+    instances = list(workbook["ec2_instances"].iter_rows(min_row=2, values_only=True))
+    assert {row[0] for row in users} == legacy_users
+    assert {row[0] for row in instances} == legacy_instances
+    assert "Termination protection disabled" in instances[0][5]
+
+
+@mock_aws
+def test_controls_evaluate_the_instances_the_ec2_check_would(tmp_path):
+    """--instance-states and --tag scope the EC2 inventory exactly like the EC2 check."""
+    iam = boto3.client("iam", region_name="us-east-1")
+    iam.create_user(UserName="nina")  # no MFA
+    ec2 = boto3.client("ec2", region_name="us-east-1")
+    prod_tags = [{"ResourceType": "instance", "Tags": [{"Key": "env", "Value": "prod"}]}]
+    ec2.run_instances(ImageId=AMI_ID, MinCount=1, MaxCount=1, TagSpecifications=prod_tags)
+    stopped = ec2.run_instances(ImageId=AMI_ID, MinCount=1, MaxCount=1, TagSpecifications=prod_tags)
+    ec2.stop_instances(InstanceIds=[stopped["Instances"][0]["InstanceId"]])
+    ec2.run_instances(ImageId=AMI_ID, MinCount=1, MaxCount=1)  # untagged
+    scope = ["--regions", "us-east-1", "--instance-states", "running", "--tag", "env=prod"]
+    legacy_instances = {
+        record["instance_id"]
+        for record in ec2_check.check_ec2_compliance(regions=["us-east-1"], filters=ec2_check.instance_filters(
+            ["running"], {"env": "prod"}
+        ))
+    }
+    path = tmp_path / "controls.json"
+    path.write_text(json.dumps({"controls": [
+        {"id": "iam-user-mfa", "resource": "iam_users", "when": "mfa_devices == 0", "issue": "No MFA device"},
+        {"id": "ec2-protection", "resource": "ec2_instances", "when": "termination_protection == False",
+         "issue": "Termination protection disabled"},
+    ]}))
+
+    exit_code = evaluate_controls.run(
+        evaluate_controls.parse_args(["--controls", str(path), "--no-default-controls", *scope])
+    )
+
+    assert exit_code == 2
+    workbook = load_workbook(tmp_path / evaluate_controls.REPORT_FILE)
+    assert workbook.sheetnames == ["iam_users", "ec2_instances"]
+    users = list(workbook["iam_users"].iter_rows(min_row=2, values_only=True))
+    instances = list(workbook["ec2_instances"].iter_rows(min_row=2, values_only=True))
+    assert {row[0] for row in users} == {"nina"}
+    assert len(legacy_instances) == 1
+    assert {row[0] for row in instances} == legacy_instances
+    assert instances[0][5] == "Termination protection disabled"
+
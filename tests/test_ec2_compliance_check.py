@@ -0,0 +1,105 @@
+"""Unit tests for ec2_compliance_check using moto to mock EC2."""
+import sys
+
+import boto3
+import pytest
+from moto import mock_aws
+
+sys.path.append("scripts")
+
+import scripts.ec2_compliance_check as ec2_check  # noqa: E402  pylint: disable=import-error
+
+AMI_ID = "ami-12c6146b"  # moto's default Amazon Linux image
+
+
+def _launch(region, **kwargs):
+    ec2 = boto3.client("ec2", region_name=region)
+    return ec2.run_instances(ImageId=AMI_ID, MinCount=1, MaxCount=1, **kwargs)["Instances"][0]["InstanceId"]
+
+
+@mock_aws
+def test_findings_from_every_region_are_collected():
+    east = _launch("us-east-1")
+    west = _launch("eu-west-1")
+
+    findings = ec2_check.check_ec2_compliance(max_workers=4)
+    assert {(f["instance_id"], f["region"]) for f in findings} == {(east, "us-east-1"), (west, "eu-west-1")}
+    assert all("Termination protection disabled" in f["issues"] for f in findings)
+
+
+@mock_aws
+def test_failed_region_is_recorded_without_aborting_others(monkeypatch):
+    healthy = _launch("us-east-1")
+    scan_region = ec2_check._scan_region
+
+    def flaky_scan(ec2_region, region, non_compliant, filters=None):
+        if region == "eu-west-1":
+            raise RuntimeError("boom")
+        scan_region(ec2_region, region, non_compliant, filters)
+
+    monkeypatch.setattr(ec2_check, "_scan_region", flaky_scan)
+    region_errors = {}
+    findings = ec2_check.check_ec2_compliance(region_errors=region_errors)
+
+    assert [f["instance_id"] for f in findings] == [healthy]
+    assert region_errors == {(None, "eu-west-1"): "boom"}
+
+
+@mock_aws
+def test_exit_code_when_region_fails_and_nothing_found(monkeypatch):
+    def failing_scan(ec2_region, region, non_compliant, filters=None):
+        raise RuntimeError("denied")
+
+    monkeypatch.setattr(ec2_check, "_scan_region", failing_scan)
+    with pytest.raises(SystemExit) as exc:
+        ec2_check.main([])
+    assert exc.value.code == 1
+
+
+@mock_aws
+def test_volume_encryption_uses_bulk_lookups(monkeypatch):
+    """Volume encryption is resolved per page of volumes, not per volume."""
+    ec2 = boto3.client("ec2", region_name="us-east-1")
+    ec2.run_instances(ImageId=AMI_ID, MinCount=5, MaxCount=5)
+    monkeypatch.setattr(ec2_check, "VOLUME_FILTER_CHUNK", 2)
+
+    calls = []
+    ec2.meta.events.register("before-call.ec2.DescribeVolumes", lambda **kwargs: calls.append(1))
+    findings = []
+    ec2_check._scan_region(ec2, "us-east-1", findings)
+
+    assert len(findings) == 5
+    assert all("not encrypted" in f["issues"] for f in findings)
+    assert len(calls) == 3  # ceil(5 volumes / 2 per chunk)
+
+
+@mock_aws
+def test_state_tag_and_region_filters_are_pushed_down():
+    ec2 = boto3.client("ec2", region_name="us-east-1")
+    tags = [{"ResourceType": "instance", "Tags": [{"Key": "env", "Value": "prod"}]}]
+    running = _launch("us-east-1", TagSpecifications=tags)
+    stopped = _launch("us-east-1", TagSpecifications=tags)
+    ec2.stop_instances(InstanceIds=[stopped])
+    terminated = _launch("us-east-1", TagSpecifications=tags)
+    ec2.terminate_instances(InstanceIds=[terminated])
+    _launch("us-east-1")  # untagged
+    _launch("eu-west-1", TagSpecifications=tags)  # outside --regions
+
+    findings = ec2_check.check_ec2_compliance(
+        regions=["us-east-1"],
+        filters=ec2_check.instance_filters(["running"], {"env": "prod"}),
+    )
+
+    assert [f["instance_id"] for f in findings] == [running]
+    default_scope = ec2_check.check_ec2_compliance(
+        regions=["us-east-1"], filters=ec2_check.instance_filters(tags={"env": "prod"})
+    )
+    assert {f["instance_id"] for f in default_scope} == {running, stopped}
+
+
+def test_tag_without_value_separator_is_rejected():
+    assert ec2_check.parse_args(["--tag", "env=prod", "--tag", "team="]).tag == [("env", "prod"), ("team", "")]
+    for bad in ("env", "=prod"):
+        with pytest.raises(SystemExit) as exc:
+            ec2_check.parse_args(["--tag", bad])
+        assert exc.value.code == 2
@@ -0,0 +1,150 @@
+"""Unit tests for the CloudTrail event consumer, using moto's SQS, IAM and EC2."""
+import json
+import logging
+import sys
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+
+import boto3
+import pytest
+from moto import mock_aws
+
+sys.path.append("scripts")
+
+import scripts.event_consumer as consumer  # noqa: E402  pylint: disable=import-error
+
+AMI_ID = "ami-12c6146b"  # moto's default Amazon Linux image
+
+
+def _send(sqs, queue_url, event_name, region="us-east-1", **fields):
+    detail = {"eventName": event_name, "awsRegion": region, "recipientAccountId": "123456789012", **fields}
+    envelope = {"detail-type": "AWS API Call via CloudTrail", "detail": detail}
+    sqs.send_message(QueueUrl=queue_url, MessageBody=json.dumps(envelope))
+
+
+def _consume(queue_url):
+    return consumer.run(consumer.parse_args(["--queue-url", queue_url, "--once", "--wait-seconds", "1"]))
+
+
+@mock_aws
+def test_iam_events_update_only_the_affected_users():
+    sqs = boto3.client("sqs", region_name="us-east-1")
+    queue_url = sqs.create_queue(QueueName="cloudtrail-events")["QueueUrl"]
+    iam = boto3.client("iam", region_name="us-east-1")
+    iam.create_user(UserName="kim")
+    iam.create_user(UserName="lee")  # never mentioned in an event, so never evaluated
+
+    _send(sqs, queue_url, "CreateUser", requestParameters={"userName": "kim"})
+    _send(sqs, queue_url, "CreateAccessKey", requestParameters={"userName": "kim"}, errorCode="AccessDenied")
+    sqs.send_message(QueueUrl=queue_url, MessageBody="not json")
+    assert _consume(queue_url) == 2
+
+    state = consumer.load_state(consumer.DEFAULT_STATE_FILE)
+    assert list(state["violations"]["iam_mfa"]) == ["kim"]
+    assert state["violations"]["iam_mfa"]["kim"][0]["user_arn"].endswith("user/kim")
+    assert "Messages" not in sqs.receive_message(QueueUrl=queue_url, WaitTimeSeconds=0)
+
+    serial = iam.create_virtual_mfa_device(VirtualMFADeviceName="kim")["VirtualMFADevice"]["SerialNumber"]
+    iam.enable_mfa_device(UserName="kim", SerialNumber=serial, AuthenticationCode1="123456", AuthenticationCode2="654321")
+    _send(sqs, queue_url, "EnableMFADevice", requestParameters={"userName": "kim", "serialNumber": serial})
+    assert _consume(queue_url) == 0
+    assert consumer.load_state(consumer.DEFAULT_STATE_FILE)["violations"]["iam_mfa"] == {}
+
+
+@mock_aws
+def test_instance_events_rescan_only_those_instances():
+    sqs = boto3.client("sqs", region_name="us-east-1")
+    queue_url = sqs.create_queue(QueueName="cloudtrail-events")["QueueUrl"]
+    ec2 = boto3.client("ec2", region_name="eu-west-1")
+    instance_id = ec2.run_instances(ImageId=AMI_ID, MinCount=1, MaxCount=1)["Instances"][0]["InstanceId"]
+    ec2.run_instances(ImageId=AMI_ID, MinCount=1, MaxCount=1)  # untouched, so never evaluated
+    launched = {"instancesSet": {"items": [{"instanceId": instance_id}]}}
+
+    _send(sqs, queue_url, "RunInstances", region="eu-west-1", responseElements=launched)
+    _send(sqs, queue_url, "ModifyInstanceAttribute", region="eu-west-1", requestParameters={"instanceId": instance_id})
+    assert _consume(queue_url) == 2
+    violations = consumer.load_state(consumer.DEFAULT_STATE_FILE)["violations"]["ec2"]
+    assert list(violations) == [instance_id]
+    assert violations[instance_id][0]["region"] == "eu-west-1"
+
+    ec2.terminate_instances(InstanceIds=[instance_id])
+    _send(sqs, queue_url, "TerminateInstances", region="eu-west-1", requestParameters=launched)
+    assert _consume(queue_url) == 0
+
+
+@mock_aws
+def test_failed_evaluation_keeps_the_message_for_redelivery(monkeypatch):
+    sqs = boto3.client("sqs", region_name="us-east-1")
+    queue_url = sqs.create_queue(QueueName="cloudtrail-events", Attributes={"VisibilityTimeout": "0"})["QueueUrl"]
+    _send(sqs, queue_url, "CreateUser", requestParameters={"userName": "mo"})
+
+    def broken(region, user_names, threshold_days):
+        raise RuntimeError("boom")
+
+    monkeypatch.setitem(consumer.EVALUATORS, "iam_mfa", broken)
+    messages = sqs.receive_message(QueueUrl=queue_url)["Messages"]
+    handles, failures = consumer.process_messages(messages, consumer.load_state("missing.json"))
+
+    assert handles == [] and failures == 1
+
+
+@mock_aws
+def test_events_of_unscanned_accounts_are_skipped():
+    """Without --accounts only the default credentials' account is evaluated."""
+    sqs = boto3.client("sqs", region_name="us-east-1")
+    queue_url = sqs.create_queue(QueueName="cloudtrail-events")["QueueUrl"]
+    boto3.client("iam", region_name="us-east-1").create_user(UserName="kim")
+
+    _send(sqs, queue_url, "CreateUser", requestParameters={"userName": "kim"}, recipientAccountId="111111111111")
+    assert _consume(queue_url) == 0
+    assert consumer.load_state(consumer.DEFAULT_STATE_FILE)["violations"]["iam_mfa"] == {}
+    assert "Messages" not in sqs.receive_message(QueueUrl=queue_url, WaitTimeSeconds=0)
+
+
+def test_access_key_check_is_rescanned_when_its_scan_is_stale(monkeypatch):
+    monkeypatch.setattr(consumer.unused_iam_access_keys, "list_unused_keys", lambda threshold_days: [
+        {"user_name": "kim", "access_key_id": "AKIAEXAMPLE"}
+    ])
+    state = consumer.load_state("missing.json")
+
+    assert consumer.rescan_aging_checks(state, rescan_hours=24) == (True, [])
+    assert list(state["violations"]["iam_access_keys"]) == ["kim"]
+    assert consumer.rescan_aging_checks(state, rescan_hours=24) == (False, [])
+
+    stale = datetime.now(timezone.utc) - timedelta(hours=25)
+    state["scanned_at"]["iam_access_keys"] = stale.isoformat()
+    assert consumer.rescan_aging_checks(state, rescan_hours=24) == (True, [])
+
+
+def test_incomplete_scan_keeps_the_failed_region_and_is_retried(monkeypatch):
+    """A region that could not be scanned keeps its stored violations; scanned_at is not advanced."""
+    def scan(region_errors=None):
+        region_errors[(None, "eu-west-1")] = "EndpointConnectionError"
+        return [{"instance_id": "i-east", "region": "us-east-1", "issues": "Has public IP address"}]
+
+    monkeypatch.setattr(consumer.ec2_compliance_check, "check_ec2_compliance", scan)
+    state = consumer.load_state("missing.json")
+    state["violations"]["ec2"] = {
+        "i-west": [{"instance_id": "i-west", "region": "eu-west-1", "issues": "Has public IP address"}],
+        "i-gone": [{"instance_id": "i-gone", "region": "us-east-1", "issues": "Has public IP address"}],
+    }
+
+    failures = consumer.seed_state(state, checks=["ec2"])
+
+    assert len(failures) == 1 and "eu-west-1" in failures[0]
+    assert sorted(state["violations"]["ec2"]) == ["i-east", "i-west"]
+    assert "ec2" not in state.get("scanned_at", {})
+
+
+def test_zero_wait_seconds_is_rejected():
+    with pytest.raises(SystemExit):
+        consumer.parse_args(["--queue-url", "https://queue", "--wait-seconds", "0"])
+
+
+def test_failed_deletes_are_logged(caplog):
+    failed = {"Failed": [{"Id": "1", "Code": "ReceiptHandleIsInvalid", "Message": "expired", "SenderFault": True}]}
+    sqs = SimpleNamespace(delete_message_batch=lambda **kwargs: failed)
+
+    with caplog.at_level(logging.WARNING):
+        assert consumer.delete_messages(sqs, "https://queue", ["a", "b"]) == 1
+    assert "ReceiptHandleIsInvalid" in caplog.text
@@ -0,0 +1,77 @@
+"""Unit tests for the streaming Excel evidence writer."""
+import sys
+from datetime import datetime, timezone
+
+from openpyxl import load_workbook
+
+sys.path.append("scripts")
+
+import evidence_writer  # noqa: E402  pylint: disable=import-error
+
+
+def _rows(count):
+    for i in range(count):
+        yield {"name": f"r{i}", "created": datetime(2024, 1, 1, tzinfo=timezone.utc)}
+
+
+def test_generator_rows_are_written_with_metadata_and_total(tmp_path):
+    path = tmp_path / "report.xlsx"
+    written = evidence_writer.write_report(
+        _rows(3),
+        path,
+        sheet_name="Evidence",
+        columns=["name", "created", "missing"],
+        metadata={"report_generated_at": "2024-01-02 00:00:00"},
+        total_column="total_rows",
+    )
+
+    assert written == 3
+    rows = list(load_workbook(path)["Evidence"].iter_rows(values_only=True))
+    assert rows[0] == ("name", "created", "missing", "report_generated_at", "total_rows")
+    assert rows[1] == ("r0", datetime(2024, 1, 1), None, "2024-01-02 00:00:00", 3)
+    assert len(rows) == 4
+
+
+def test_empty_rows_write_headers_only(tmp_path):
+    path = tmp_path / "empty.xlsx"
+    assert evidence_writer.write_report([], path, "Empty", ["a"], total_column="total", total=0) == 0
+    assert list(load_workbook(path)["Empty"].iter_rows(values_only=True)) == [("a", "total")]
+
+
+def test_all_formats_share_columns_metadata_and_total(tmp_path):
+    import csv
+    import json
+
+    import pyarrow.parquet as pq
+
+    evidence_writer.configure(["xlsx", "csv", "jsonl", "parquet"])
+    metadata = {"report_generated_at": "2024-01-02 00:00:00"}
+    written = evidence_writer.write_report(
+        _rows(3), tmp_path / "report.xlsx", "Evidence", ["name", "created"], metadata, total_column="total_rows"
+    )
+
+    assert written == 3
+    header = ["name", "created", "report_generated_at", "total_rows"]
+    assert list(load_workbook(tmp_path / "report.xlsx")["Evidence"].values)[0] == tuple(header)
+    with open(tmp_path / "report.csv", newline="") as fh:
+        csv_rows = list(csv.reader(fh))
+    assert csv_rows[0] == header
+    assert csv_rows[1] == ["r0", "2024-01-01T00:00:00+00:00", "2024-01-02 00:00:00", "3"]
+    with open(tmp_path / "report.jsonl") as fh:
+        first = json.loads(fh.readline())
+    assert first == {"name": "r0", "created": "2024-01-01T00:00:00+00:00",
+                     "report_generated_at": "2024-01-02 00:00:00", "total_rows": 3}
+    table = pq.read_table(tmp_path / "report.parquet")
+    assert table.column_names == header
+    assert table.num_rows == 3
+    assert table.column("total_rows").to_pylist() == [3, 3, 3]
+
+
+def test_extra_sheets_get_their_own_flat_files(tmp_path):
+    evidence_writer.configure(["csv"])
+    evidence_writer.write_report_sheets(tmp_path / "report.xlsx", [
+        dict(rows=[{"a": 1}], sheet_name="Main", columns=["a"]),
+        dict(rows=[{"b": 2}], sheet_name="Details", columns=["b"]),
+    ])
+
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["report.csv", "report_Details.csv"]
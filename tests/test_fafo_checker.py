@@ -1,10 +1,9 @@
 """Unit tests for fafo_checker using moto to mock IAM."""
 import sys
-from importlib import reload
 
 import boto3
 import pytest
-from moto import mock_iam
+from moto import mock_aws
 
 # Import path fix – ensures scripts package is discoverable when running pytest from repo root
 sys.path.append("scripts")
@@ -12,14 +11,14 @@ sys.path.append("scripts")
 import scripts.fafo_checker as fafo_checker  # noqa: E402  pylint: disable=import-error
 
 
-@mock_iam
+@mock_aws
 def test_exit_code_when_all_users_have_mfa(monkeypatch):
     """fafo_checker should exit 0 when every IAM user has at least one MFA device."""
     iam = boto3.client("iam", region_name="us-east-1")
 
     # Create user and virtual MFA device
     iam.create_user(UserName="alice")
-    iam.create_virtual_mfa_device(VirtualMfaDeviceName="alice-mfa")
+    iam.create_virtual_mfa_device(VirtualMFADeviceName="alice-mfa")
     iam.enable_mfa_device(
         UserName="alice",
         SerialNumber="arn:aws:iam::123456789012:mfa/alice-mfa",
@@ -28,11 +27,11 @@ def test_exit_code_when_all_users_have_mfa(monkeypatch):
     )
 
     with pytest.raises(SystemExit) as exc:
-        reload(fafo_checker)
+        fafo_checker.main([])
     assert exc.value.code == 0
 
 
-@mock_iam
+@mock_aws
 def test_exit_code_when_user_without_mfa(monkeypatch):
     """fafo_checker should exit 2 when at least one user lacks MFA."""
     iam = boto3.client("iam", region_name="us-east-1")
@@ -41,5 +40,50 @@ def test_exit_code_when_user_without_mfa(monkeypatch):
     iam.create_user(UserName="bob")
 
     with pytest.raises(SystemExit) as exc:
-        reload(fafo_checker)
+        fafo_checker.main([])
     assert exc.value.code == 2
+
+
+@mock_aws
+@pytest.mark.parametrize("use_credential_report", [False, True])
+def test_credential_report_mode_matches_per_user_mode(use_credential_report):
+    """Both evaluation modes should flag exactly the users without MFA."""
+    iam = boto3.client("iam", region_name="us-east-1")
+    iam.create_user(UserName="carol")
+    iam.create_user(UserName="dave")
+    iam.create_virtual_mfa_device(VirtualMFADeviceName="dave-mfa")
+    iam.enable_mfa_device(
+        UserName="dave",
+        SerialNumber="arn:aws:iam::123456789012:mfa/dave-mfa",
+        AuthenticationCode1="123456",
+        AuthenticationCode2="654321",
+    )
+
+    users = fafo_checker.list_users_without_mfa(use_credential_report=use_credential_report)
+    assert [u["user_name"] for u in users] == ["carol"]
+
+
+@mock_aws
+def test_exit_code_when_iam_errors(monkeypatch):
+    """An IAM failure must surface as exit 1, never as a compliant exit 0."""
+    def broken(*args, **kwargs):
+        raise RuntimeError("AccessDenied")
+
+    monkeypatch.setattr(fafo_checker, "_users_without_mfa_per_user", broken)
+    with pytest.raises(SystemExit) as exc:
+        fafo_checker.main([])
+    assert exc.value.code == 1
+
+
+@mock_aws
+def test_credential_report_mode_checks_users_newer_than_report(monkeypatch):
+    """Users created after the report was generated must still be checked; deleted users are not flagged."""
+    iam = boto3.client("iam", region_name="us-east-1")
+    iam.create_user(UserName="gone")
+    stale_report = fafo_checker.fetch_credential_report(iam)
+    iam.delete_user(UserName="gone")
+    iam.create_user(UserName="newcomer")
+    monkeypatch.setattr(fafo_checker, "fetch_credential_report", lambda client: stale_report)
+
+    users = fafo_checker.list_users_without_mfa(use_credential_report=True)
+    assert [u["user_name"] for u in users] == ["newcomer"]
@@ -0,0 +1,151 @@
+"""Unit tests for guardduty_findings_summary (moto has no findings API, so a fake client is used)."""
+import sys
+from datetime import datetime, timedelta, timezone
+
+sys.path.append("scripts")
+
+import scripts.guardduty_findings_summary as gd_summary  # noqa: E402  pylint: disable=import-error
+
+
+def _finding(idx, severity):
+    return {
+        "Id": f"f-{idx}",
+        "AccountId": "123456789012",
+        "Arn": f"arn:aws:guardduty:us-east-1:123456789012:detector/d-1/finding/f-{idx}",
+        "CreatedAt": "2024-01-01T00:00:00Z",
+        "UpdatedAt": "2024-01-01T00:00:00Z",
+        "Region": "us-east-1",
+        "Resource": {},
+        "SchemaVersion": "2.0",
+        "Severity": severity,
+        "Type": "Recon:EC2/PortProbeUnprotectedPort",
+    }
+
+
+def test_summarise_findings_buckets_by_severity():
+    findings = iter([_finding(1, 2.0), _finding(2, 5.0), _finding(3, 8.0), _finding(4, 8.5), _finding(5, 9.5)])
+    summary = gd_summary.summarise_findings(findings)
+    assert dict(zip(summary["severity"], summary["count"])) == {"Low": 1, "Medium": 1, "High": 2, "Critical": 1}
+
+
+def test_summarise_findings_empty():
+    assert gd_summary.summarise_findings(iter([])).empty
+
+
+class FakeGuardDuty:
+    """Minimal GuardDuty client: paginated list_findings and capped get_findings."""
+
+    def __init__(self, finding_count, page_size=50):
+        ids = [f"f-{i}" for i in range(finding_count)]
+        self.pages = {
+            "list_detectors": [{"DetectorIds": ["d-1"]}],
+            "list_findings": [{"FindingIds": ids[i:i + page_size]} for i in range(0, finding_count, page_size)],
+        }
+        self.batch_sizes = []
+
+    def get_paginator(self, operation):
+        pages = self.pages[operation]
+
+        class Paginator:
+            def paginate(self, **kwargs):
+                return iter(pages)
+
+        return Paginator()
+
+    def get_findings(self, DetectorId, FindingIds):
+        assert len(FindingIds) <= 50, "get_findings caps FindingIds at 50"
+        self.batch_sizes.append(len(FindingIds))
+        return {"Findings": [_finding(finding_id[2:], 5.0) for finding_id in FindingIds]}
+
+
+def test_findings_are_paginated_and_fetched_in_batches(monkeypatch):
+    """120 finding IDs over three pages need three get_findings calls of <= 50 IDs."""
+    gd = FakeGuardDuty(120)
+    monkeypatch.setattr(gd_summary, "get_client", lambda *args, **kwargs: gd)
+
+    findings = list(gd_summary.iter_all_findings(regions=["us-east-1"], max_workers=2))
+
+    assert len(findings) == 120
+    assert sorted(gd.batch_sizes) == [20, 50, 50]
+
+
+class FakeIncrementalGuardDuty:
+    """GuardDuty fake whose list_findings honours the updatedAt criterion."""
+
+    def __init__(self):
+        self.updated_ms = {}
+        self.requested_ids = []
+
+    def upsert(self, finding_id, minutes_ago):
+        now = datetime.now(timezone.utc)
+        self.updated_ms[finding_id] = int((now - timedelta(minutes=minutes_ago)).timestamp() * 1000)
+
+    def get_paginator(self, operation):
+        fake = self
+
+        class Paginator:
+            def paginate(self, **kwargs):
+                if operation == "list_detectors":
+                    return iter([{"DetectorIds": ["d-1"]}])
+                gte = kwargs["FindingCriteria"]["Criterion"]["updatedAt"]["Gte"]
+                return iter([{"FindingIds": [i for i, ms in fake.updated_ms.items() if ms >= gte]}])
+
+        return Paginator()
+
+    def get_findings(self, DetectorId, FindingIds):
+        self.requested_ids.extend(FindingIds)
+        findings = []
+        for finding_id in FindingIds:
+            finding = _finding(finding_id, 8.0)
+            finding["Id"] = finding_id
+            updated = datetime.fromtimestamp(self.updated_ms[finding_id] / 1000, timezone.utc)
+            finding["UpdatedAt"] = updated.strftime("%Y-%m-%dT%H:%M:%S.000Z")
+            findings.append(finding)
+        return {"Findings": findings}
+
+
+def test_incremental_runs_fetch_only_new_findings(monkeypatch, tmp_path):
+    gd = FakeIncrementalGuardDuty()
+    monkeypatch.setattr(gd_summary, "get_client", lambda *args, **kwargs: gd)
+    state_file = tmp_path / "state.json"
+    gd.upsert("a", minutes_ago=60)
+    gd.upsert("b", minutes_ago=30)
+    gd.upsert("stale", minutes_ago=60 * 25)  # outside the 24h window
+
+    state = gd_summary.load_state(state_file)
+    assert gd_summary.collect_incremental(state, regions=["us-east-1"]) == 2
+    gd_summary.save_state(state, state_file)
+
+    gd.requested_ids.clear()
+    gd.upsert("c", minutes_ago=0)
+    state = gd_summary.load_state(state_file)
+    gd_summary.collect_incremental(state, regions=["us-east-1"])
+
+    # Only "c" plus the finding sitting exactly on the cursor are downloaded again
+    assert set(gd.requested_ids) == {"b", "c"}
+    counts = gd_summary.count_by_severity(gd_summary.iter_stored_findings(state))
+    assert counts == {"High": 3}
+
+
+def test_min_severity_is_sent_as_a_finding_criterion(monkeypatch):
+    gd = FakeGuardDuty(10)
+    criteria = []
+    paginator = gd.get_paginator
+
+    def recording_paginator(operation):
+        inner = paginator(operation)
+
+        class Paginator:
+            def paginate(self, **kwargs):
+                criteria.append(kwargs.get("FindingCriteria"))
+                return inner.paginate(**kwargs)
+
+        return Paginator()
+
+    gd.get_paginator = recording_paginator
+    monkeypatch.setattr(gd_summary, "get_client", lambda *args, **kwargs: gd)
+
+    list(gd_summary.iter_all_findings(regions=["us-east-1"], min_severity=gd_summary.SEVERITY_FLOORS["High"]))
+
+    listed = [c for c in criteria if c]
+    assert listed and listed[0]["Criterion"]["severity"] == {"GreaterThanOrEqual": 7}
@@ -0,0 +1,76 @@
+"""Unit tests for history_store: recorded runs, trend queries and the new/resolved diff."""
+import json
+import sys
+from datetime import datetime, timedelta, timezone
+
+import boto3
+import pytest
+from moto import mock_aws
+
+sys.path.append("scripts")
+
+import scripts.fafo_checker as fafo_checker  # noqa: E402  pylint: disable=import-error
+import scripts.history_store as history_store  # noqa: E402  pylint: disable=import-error
+
+DAY1 = datetime(2026, 3, 1, 6, 0, tzinfo=timezone.utc)
+
+
+def _record(db, day, users, complete=True):
+    rows = [{"user_name": user, "user_arn": f"arn:aws:iam::123456789012:user/{user}"} for user in users]
+    return history_store.record_run(
+        "iam_mfa", rows, "user_name", complete=complete, db=db, started_at=DAY1 + timedelta(days=day)
+    )
+
+
+def test_queries_and_diff_over_several_runs(tmp_path):
+    """Runs should be queryable by resource, open streak and day, and diffed against the previous run."""
+    db = str(tmp_path / "history.db")
+    assert _record(db, 0, ["alice", "bob"])["new"] == [
+        {"control": "iam_mfa", "resource_id": "alice", "account_id": ""},
+        {"control": "iam_mfa", "resource_id": "bob", "account_id": ""},
+    ]
+    _record(db, 1, ["bob"])
+    _record(db, 2, [], complete=False)  # an incomplete scan does not end bob's streak
+    changes = _record(db, 3, ["alice", "bob", "carol"])
+
+    # Compared with the last complete run (day 1), not the partial one
+    assert [v["resource_id"] for v in changes["new"]] == ["alice", "carol"]
+    assert changes["resolved"] == []
+    assert history_store.diff("iam_mfa", db=db) == changes
+
+    (alice,) = history_store.first_seen("alice", db=db)
+    assert (alice["first_seen"], alice["runs"]) == (DAY1.isoformat(), 2)
+
+    now = DAY1 + timedelta(days=4)
+    opened = {row["resource_id"]: row for row in history_store.open_violations("iam_mfa", db=db, now=now)}
+    assert opened["bob"]["open_days"] == 4.0
+    assert opened["alice"]["open_days"] == 1.0  # re-opened after being resolved on day 1
+    assert opened["carol"]["open_days"] == 1.0
+
+    daily = history_store.daily_counts(days=7, db=db, today=DAY1 + timedelta(days=3))
+    assert [(row["run_date"], row["violations"]) for row in daily] == [
+        ("2026-03-01", 2), ("2026-03-02", 1), ("2026-03-04", 3),
+    ]
+
+    assert history_store.prune(2, db=db, today=DAY1 + timedelta(days=3)) == 2
+    assert history_store.first_seen("alice", db=db)[0]["runs"] == 1
+
+
+@mock_aws
+def test_check_records_history_and_logs_resolved(tmp_path, capsys):
+    """With --history, each check run is appended and the query CLI reports what was resolved."""
+    iam = boto3.client("iam", region_name="us-east-1")
+    iam.create_user(UserName="alice")
+    iam.create_user(UserName="bob")
+    db = str(tmp_path / "history.db")
+
+    assert fafo_checker.run(fafo_checker.parse_args(["--no-report", "--history", "--history-db", db])) == 2
+    iam.delete_user(UserName="bob")
+    assert fafo_checker.run(fafo_checker.parse_args(["--no-report", "--history", "--history-db", db])) == 2
+
+    with pytest.raises(SystemExit) as exc:
+        history_store.main(["--history-db", db, "diff", "--check", "iam_mfa"])
+    assert exc.value.code == 0
+    changes = json.loads(capsys.readouterr().out)
+    assert changes["new"] == []
+    assert [v["resource_id"] for v in changes["resolved"]] == ["bob"]
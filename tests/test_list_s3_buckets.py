@@ -0,0 +1,121 @@
+"""Unit tests for list_s3_buckets using moto to mock S3."""
+import os
+import sys
+from types import SimpleNamespace
+
+import boto3
+import pytest
+from botocore.exceptions import ClientError, EndpointConnectionError
+from moto import mock_aws
+from openpyxl import load_workbook
+
+sys.path.append("scripts")
+
+import scripts.list_s3_buckets as list_s3_buckets  # noqa: E402  pylint: disable=import-error
+
+
+def _make_compliant_bucket(name, region):
+    s3 = boto3.client("s3", region_name=region)
+    s3.create_bucket(Bucket=name, CreateBucketConfiguration={"LocationConstraint": region})
+    s3.put_bucket_encryption(
+        Bucket=name,
+        ServerSideEncryptionConfiguration={
+            "Rules": [{"ApplyServerSideEncryptionByDefault": {"SSEAlgorithm": "aws:kms"}}]
+        },
+    )
+    s3.put_public_access_block(
+        Bucket=name,
+        PublicAccessBlockConfiguration={
+            "BlockPublicAcls": True,
+            "IgnorePublicAcls": True,
+            "BlockPublicPolicy": True,
+            "RestrictPublicBuckets": True,
+        },
+    )
+    s3.put_bucket_versioning(Bucket=name, VersioningConfiguration={"Status": "Enabled"})
+    s3.put_bucket_acl(Bucket=name, ACL="log-delivery-write")
+    s3.put_bucket_logging(
+        Bucket=name,
+        BucketLoggingStatus={"LoggingEnabled": {"TargetBucket": name, "TargetPrefix": "logs/"}},
+    )
+
+
+@mock_aws
+def test_deep_audit_routes_to_bucket_region_and_flags_controls():
+    """Each bucket is audited in its own region; unset controls become issues."""
+    _make_compliant_bucket("audited-eu-bucket", "eu-west-1")
+    boto3.client("s3", region_name="us-east-1").create_bucket(Bucket="bare-us-bucket")
+
+    results = {
+        r["bucket_name"]: r for r in list_s3_buckets.iter_bucket_audits(list_s3_buckets.get_s3_buckets(), 4)
+    }
+
+    compliant = results["audited-eu-bucket"]
+    assert compliant["region"] == "eu-west-1"
+    assert compliant["default_encryption"] == "aws:kms"
+    assert compliant["public_access_block"] == "All blocked"
+    assert compliant["versioning"] == "Enabled"
+    assert compliant["issues"] == ""
+
+    bare = results["bare-us-bucket"]
+    assert bare["region"] == "us-east-1"
+    assert bare["versioning"] == "Disabled"
+    assert bare["access_logging"] == "Disabled"
+    assert "Versioning not enabled" in bare["issues"]
+
+
+@mock_aws
+def test_deep_mode_exit_code_and_report():
+    boto3.client("s3", region_name="us-east-1").create_bucket(Bucket="unversioned-bucket")
+
+    with pytest.raises(SystemExit) as exc:
+        list_s3_buckets.main(["--deep"])
+    assert exc.value.code == 2
+
+    rows = list(load_workbook("s3_bucket_audit_report.xlsx").active.values)
+    assert rows[0][: len(list_s3_buckets.DEEP_REPORT_COLUMNS)] == tuple(list_s3_buckets.DEEP_REPORT_COLUMNS)
+    assert rows[1][0] == "unversioned-bucket"
+    assert rows[1][-1] == 1  # total_buckets_found
+    assert not os.path.exists("s3_buckets_report.xlsx")  # --deep writes only the audit report
+
+
+@mock_aws
+def test_bucket_list_is_written_when_an_account_fails(monkeypatch):
+    """A failed account exits 1, but the bucket list of the other accounts is still written."""
+    boto3.client("s3", region_name="us-east-1").create_bucket(Bucket="listed-bucket")
+
+    def collect(fn, account_errors):
+        account_errors["222222222222"] = "AccessDenied"
+        return fn()
+
+    monkeypatch.setattr(list_s3_buckets.multi_account, "collect", collect)
+    with pytest.raises(SystemExit) as exc:
+        list_s3_buckets.main([])
+    assert exc.value.code == 1
+    assert list(load_workbook("s3_buckets_report.xlsx").active.values)[1][0] == "listed-bucket"
+
+
+@mock_aws
+def test_deep_mode_exit_code_when_bucket_listing_fails(monkeypatch):
+    """A denied or throttled ListBuckets must exit 1, never report "0 buckets, compliant"."""
+    def denied(*args, **kwargs):
+        raise ClientError({"Error": {"Code": "AccessDenied", "Message": "denied"}}, "ListBuckets")
+
+    monkeypatch.setattr(list_s3_buckets, "get_client", lambda *args, **kwargs: SimpleNamespace(get_paginator=denied))
+    with pytest.raises(SystemExit) as exc:
+        list_s3_buckets.main(["--deep"])
+    assert exc.value.code == 1
+
+
+@mock_aws
+def test_deep_mode_exit_code_when_a_bucket_audit_cannot_connect(monkeypatch):
+    """A bucket audit that cannot reach S3 fails the run instead of leaving a shorter "compliant" report."""
+    boto3.client("s3", region_name="us-east-1").create_bucket(Bucket="unreachable-bucket")
+
+    def unreachable(bucket):
+        raise EndpointConnectionError(endpoint_url="https://s3.us-east-1.amazonaws.com")
+
+    monkeypatch.setattr(list_s3_buckets, "audit_bucket", unreachable)
+    with pytest.raises(SystemExit) as exc:
+        list_s3_buckets.main(["--deep"])
+    assert exc.value.code == 1
@@ -0,0 +1,81 @@
+"""Multi-account scanning against moto's STS/IAM/EC2 mocks (moto keeps one backend per account)."""
+import sys
+
+import boto3
+import pytest
+from moto import mock_aws
+from openpyxl import load_workbook
+
+sys.path.append("scripts")
+
+import aws_clients  # noqa: E402  pylint: disable=import-error
+import multi_account  # noqa: E402  pylint: disable=import-error
+import scripts.ec2_compliance_check as ec2_check  # noqa: E402  pylint: disable=import-error
+import scripts.fafo_checker as fafo  # noqa: E402  pylint: disable=import-error
+
+ACCOUNTS = ["111111111111", "222222222222"]
+
+
+def _account_session(account_id):
+    credentials = boto3.client("sts", region_name="us-east-1").assume_role(
+        RoleArn=f"arn:aws:iam::{account_id}:role/{multi_account.DEFAULT_ROLE}", RoleSessionName="setup"
+    )["Credentials"]
+    return boto3.session.Session(
+        aws_access_key_id=credentials["AccessKeyId"],
+        aws_secret_access_key=credentials["SecretAccessKey"],
+        aws_session_token=credentials["SessionToken"],
+        region_name="us-east-1",
+    )
+
+
+@mock_aws
+def test_each_account_is_scanned_with_its_assumed_role():
+    for account_id in ACCOUNTS:
+        _account_session(account_id).client("iam").create_user(UserName=f"user-{account_id[:3]}")
+
+    with pytest.raises(SystemExit) as exc:
+        fafo.main(["--accounts", *ACCOUNTS])
+    assert exc.value.code == 2
+
+    rows = list(load_workbook("iam_users_without_mfa.xlsx").active.values)
+    assert rows[0][:2] == ("account_id", "user_name")
+    assert sorted(row[:2] for row in rows[1:]) == [
+        ("111111111111", "user-111"),
+        ("222222222222", "user-222"),
+    ]
+
+
+@mock_aws
+def test_assumed_sessions_are_cached_and_accounts_merge_into_one_report():
+    image_id = boto3.client("ec2", region_name="us-east-1").describe_images()["Images"][0]["ImageId"]
+    _account_session(ACCOUNTS[1]).client("ec2").run_instances(ImageId=image_id, MinCount=1, MaxCount=1)
+    multi_account.configure(ACCOUNTS)
+
+    rows = multi_account.collect(lambda: [{"account": aws_clients.get_account_id()}])
+
+    assert rows == [{"account_id": a, "account": a} for a in ACCOUNTS]
+    session = aws_clients.assume_role_session(ACCOUNTS[0], multi_account.DEFAULT_ROLE)
+    assert aws_clients.assume_role_session(ACCOUNTS[0], multi_account.DEFAULT_ROLE) is session
+
+    def instances():
+        reservations = aws_clients.get_client("ec2").describe_instances()["Reservations"]
+        return [instance for r in reservations for instance in r["Instances"]]
+
+    assert [row["account_id"] for row in multi_account.collect(instances)] == [ACCOUNTS[1]]
+
+
+@mock_aws
+def test_failed_regions_are_recorded_per_account(monkeypatch):
+    def failing_scan(ec2_region, region, non_compliant, filters=None):
+        if region == "eu-west-1":
+            raise RuntimeError("denied")
+
+    monkeypatch.setattr(ec2_check, "_scan_region", failing_scan)
+    multi_account.configure(ACCOUNTS)
+    region_errors = {}
+    multi_account.collect(lambda: ec2_check.check_ec2_compliance(region_errors=region_errors))
+
+    assert region_errors == {(account_id, "eu-west-1"): "denied" for account_id in ACCOUNTS}
+    assert multi_account.describe_failures(region_errors, {"333333333333": "AccessDenied"}) == [
+        "111111111111/eu-west-1", "222222222222/eu-west-1", "account 333333333333",
+    ]
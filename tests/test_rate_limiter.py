@@ -0,0 +1,111 @@
+"""Unit tests for the throttle-aware API scheduler."""
+import sys
+
+import pytest
+from botocore.exceptions import ClientError, EndpointConnectionError, ReadTimeoutError
+
+sys.path.append("scripts")
+
+import aws_clients  # noqa: E402  pylint: disable=import-error
+import rate_limiter  # noqa: E402  pylint: disable=import-error
+
+
+def _error(code):
+    return ClientError({"Error": {"Code": code, "Message": code}}, "ListMFADevices")
+
+
+def _scripted(outcomes):
+    """Return a callable that raises or returns each outcome in turn."""
+    def call():
+        outcome = outcomes.pop(0)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+    return call
+
+
+@pytest.fixture(autouse=True)
+def fast_backoff(monkeypatch):
+    monkeypatch.setattr(rate_limiter, "BACKOFF_BASE", 0.001)
+    rate_limiter.reset()
+    yield
+    rate_limiter.reset()
+
+
+def test_throttled_call_is_retried_and_shrinks_concurrency():
+    limiter = rate_limiter.AdaptiveLimiter("iam/global", rate=1000, max_concurrency=8)
+    start_concurrency = limiter.concurrency
+    outcomes = [_error("Throttling"), _error("Throttling"), {"ok": True}]
+
+    result = limiter.call(_scripted(outcomes))
+
+    assert result == {"ok": True}
+    stats = limiter.metrics()
+    assert (stats["calls"], stats["throttles"], stats["retries"]) == (3, 2, 2)
+    assert limiter.concurrency < start_concurrency
+
+
+def test_non_throttle_errors_are_not_retried():
+    limiter = rate_limiter.AdaptiveLimiter("iam/global", rate=1000, max_concurrency=8)
+
+    def denied():
+        raise _error("AccessDenied")
+
+    with pytest.raises(ClientError):
+        limiter.call(denied)
+    assert limiter.metrics()["calls"] == 1
+
+
+def test_persistent_throttling_eventually_raises():
+    limiter = rate_limiter.AdaptiveLimiter("iam/global", rate=1000, max_concurrency=8, max_retries=2)
+
+    def throttled():
+        raise _error("ThrottlingException")
+
+    with pytest.raises(ClientError):
+        limiter.call(throttled)
+    assert limiter.metrics()["throttles"] == 3
+
+
+def test_clean_calls_grow_concurrency_up_to_the_cap():
+    limiter = rate_limiter.AdaptiveLimiter("ec2/us-east-1", rate=10000, max_concurrency=4)
+    for _ in range(50):
+        limiter.call(lambda: {"ResponseMetadata": {"RetryAttempts": 0}})
+    assert limiter.concurrency == 4
+
+
+def test_scheduled_calls_are_retried_by_the_scheduler_only():
+    """rate_limiter.call uses a twin client without botocore retries; stored responses are not congestion."""
+    client = aws_clients.get_client("iam")
+    twin = aws_clients.scheduled_client(client)
+    assert twin is not client and twin.meta.config.retries["total_max_attempts"] == 1
+    assert aws_clients.scheduled_client(twin) is twin
+
+    limiter = rate_limiter.AdaptiveLimiter("iam/global", rate=1000, max_concurrency=8)
+    start_concurrency = limiter.concurrency
+    server_error = ClientError(
+        {"Error": {"Code": "InternalError"}, "ResponseMetadata": {"HTTPStatusCode": 500}}, "GetUser"
+    )
+    outcomes = [server_error, rate_limiter.without_retry_attempts({"ResponseMetadata": {"RetryAttempts": 3}})]
+    assert limiter.call(_scripted(outcomes)) == {"ResponseMetadata": {"RetryAttempts": 0}}
+    assert limiter.concurrency == start_concurrency
+
+
+def test_connection_errors_are_retried_by_the_scheduler():
+    """Scheduled clients make one attempt, so the scheduler retries network failures botocore would have."""
+    limiter = rate_limiter.AdaptiveLimiter("ec2/us-east-1", rate=1000, max_concurrency=8)
+    start_concurrency = limiter.concurrency
+    outcomes = [
+        EndpointConnectionError(endpoint_url="https://ec2.us-east-1.amazonaws.com"),
+        ReadTimeoutError(endpoint_url="https://ec2.us-east-1.amazonaws.com"),
+        {"ok": True},
+    ]
+
+    assert limiter.call(_scripted(outcomes)) == {"ok": True}
+    assert limiter.metrics()["retries"] == 2
+    assert limiter.concurrency == start_concurrency
+
+    limiter = rate_limiter.AdaptiveLimiter("ec2/us-east-1", rate=1000, max_concurrency=8, max_retries=1)
+    with pytest.raises(EndpointConnectionError):
+        limiter.call(_scripted([EndpointConnectionError(endpoint_url="https://ec2") for _ in range(2)]))
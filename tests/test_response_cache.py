@@ -0,0 +1,87 @@
+"""Unit tests for the on-disk AWS response cache."""
+import argparse
+import sys
+
+import boto3
+import pytest
+from moto import mock_aws
+
+sys.path.append("scripts")
+
+import aws_clients  # noqa: E402  pylint: disable=import-error
+import cli_options  # noqa: E402  pylint: disable=import-error
+import response_cache  # noqa: E402  pylint: disable=import-error
+
+
+@pytest.fixture
+def cache(tmp_path):
+    yield response_cache.enable(cache_dir=str(tmp_path / "cache"))
+    response_cache.disable()
+
+
+def _count_calls(client):
+    calls = []
+    client.meta.events.register("before-send", lambda **kwargs: calls.append(1))
+    return calls
+
+
+@mock_aws
+def test_cached_operation_is_served_from_disk(cache):
+    boto3.client("iam", region_name="us-east-1").create_user(UserName="judy")
+    iam = aws_clients.get_client("iam")
+    sent = _count_calls(iam)
+
+    first = iam.list_users()["Users"]
+    second = iam.list_users()["Users"]
+
+    assert [u["UserName"] for u in second] == [u["UserName"] for u in first] == ["judy"]
+    assert len(sent) == 1
+    assert (cache.stats["hits"], cache.stats["misses"]) == (1, 1)
+
+
+@mock_aws
+def test_uncached_operations_always_hit_the_api(cache):
+    boto3.client("iam", region_name="us-east-1").create_user(UserName="judy")
+    iam = aws_clients.get_client("iam")
+    sent = _count_calls(iam)
+
+    iam.list_mfa_devices(UserName="judy")
+    iam.list_mfa_devices(UserName="judy")
+    assert len(sent) == 2
+
+
+def test_ttl_expiry_and_lru_eviction(tmp_path, monkeypatch):
+    cache = response_cache.ResponseCache(str(tmp_path), max_bytes=400)
+    cache.put(("k1",), {"payload": "x" * 150})
+    assert cache.get(("k1",), ttl=60) == {"payload": "x" * 150}
+
+    clock = [response_cache.time.time() + 120]
+    monkeypatch.setattr(response_cache.time, "time", lambda: clock[0])
+    assert cache.get(("k1",), ttl=60) is None
+
+    cache.put(("k2",), {"payload": "y" * 150})
+    cache.put(("k3",), {"payload": "z" * 150})
+    assert cache.stats["evictions"] >= 1
+    assert cache.get(("k3",), ttl=60) is not None
+
+
+def test_refresh_bypasses_existing_entries(tmp_path):
+    cache = response_cache.ResponseCache(str(tmp_path), refresh=True)
+    cache.put(("k",), {"value": 1})
+    assert cache.get(("k",), ttl=60) is None
+    assert cache.stats["bypassed"] == 1
+
+
+@pytest.mark.parametrize("value", ["iam.ListUsers", "iam.ListUsers=soon", "=300", "iam.ListUsers=-1"])
+def test_malformed_cache_ttl_is_rejected_when_parsing(value):
+    parser = cli_options.add_common_options(argparse.ArgumentParser())
+    with pytest.raises(SystemExit):
+        parser.parse_args(["--cache", "--cache-ttl", value])
+
+
+def test_cache_ttl_overrides_are_parsed_and_forwarded():
+    args = cli_options.add_common_options(argparse.ArgumentParser()).parse_args(
+        ["--cache", "--cache-ttl", "iam.ListUsers=300"]
+    )
+    assert args.cache_ttl == [("iam.ListUsers", 300)]
+    assert cli_options.common_argv(args)[-2:] == ["--cache-ttl", "iam.ListUsers=300"]
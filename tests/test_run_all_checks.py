@@ -0,0 +1,57 @@
+"""Unit tests for the single-process check runner."""
+import json
+import sys
+
+import boto3
+import pytest
+from moto import mock_aws
+
+sys.path.append("scripts")
+
+import scripts.run_all_checks as runner  # noqa: E402  pylint: disable=import-error
+
+
+@pytest.mark.parametrize(
+    "codes, expected",
+    [([0, 0], 0), ([0, 1], 1), ([1, 2, 0], 2), ([], 0)],
+)
+def test_combine_exit_codes(codes, expected):
+    assert runner.combine_exit_codes(codes) == expected
+
+
+@mock_aws
+def test_runner_combines_exit_codes_and_writes_timings(tmp_path):
+    iam = boto3.client("iam", region_name="us-east-1")
+    iam.create_user(UserName="heidi")  # no MFA, no keys
+
+    with pytest.raises(SystemExit) as exc:
+        runner.main(["--checks", "iam_mfa", "iam_access_keys"])
+    assert exc.value.code == 2
+
+    summary = json.loads((tmp_path / runner.SUMMARY_FILE).read_text())
+    assert {c["check"]: c["exit_code"] for c in summary["checks"]} == {"iam_mfa": 2, "iam_access_keys": 0}
+    assert (tmp_path / "iam_users_without_mfa.xlsx").exists()
+    assert (tmp_path / "iam_unused_access_keys.xlsx").exists()
+
+
+def test_importing_checks_does_not_load_pandas():
+    """Gate-only runs rely on pandas/openpyxl being imported lazily."""
+    import subprocess
+    from pathlib import Path
+
+    scripts_dir = Path(__file__).resolve().parent.parent / "scripts"
+    code = (
+        "import sys; sys.path.insert(0, sys.argv[1]); import run_all_checks; "
+        "loaded = {'pandas', 'openpyxl'} & set(sys.modules); assert not loaded, loaded"
+    )
+    subprocess.run([sys.executable, "-c", code, str(scripts_dir)], check=True)
+
+
+@mock_aws
+def test_no_report_mode_skips_report_files(tmp_path):
+    boto3.client("iam", region_name="us-east-1").create_user(UserName="ivan")
+
+    with pytest.raises(SystemExit) as exc:
+        runner.main(["--checks", "iam_mfa", "--no-report"])
+    assert exc.value.code == 2
+    assert not list(tmp_path.glob("*.xlsx"))
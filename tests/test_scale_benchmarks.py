@@ -0,0 +1,272 @@
+"""Scale benchmarks: every check against a large synthetic inventory, held to recorded budgets.
+
+Each benchmark seeds moto (or, for GuardDuty findings and Config compliance,
+which moto does not implement, a fake client) with an inventory sized by
+`GRC_BENCH_SCALE` (default 1), runs the check and measures:
+
+- AWS API calls per operation ("service.Operation"), counted on botocore's
+  `before-call` event (fakes count their own calls);
+- peak Python memory (tracemalloc) and wall time.
+
+The numbers are compared with `scale_budgets.json`. API call counts are
+deterministic and must not grow (that is how N+1 regressions show up); peak
+memory gets a small headroom over a typical run. Wall time is recorded
+(`measured_seconds`) for comparison between runs but not asserted: under moto
+it depends on the machine far more than on the checks. Run with
+`GRC_BENCH_RECORD=1` to re-record the budgets after an intentional change, and
+commit the file with the change.
+
+Rate limits are raised for the benchmarks: they measure the checks' own work,
+not the pacing tuned for real AWS accounts.
+"""
+import json
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from pathlib import Path
+from types import SimpleNamespace
+
+import boto3
+import pytest
+from moto import mock_aws
+
+sys.path.append("scripts")
+
+import aws_clients  # noqa: E402  pylint: disable=import-error
+import rate_limiter  # noqa: E402  pylint: disable=import-error
+import scripts.config_noncompliant_rules as config_rules  # noqa: E402  pylint: disable=import-error
+import scripts.ec2_compliance_check as ec2_check  # noqa: E402  pylint: disable=import-error
+import scripts.fafo_checker as fafo  # noqa: E402  pylint: disable=import-error
+import scripts.guardduty_findings_summary as gd_summary  # noqa: E402  pylint: disable=import-error
+import scripts.list_s3_buckets as list_s3_buckets  # noqa: E402  pylint: disable=import-error
+import scripts.unused_iam_access_keys as unused_keys  # noqa: E402  pylint: disable=import-error
+
+SCALE = int(os.environ.get("GRC_BENCH_SCALE", "1"))
+RECORD = os.environ.get("GRC_BENCH_RECORD") == "1"
+BUDGET_FILE = Path(__file__).with_name("scale_budgets.json")
+# Peak memory budget when recording: measured * MEMORY_HEADROOM + MEMORY_SLACK_MB
+MEMORY_HEADROOM = 1.2
+MEMORY_SLACK_MB = 1.0
+
+AMI_ID = "ami-12c6146b"  # moto's default Amazon Linux image
+EC2_REGIONS = ["us-east-1", "eu-west-1"]
+_budget_lock = threading.Lock()
+
+
+class ApiCallCounter:
+    """Counts every API call made by clients created from the default session."""
+
+    def __init__(self):
+        self.calls = Counter()
+        self._lock = threading.Lock()
+        aws_clients.get_session().events.register("before-call", self._count)
+
+    def _count(self, event_name, **kwargs):
+        _, service, operation = event_name.split(".", 2)
+        with self._lock:
+            self.calls[f"{service}.{operation}"] += 1
+
+
+@pytest.fixture
+def bench(monkeypatch):
+    """Unthrottled limiters plus an API call counter for the check under test."""
+    for service in rate_limiter.SERVICE_LIMITS:
+        monkeypatch.setitem(rate_limiter.SERVICE_LIMITS, service, (100000.0, 64))
+    rate_limiter.reset()
+    list_s3_buckets._bucket_regions.clear()
+    yield ApiCallCounter()
+    rate_limiter.reset()
+
+
+def measure(name, counter, check, argv, expected_exit):
+    """Run `check` and compare its API calls and peak memory with the recorded budget."""
+    tracemalloc.start()
+    start = time.perf_counter()
+    exit_code = check.run(check.parse_args(argv))
+    seconds = time.perf_counter() - start
+    peak_mb = tracemalloc.get_traced_memory()[1] / 2**20
+    tracemalloc.stop()
+    assert exit_code == expected_exit
+
+    measured = {"seconds": seconds, "peak_mb": peak_mb, "api_calls": dict(sorted(counter.calls.items()))}
+    with _budget_lock:
+        budgets = json.loads(BUDGET_FILE.read_text()) if BUDGET_FILE.exists() else {}
+        if RECORD:
+            budgets.setdefault(str(SCALE), {})[name] = {
+                "measured_seconds": round(seconds, 1),
+                "peak_mb": round(peak_mb * MEMORY_HEADROOM + MEMORY_SLACK_MB, 1),
+                "api_calls": measured["api_calls"],
+            }
+            BUDGET_FILE.write_text(json.dumps(budgets, indent=2, sort_keys=True) + "\n")
+            return
+    budget = budgets.get(str(SCALE), {}).get(name)
+    if budget is None:
+        pytest.skip(f"no recorded budget for {name} at scale {SCALE} (run with GRC_BENCH_RECORD=1)")
+
+    over = {
+        operation: f"{calls} > {budget['api_calls'].get(operation, 0)}"
+        for operation, calls in measured["api_calls"].items()
+        if calls > budget["api_calls"].get(operation, 0)
+    }
+    assert not over, f"{name}: API calls over budget: {over}"
+    assert peak_mb <= budget["peak_mb"], f"{name}: peak memory {peak_mb:.1f} MB > {budget['peak_mb']} MB"
+
+
+def seed_iam_users(count, with_mfa=False, with_keys=False):
+    iam = boto3.client("iam", region_name="us-east-1")
+    for i in range(count):
+        user = f"bench-user-{i:05d}"
+        iam.create_user(UserName=user)
+        if with_mfa and i % 2:
+            serial = iam.create_virtual_mfa_device(VirtualMFADeviceName=user)["VirtualMFADevice"]["SerialNumber"]
+            iam.enable_mfa_device(
+                UserName=user, SerialNumber=serial, AuthenticationCode1="123456", AuthenticationCode2="654321"
+            )
+        if with_keys:
+            iam.create_access_key(UserName=user)
+
+
+@mock_aws
+@pytest.mark.parametrize("argv", [[], ["--credential-report"]], ids=["per_user", "credential_report"])
+def test_iam_mfa_at_scale(bench, argv):
+    seed_iam_users(250 * SCALE, with_mfa=True)
+    measure(f"iam_mfa{'_report' if argv else ''}", bench, fafo, argv, expected_exit=2)
+
+
+@mock_aws
+@pytest.mark.parametrize("argv", [[], ["--credential-report"]], ids=["per_user", "credential_report"])
+def test_iam_access_keys_at_scale(bench, argv):
+    seed_iam_users(250 * SCALE, with_keys=True)
+    measure(f"iam_access_keys{'_report' if argv else ''}", bench, unused_keys, argv, expected_exit=2)
+
+
+@mock_aws
+def test_ec2_at_scale(bench):
+    for region in EC2_REGIONS:
+        boto3.client("ec2", region_name=region).run_instances(
+            ImageId=AMI_ID,
+            MinCount=30 * SCALE,
+            MaxCount=30 * SCALE,
+            BlockDeviceMappings=[{"DeviceName": "/dev/sdf", "Ebs": {"VolumeSize": 1}}],
+        )
+    measure("ec2", bench, ec2_check, [], expected_exit=2)
+
+
+@mock_aws
+def test_s3_deep_audit_at_scale(bench):
+    s3 = boto3.client("s3", region_name="us-east-1")
+    for i in range(100 * SCALE):
+        s3.create_bucket(Bucket=f"bench-bucket-{i:05d}")
+    measure("s3_deep", bench, list_s3_buckets, ["--deep", "--no-report"], expected_exit=2)
+
+
+class FakeGuardDuty:
+    """GuardDuty fake: one detector with `finding_count` recent findings, counting its calls."""
+
+    def __init__(self, finding_count, calls):
+        self.ids = [f"f-{i}" for i in range(finding_count)]
+        self.calls = calls
+
+    def get_paginator(self, operation):
+        if operation == "list_detectors":
+            pages = [{"DetectorIds": ["d-1"]}]
+        else:
+            pages = [{"FindingIds": self.ids[i:i + 50]} for i in range(0, len(self.ids), 50)]
+        calls, name = self.calls, "ListDetectors" if operation == "list_detectors" else "ListFindings"
+
+        class Paginator:
+            def paginate(self, **kwargs):
+                for page in pages:
+                    calls[f"guardduty.{name}"] += 1
+                    yield page
+
+        return Paginator()
+
+    def get_findings(self, DetectorId, FindingIds):
+        self.calls["guardduty.GetFindings"] += 1
+        return {
+            "Findings": [
+                {
+                    "Id": finding_id,
+                    "Arn": f"arn:aws:guardduty:us-east-1:123456789012:detector/d-1/finding/{finding_id}",
+                    "Region": "us-east-1",
+                    "Severity": 2.0 + int(finding_id[2:]) % 8,
+                    "UpdatedAt": "2024-01-01T00:00:00Z",
+                }
+                for finding_id in FindingIds
+            ]
+        }
+
+
+@mock_aws
+def test_guardduty_at_scale(bench, monkeypatch):
+    fake = FakeGuardDuty(1000 * SCALE, bench.calls)
+    real_get_client = gd_summary.get_client
+    monkeypatch.setattr(
+        gd_summary,
+        "get_client",
+        lambda service, *args, **kwargs: fake if service == "guardduty" else real_get_client(service, *args, **kwargs),
+    )
+    monkeypatch.setattr(gd_summary, "get_enabled_regions", lambda: ["us-east-1"])
+    measure("guardduty", bench, gd_summary, ["--no-report"], expected_exit=2)
+
+
+class FakeConfig:
+    """Config fake: `rule_count` non-compliant rules with `resources` resources each, counting its calls."""
+
+    meta = SimpleNamespace(service_model=SimpleNamespace(service_name="config"), region_name="us-east-1")
+
+    def __init__(self, rule_count, resources, calls):
+        self.rules = [f"rule-{i:04d}" for i in range(rule_count)]
+        self.resources = resources
+        self.calls = calls
+
+    def get_paginator(self, operation):
+        rules, calls = self.rules, self.calls
+        summaries = [
+            {
+                "ConfigRuleName": name,
+                "Compliance": {"ComplianceType": "NON_COMPLIANT", "NonCompliantResourceCount": {"CappedCount": 5}},
+            }
+            for name in rules
+        ]
+
+        class Paginator:
+            def paginate(self, **kwargs):
+                for start in range(0, len(summaries), 25):
+                    calls["config.DescribeComplianceByConfigRule"] += 1
+                    yield {"ComplianceByConfigRules": summaries[start:start + 25]}
+
+        return Paginator()
+
+    def get_compliance_details_by_config_rule(self, ConfigRuleName, ComplianceTypes, Limit, NextToken=None):
+        self.calls["config.GetComplianceDetailsByConfigRule"] += 1
+        start = int(NextToken or 0)
+        end = min(start + Limit, self.resources)
+        page = {
+            "EvaluationResults": [
+                {
+                    "EvaluationResultIdentifier": {
+                        "EvaluationResultQualifier": {
+                            "ConfigRuleName": ConfigRuleName,
+                            "ResourceType": "AWS::EC2::Instance",
+                            "ResourceId": f"i-{n:08d}",
+                        }
+                    },
+                    "ComplianceType": "NON_COMPLIANT",
+                }
+                for n in range(start, end)
+            ]
+        }
+        if end < self.resources:
+            page["NextToken"] = str(end)
+        return page
+
+
+def test_config_details_at_scale(bench, monkeypatch):
+    fake = FakeConfig(100 * SCALE, 120, bench.calls)
+    monkeypatch.setattr(config_rules, "get_client", lambda *args, **kwargs: fake)
+    measure("config_details", bench, config_rules, ["--details"], expected_exit=2)
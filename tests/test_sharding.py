@@ -0,0 +1,68 @@
+"""Unit tests for sharding and merge_shards: stable splits and merged reports equal to an unsharded run."""
+import csv
+import sys
+
+import boto3
+from moto import mock_aws
+
+sys.path.append("scripts")
+
+import scripts.fafo_checker as fafo_checker  # noqa: E402  pylint: disable=import-error
+import scripts.guardduty_findings_summary as guardduty  # noqa: E402  pylint: disable=import-error
+import scripts.merge_shards as merge_shards  # noqa: E402  pylint: disable=import-error
+import sharding  # noqa: E402  pylint: disable=import-error
+from records import SeverityCount  # noqa: E402  pylint: disable=import-error
+
+
+def test_shards_partition_names_and_regions():
+    """Every name and region should belong to exactly one of the N shards."""
+    names = [f"user-{i}" for i in range(200)]
+    regions = ["us-east-1", "eu-west-1", "ap-south-1", "us-west-2", "eu-central-1"]
+    owned, dealt = [], []
+    for index in (1, 2, 3):
+        sharding.configure(sharding.parse_shard(f"{index}/3"))
+        owned.append(sharding.select(names))
+        dealt.append(sharding.select_regions(regions))
+    assert sorted(sum(owned, [])) == sorted(names) and all(owned)
+    assert sorted(sum(dealt, [])) == sorted(regions) and [len(part) for part in dealt] == [2, 2, 1]
+
+
+def test_merge_adds_up_guardduty_severity_counts():
+    """Severity rows of several shards should add up per band, keeping the band order."""
+    rows = [SeverityCount("Low", 1), SeverityCount("High", 2), SeverityCount("High", 3), SeverityCount("Critical", 0)]
+    merged = guardduty.merge_severity_rows(rows)
+    assert [(row["severity"], row["count"]) for row in merged] == [
+        ("Low", 1), ("Medium", 0), ("High", 5), ("Critical", 0),
+    ]
+    assert guardduty.merge_severity_rows([SeverityCount("Low", 0)]) == []
+
+
+def _report_users(path):
+    with open(path, newline="") as fh:
+        return sorted(row["user_name"] for row in csv.DictReader(fh) if row["user_name"])
+
+
+@mock_aws
+def test_merged_shards_match_unsharded_report(tmp_path):
+    """Shards 1/2 and 2/2 merged should give the unsharded report and exit code; a missing shard fails."""
+    iam = boto3.client("iam", region_name="us-east-1")
+    for i in range(12):
+        iam.create_user(UserName=f"user-{i}")
+
+    assert fafo_checker.run(fafo_checker.parse_args(["--format", "csv"])) == 2
+    unsharded = _report_users(tmp_path / "iam_users_without_mfa.csv")
+    (tmp_path / "iam_users_without_mfa.csv").unlink()
+
+    for shard in ("1/2", "2/2"):
+        assert fafo_checker.run(fafo_checker.parse_args(["--shard", shard])) == 2
+    assert not (tmp_path / "iam_users_without_mfa.xlsx").exists()
+    shard_users = [
+        len(sharding.read_partials("iam_mfa", str(tmp_path / "shards"))[i]["tables"]["users"]) for i in (0, 1)
+    ]
+    assert sum(shard_users) == 12 and all(shard_users)
+
+    assert merge_shards.run(merge_shards.parse_args(["--format", "csv"])) == 2
+    assert _report_users(tmp_path / "iam_users_without_mfa.csv") == unsharded
+
+    (tmp_path / "shards" / "iam_mfa.shard-2-of-2.json").unlink()
+    assert merge_shards.run(merge_shards.parse_args(["--checks", "iam_mfa", "--no-report"])) == 1
@@ -0,0 +1,62 @@
+"""Unit tests for unused_iam_access_keys using moto to mock IAM."""
+import sys
+
+import boto3
+import pytest
+from moto import mock_aws
+
+sys.path.append("scripts")
+
+import scripts.unused_iam_access_keys as unused_keys  # noqa: E402  pylint: disable=import-error
+
+
+@mock_aws
+@pytest.mark.parametrize("use_credential_report", [False, True])
+def test_never_used_active_key_is_flagged(use_credential_report):
+    """An active key that was never used is reported; inactive keys are ignored."""
+    iam = boto3.client("iam", region_name="us-east-1")
+    iam.create_user(UserName="erin")
+    key_id = iam.create_access_key(UserName="erin")["AccessKey"]["AccessKeyId"]
+    iam.create_user(UserName="frank")
+    old_key = iam.create_access_key(UserName="frank")["AccessKey"]["AccessKeyId"]
+    iam.update_access_key(UserName="frank", AccessKeyId=old_key, Status="Inactive")
+
+    unused = unused_keys.list_unused_keys(use_credential_report=use_credential_report)
+    assert [(k["user_name"], k["access_key_id"]) for k in unused] == [("erin", key_id)]
+
+
+@mock_aws
+def test_exit_code_when_unused_key_exists():
+    iam = boto3.client("iam", region_name="us-east-1")
+    iam.create_user(UserName="grace")
+    iam.create_access_key(UserName="grace")
+
+    with pytest.raises(SystemExit) as exc:
+        unused_keys.main(["--credential-report"])
+    assert exc.value.code == 2
+
+
+@mock_aws
+def test_credential_report_mode_checks_users_newer_than_report(monkeypatch):
+    """Keys of a user created after the report was generated must still be checked."""
+    iam = boto3.client("iam", region_name="us-east-1")
+    stale_report = unused_keys.fetch_credential_report(iam)
+    iam.create_user(UserName="heidi")
+    key_id = iam.create_access_key(UserName="heidi")["AccessKey"]["AccessKeyId"]
+    monkeypatch.setattr(unused_keys, "fetch_credential_report", lambda client: stale_report)
+
+    unused = unused_keys.list_unused_keys(use_credential_report=True)
+    assert [(k["user_name"], k["access_key_id"]) for k in unused] == [("heidi", key_id)]
+
+
+@mock_aws
+def test_credential_report_mode_checks_keys_newer_than_report(monkeypatch):
+    """A key created after the report, by a user already in it, is examined as in per-user mode."""
+    iam = boto3.client("iam", region_name="us-east-1")
+    iam.create_user(UserName="ivan")
+    stale_report = unused_keys.fetch_credential_report(iam)
+    key_id = iam.create_access_key(UserName="ivan")["AccessKey"]["AccessKeyId"]
+    monkeypatch.setattr(unused_keys, "fetch_credential_report", lambda client: stale_report)
+
+    unused = unused_keys.list_unused_keys(use_credential_report=True)
+    assert [(k["user_name"], k["access_key_id"]) for k in unused] == [("ivan", key_id)]